@@ -0,0 +1,55 @@
+"""
+Shared API clients for the agents
+
+Clients are built lazily and cached per (api_key, base_url), so agent
+instances reuse one client instead of opening their own. Sync clients all
+share the pooled httpx client from config.http.
+"""
+from functools import lru_cache
+from config.http import get_http_client, http_client_kwargs
+
+
+@lru_cache(maxsize=None)
+def get_openai_sync(api_key: str, base_url: str):
+    """Shared OpenAI (or OpenAI-compatible) client"""
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, base_url=base_url, http_client=get_http_client())
+
+
+@lru_cache(maxsize=None)
+def get_anthropic_sync(api_key: str, base_url: str):
+    """Shared Anthropic client"""
+    from anthropic import Anthropic
+    return Anthropic(api_key=api_key, base_url=base_url, http_client=get_http_client())
+
+
+@lru_cache(maxsize=None)
+def get_openai_async(api_key: str, base_url: str):
+    """
+    Shared AsyncOpenAI client
+
+    Pooled async connections are bound to the event loop that opened them,
+    so only use this client from one long-lived loop. Code that calls
+    asyncio.run() repeatedly should create a scoped client instead.
+    """
+    import httpx
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=httpx.AsyncClient(**http_client_kwargs())
+    )
+
+
+@lru_cache(maxsize=None)
+def get_anthropic_async(api_key: str, base_url: str):
+    """
+    Shared AsyncAnthropic client (same event loop caveat as get_openai_async)
+    """
+    import httpx
+    from anthropic import AsyncAnthropic
+    return AsyncAnthropic(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=httpx.AsyncClient(**http_client_kwargs())
+    )
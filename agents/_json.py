@@ -0,0 +1,53 @@
+"""
+JSON helpers for prompt building and response parsing
+
+Serialization goes through utils.json_utils (orjson when installed).
+"""
+from typing import Any, Optional
+
+from utils import json_utils
+from utils.json_utils import loads  # noqa: F401  (re-exported for the agents)
+
+
+def dumps_compact(obj: Any) -> str:
+    """
+    Serialize obj as compact JSON (no whitespace), keeping non-ASCII characters
+    
+    Used for data embedded in prompts: indentation costs tokens and the
+    model reads compact JSON just as well.
+    """
+    return json_utils.dumps(obj).decode('utf-8')
+
+
+def extract_first_json_object(text: str, start: int = 0) -> Optional[str]:
+    """
+    Return the first balanced {...} object in text at or after start
+    
+    Single forward pass tracking brace depth; braces inside string
+    literals are ignored. Returns None if no object is closed.
+    """
+    start = text.find("{", start)
+    if start == -1:
+        return None
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
@@ -0,0 +1,72 @@
+"""
+Small on-disk cache for LLM responses, backed by sqlite3
+"""
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Dict, Optional
+from config import Settings
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = "llm_cache.sqlite3"
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+_stats = {"hits": 0, "misses": 0}
+
+
+def make_key(*parts: str) -> str:
+    """Build a cache key from the parts that determine an LLM response"""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _connect() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        Settings.CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        _conn = sqlite3.connect(str(Settings.CACHE_DIR / CACHE_FILE), check_same_thread=False)
+        _conn.execute("CREATE TABLE IF NOT EXISTS cache (k BLOB PRIMARY KEY, v BLOB)")
+        _conn.commit()
+    return _conn
+
+
+def get(key: str) -> Optional[str]:
+    """Return the cached value for key, or None on a miss (or if disabled)"""
+    if Settings.LLM_CACHE_DISABLE:
+        return None
+    try:
+        with _lock:
+            row = _connect().execute("SELECT v FROM cache WHERE k = ?", (key,)).fetchone()
+    except sqlite3.Error as e:
+        logger.warning(f"LLM cache lookup failed: {e}")
+        row = None
+
+    if row is None:
+        _stats["misses"] += 1
+        return None
+    _stats["hits"] += 1
+    return row[0]
+
+
+def put(key: str, value: str) -> None:
+    """Store value under key, replacing any previous entry"""
+    if Settings.LLM_CACHE_DISABLE:
+        return
+    try:
+        with _lock:
+            conn = _connect()
+            conn.execute("INSERT OR REPLACE INTO cache (k, v) VALUES (?, ?)", (key, value))
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.warning(f"LLM cache write failed: {e}")
+
+
+def stats() -> Dict[str, int]:
+    """Return hit/miss counters for this process"""
+    return dict(_stats)
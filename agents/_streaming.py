@@ -0,0 +1,82 @@
+"""
+Helpers for reading streamed LLM responses with early termination
+"""
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, Iterator, Optional
+
+from ._json import extract_first_json_object
+
+CODE_FENCE = "```"
+
+
+def code_block_closed(text: str) -> bool:
+    """True once text contains an opening and a closing ``` fence"""
+    return text.count(CODE_FENCE) >= 2
+
+
+def leading_code_block_closed(text: str) -> bool:
+    """True once a response that starts with a ``` fence has closed it"""
+    return text.lstrip().startswith(CODE_FENCE) and code_block_closed(text)
+
+
+def leading_json_object(text: str) -> Optional[str]:
+    """
+    Return the JSON object a response starts with once its closing brace
+    has arrived (an opening ``` fence before it is skipped), else None
+    """
+    text = text.lstrip()
+    if text.startswith(CODE_FENCE):
+        text = text.partition("\n")[2].lstrip()
+    if not text.startswith("{"):
+        return None
+    return extract_first_json_object(text)
+
+
+def iter_openai_text(stream) -> Iterator[str]:
+    """Yield the text deltas of an OpenAI chat completion stream"""
+    for chunk in stream:
+        if chunk.choices:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+
+async def aiter_openai_text(stream) -> AsyncIterator[str]:
+    """Yield the text deltas of an async OpenAI chat completion stream"""
+    async for chunk in stream:
+        if chunk.choices:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+
+def read_text(deltas: Iterable[str], stop: Optional[Callable[[str], bool]] = None,
+              trigger: str = "`") -> str:
+    """
+    Join streamed text deltas, returning as soon as stop(text) is true
+
+    stop is only evaluated after a delta containing the trigger character,
+    so the buffer is not re-joined for every chunk. The caller is
+    responsible for closing the underlying stream (use it as a context
+    manager) when this returns early.
+    """
+    parts = []
+    for delta in deltas:
+        parts.append(delta)
+        if stop is not None and trigger in delta:
+            text = "".join(parts)
+            if stop(text):
+                return text
+    return "".join(parts)
+
+
+async def aread_text(deltas: AsyncIterable[str], stop: Optional[Callable[[str], bool]] = None,
+                     trigger: str = "`") -> str:
+    """Async counterpart of read_text"""
+    parts = []
+    async for delta in deltas:
+        parts.append(delta)
+        if stop is not None and trigger in delta:
+            text = "".join(parts)
+            if stop(text):
+                return text
+    return "".join(parts)
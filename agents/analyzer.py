@@ -1,95 +1,92 @@
+import asyncio
 import json
 import logging
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+from openai import AsyncOpenAI
 from config import Settings
+from ._clients import get_openai_sync, get_openai_async
+from ._streaming import aiter_openai_text, aread_text, iter_openai_text, leading_code_block_closed, read_text
 
 logger = logging.getLogger(__name__)
 
+# Try to import tiktoken for exact token counts, fallback to an estimate
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+    logger.info("tiktoken package not available, estimating token counts from text length")
 
-class AnalyzerAgent:
-    """
-    Analysis agent that uses AI to analyze HTML structure
-    and identify content patterns
+JSON_FENCE = "```json"
+
+
+def _extract_fenced_json(text: str, opener: str = "{") -> Optional[str]:
     """
+    Return the JSON inside the first ```json fenced block, or None
     
-    def __init__(self):
-        # Use OpenAI client for custom endpoints (OpenAI-compatible API)
-        # If using official Anthropic API, can switch to Anthropic client
-        self.client = OpenAI(
-            api_key=Settings.ANTHROPIC_API_KEY,
-            base_url=Settings.ANTHROPIC_BASE_URL
-        )
-        self.model = Settings.ANTHROPIC_MODEL
-    
-    def analyze_html_structure(self, html_content: str, file_path: str) -> Dict[str, Any]:
-        """
-        Analyze HTML structure and identify content sections
-        """
-        prompt = self._build_analysis_prompt(html_content, file_path)
-        
-        try:
-            # Use OpenAI-compatible API format
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3
-            )
-            
-            # Handle response - should be a ChatCompletion object
-            if hasattr(response, 'choices') and len(response.choices) > 0:
-                result_text = response.choices[0].message.content
-            else:
-                logger.error(f"Unexpected response format: {type(response)}")
-                return {"error": f"Unexpected response format: {type(response)}"}
-            
-            # Try to extract JSON from the response
-            try:
-                return json.loads(result_text)
-            except json.JSONDecodeError:
-                # Try to extract JSON from markdown code blocks
-                import re
-                json_match = re.search(r'```json\s*(\{.*?\})\s*```', result_text, re.DOTALL)
-                if json_match:
-                    return json.loads(json_match.group(1))
-                
-                # Return structured result
-                return {
-                    "file": file_path,
-                    "analysis": result_text,
-                    "raw_response": True
-                }
-        except Exception as e:
-            logger.error(f"Error analyzing {file_path}: {e}")
-            return {
-                "file": file_path,
-                "error": str(e)
-            }
+    The body must start with opener ("{" for an object, "[" for an array).
+    Linear str.find scan instead of a DOTALL regex over the whole response.
+    """
+    i = text.find(JSON_FENCE)
+    if i < 0:
+        return None
+    start = i + len(JSON_FENCE)
+    j = text.find("```", start)
+    if j < 0:
+        return None
+    body = text[start:j].strip()
+    return body if body.startswith(opener) else None
+
+
+# Token budget for the HTML in an analysis prompt: the model context minus
+# the instructions and the room reserved for the response
+PROMPT_OVERHEAD_TOKENS = 2000
+MAX_HTML_TOKENS = (
+    Settings.ANALYZER_CONTEXT_TOKENS
+    - PROMPT_OVERHEAD_TOKENS
+    - Settings.ANALYZER_MAX_OUTPUT_TOKENS
+)
+TRUNCATION_MARKER = "\n... [truncated]"
+
+# Characters per token assumed for HTML when tiktoken is not installed
+# (markup-heavy text tokenizes denser than prose)
+CHARS_PER_TOKEN_ESTIMATE = 3
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Non-OpenAI model names: use the most recent general-purpose encoding
+        return tiktoken.get_encoding("o200k_base")
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str) -> Tuple[str, int, bool]:
+    """
+    Truncate text to at most max_tokens tokens
     
-    def analyze_multiple_files(self, html_contents: List[Dict[str, str]]) -> List[Dict[str, Any]]:
-        """
-        Analyze multiple HTML files and return combined results
-        """
-        results = []
-        for item in html_contents:
-            result = self.analyze_html_structure(item['content'], item['path'])
-            results.append(result)
-        return results
+    Returns:
+        (text, token count of the returned text, whether it was truncated)
+    """
+    if not TIKTOKEN_AVAILABLE:
+        max_chars = max_tokens * CHARS_PER_TOKEN_ESTIMATE
+        if len(text) > max_chars:
+            return text[:max_chars], max_tokens, True
+        return text, -(-len(text) // CHARS_PER_TOKEN_ESTIMATE), False
     
-    def _build_analysis_prompt(self, html_content: str, file_path: str) -> str:
-        # Truncate HTML if too long
-        max_length = 500000
-        if len(html_content) > max_length:
-            html_content = html_content[:max_length] + "\n... [truncated]"
-        
-        return f"""Analyze the following HTML file structure and identify key content sections.
+    enc = _get_encoding(model)
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) > max_tokens:
+        return enc.decode(tokens[:max_tokens]), max_tokens, True
+    return text, len(tokens), False
 
-File: {file_path}
+# Stable key so the provider routes analysis calls to the same prefix cache
+PROMPT_CACHE_KEY = "analyzer-v1"
 
-HTML Content:
-{html_content}
+ANALYSIS_INSTRUCTIONS = """Analyze the HTML file given at the end of this message (after the "=== DYNAMIC CONTENT ===" marker) and identify key content sections.
 
 Please analyze this HTML and identify:
 1. Main content sections (title, body, comments, metadata, etc.)
@@ -105,25 +102,291 @@ For each section, provide:
 - Any distinguishing attributes or patterns
 
 Return your analysis as JSON in this format:
-{{
-    "file": "{file_path}",
+{
+    "file": "the file path given below",
     "sections": [
-        {{
+        {
             "name": "section_name",
             "type": "title|body|comment|metadata|other",
             "xpath": "xpath_expression",
             "description": "What this section represents",
             "is_list": false,
             "list_xpath": "xpath_for_list_items (if applicable)",
-            "attributes": {{"class": "...", "id": "..."}},
+            "attributes": {"class": "...", "id": "..."},
             "content_sample": "sample text from this section"
-        }}
+        }
     ],
-    "patterns": {{
+    "patterns": {
         "common_classes": [...],
         "common_ids": [...],
         "structural_patterns": [...]
-    }},
+    },
     "notes": "Any additional observations"
-}}"""
+}"""
+
+ANALYSIS_PROMPT_HEADER = ANALYSIS_INSTRUCTIONS + "\n\n=== DYNAMIC CONTENT ===\n"
+
+# Several small files packed into one request share the same instructions
+PACKED_ANALYSIS_PROMPT_HEADER = ANALYSIS_INSTRUCTIONS + """
+
+Several HTML files are given below instead of one, each introduced by a
+"--- FILE i: path ---" line. Analyze each file independently and return a
+JSON list with one object in the format above per file, in the same order
+as the files, with "file" set to that file's path.
 
+=== DYNAMIC CONTENT ===
+"""
+
+# Default token budget for the HTML of one packed request
+PACKED_MAX_TOKENS = 100000
+
+
+class AnalyzerAgent:
+    """
+    Analysis agent that uses AI to analyze HTML structure
+    and identify content patterns
+    """
+    
+    def __init__(self):
+        # Use OpenAI client for custom endpoints (OpenAI-compatible API)
+        # If using official Anthropic API, can switch to Anthropic client
+        # Clients are shared across agent instances (one connection pool)
+        self.client = get_openai_sync(Settings.ANTHROPIC_API_KEY, Settings.ANTHROPIC_BASE_URL)
+        # Async client used to analyze several files concurrently
+        self.aclient = get_openai_async(Settings.ANTHROPIC_API_KEY, Settings.ANTHROPIC_BASE_URL)
+        self.model = Settings.ANTHROPIC_MODEL
+    
+    def analyze_html_structure(self, html_content: str, file_path: str) -> Dict[str, Any]:
+        """
+        Analyze HTML structure and identify content sections
+        """
+        prompt = self._build_analysis_prompt(html_content, file_path)
+        
+        try:
+            result_text = self._complete(prompt)
+            return self._parse_analysis_response(result_text, file_path)
+        except Exception as e:
+            logger.error(f"Error analyzing {file_path}: {e}")
+            return {
+                "file": file_path,
+                "error": str(e)
+            }
+    
+    def analyze_batch_packed(self, items: List[Dict[str, str]],
+                             max_tokens: int = PACKED_MAX_TOKENS) -> List[Dict[str, Any]]:
+        """
+        Analyze many small HTML files with fewer requests
+        
+        Files are greedily packed, in order, into prompts of up to max_tokens
+        tokens of HTML (never more than one analysis prompt holds); each
+        packed request returns a JSON list with one analysis per file. Files
+        that do not fit a pack on their own, and packs whose response cannot
+        be split, are analyzed one by one. Packs are sent concurrently, at
+        most Settings.MAX_CONCURRENCY at a time.
+        
+        Args:
+            items: List of dicts with 'content' and 'path'
+            max_tokens: Token budget for the HTML of one request
+            
+        Returns:
+            List of analysis results, in the same order as items
+        """
+        max_tokens = min(max_tokens, MAX_HTML_TOKENS)
+        packs: List[List[int]] = []
+        pack: List[int] = []
+        pack_tokens = 0
+        
+        for i, item in enumerate(items):
+            _, token_count, too_large = truncate_to_tokens(item['content'], max_tokens, self.model)
+            if too_large:
+                packs.append([i])
+                continue
+            if pack and pack_tokens + token_count > max_tokens:
+                packs.append(pack)
+                pack, pack_tokens = [], 0
+            pack.append(i)
+            pack_tokens += token_count
+        if pack:
+            packs.append(pack)
+        
+        logger.info(f"Packed {len(items)} files into {len(packs)} analysis requests")
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        max_workers = max(1, min(Settings.MAX_CONCURRENCY or 8, len(packs)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pack_results = executor.map(lambda pack: self._analyze_pack_or_files([items[i] for i in pack]), packs)
+            for pack, packed_results in zip(packs, pack_results):
+                for i, result in zip(pack, packed_results):
+                    results[i] = result
+        
+        return results
+    
+    def _analyze_pack_or_files(self, pack: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """
+        Analyze a pack with one request, or file by file if that fails
+        """
+        packed_results = self._analyze_pack(pack) if len(pack) > 1 else None
+        if packed_results is None:
+            packed_results = [
+                self.analyze_html_structure(item['content'], item['path'])
+                for item in pack
+            ]
+        return packed_results
+    
+    def _analyze_pack(self, pack: List[Dict[str, str]]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Analyze several files in one request; None if the response cannot be split
+        """
+        parts = [PACKED_ANALYSIS_PROMPT_HEADER]
+        for n, item in enumerate(pack, 1):
+            parts.append(f"--- FILE {n}: {item['path']} ---\n")
+            parts.append(item['content'])
+            parts.append("\n")
+        
+        try:
+            result_text = self._complete("".join(parts))
+        except Exception as e:
+            logger.warning(f"Packed analysis of {len(pack)} files failed: {e}")
+            return None
+        
+        try:
+            analyses = json.loads(result_text)
+        except json.JSONDecodeError:
+            fenced_json = _extract_fenced_json(result_text, opener="[")
+            try:
+                analyses = json.loads(fenced_json) if fenced_json else None
+            except json.JSONDecodeError:
+                analyses = None
+        
+        if (not isinstance(analyses, list) or len(analyses) != len(pack)
+                or not all(isinstance(a, dict) for a in analyses)):
+            logger.warning(f"Could not split packed analysis of {len(pack)} files, analyzing them one by one")
+            return None
+        return analyses
+    
+    def _complete(self, prompt: str) -> str:
+        """
+        Send one analysis prompt and return the response text
+        """
+        # Use OpenAI-compatible API format; stream the response and stop
+        # reading once a fenced JSON block has been closed
+        with self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.3,
+            extra_body={"prompt_cache_key": PROMPT_CACHE_KEY},
+            stream=True
+        ) as stream:
+            return read_text(iter_openai_text(stream), stop=leading_code_block_closed)
+    
+    def analyze_multiple_files(self, html_contents: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """
+        Analyze multiple HTML files and return combined results
+        
+        Files are analyzed concurrently (bounded by Settings.MAX_CONCURRENCY).
+        When called from inside a running event loop, use
+        analyze_multiple_files_async instead; this sync shim then falls back
+        to analyzing the files one by one.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self._analyze_multiple_files_once(html_contents))
+        
+        logger.warning("Event loop already running, analyzing files sequentially")
+        return [
+            self.analyze_html_structure(item['content'], item['path'])
+            for item in html_contents
+        ]
+    
+    async def analyze_multiple_files_async(self, html_contents: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """
+        Analyze multiple HTML files concurrently, preserving input order
+        """
+        return await self._gather_analyses(self.aclient, html_contents)
+    
+    async def _analyze_multiple_files_once(self, html_contents: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        # asyncio.run() closes its loop on return, and pooled connections
+        # cannot be reused from another loop, so the sync shim uses a
+        # client scoped to this run instead of self.aclient
+        async with AsyncOpenAI(
+            api_key=Settings.ANTHROPIC_API_KEY,
+            base_url=Settings.ANTHROPIC_BASE_URL
+        ) as client:
+            return await self._gather_analyses(client, html_contents)
+    
+    async def _gather_analyses(self, client: AsyncOpenAI, html_contents: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        sem = asyncio.Semaphore(Settings.MAX_CONCURRENCY or 8)
+        return await asyncio.gather(
+            *[self._analyze_one(client, sem, item) for item in html_contents]
+        )
+    
+    async def _analyze_one(self, client: AsyncOpenAI, sem: asyncio.Semaphore,
+                           item: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Async counterpart of analyze_html_structure for a single file
+        """
+        file_path = item['path']
+        prompt = self._build_analysis_prompt(item['content'], file_path)
+        
+        try:
+            async with sem:
+                stream = await client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.3,
+                    extra_body={"prompt_cache_key": PROMPT_CACHE_KEY},
+                    stream=True
+                )
+                async with stream:
+                    result_text = await aread_text(aiter_openai_text(stream), stop=leading_code_block_closed)
+            
+            return self._parse_analysis_response(result_text, file_path)
+        except Exception as e:
+            logger.error(f"Error analyzing {file_path}: {e}")
+            return {
+                "file": file_path,
+                "error": str(e)
+            }
+    
+    def _parse_analysis_response(self, result_text: str, file_path: str) -> Dict[str, Any]:
+        """
+        Extract the JSON analysis from a model response
+        """
+        try:
+            return json.loads(result_text)
+        except json.JSONDecodeError:
+            # Try to extract JSON from markdown code blocks
+            fenced_json = _extract_fenced_json(result_text)
+            if fenced_json:
+                return json.loads(fenced_json)
+            
+            # Return structured result
+            return {
+                "file": file_path,
+                "analysis": result_text,
+                "raw_response": True
+            }
+    
+    def _build_analysis_prompt(self, html_content: str, file_path: str) -> str:
+        # Truncate HTML to the token budget. The HTML is copied into the
+        # prompt by a single join, and not sliced at all when it fits.
+        body, token_count, truncated = truncate_to_tokens(html_content, MAX_HTML_TOKENS, self.model)
+        marker = TRUNCATION_MARKER if truncated else ""
+        if truncated:
+            logger.warning(f"HTML for {file_path} truncated to {token_count} tokens")
+        else:
+            logger.info(f"HTML for {file_path}: {token_count} tokens")
+        
+        # Static instructions go first so repeated calls share a cacheable
+        # prefix; per-file content is appended after the marker
+        return "".join((
+            ANALYSIS_PROMPT_HEADER,
+            f"File: {file_path}\n\nHTML Content:\n",
+            body,
+            marker,
+        ))
@@ -1,185 +1,113 @@
-import json
+import copy
+import hashlib
 import logging
-from typing import Dict, Any, Optional
+import pprint
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
 from config import Settings
+from utils import json_utils
+from . import _llm_cache
+from ._clients import get_anthropic_sync, get_openai_sync
+from ._streaming import code_block_closed, iter_openai_text, read_text
 
 logger = logging.getLogger(__name__)
 
+# API errors from either SDK (HTTP status errors, connection errors and timeouts);
+# only the transient ones are retried, see _is_retryable
+API_ERRORS = ()
+
 # Try to import Anthropic, fallback to OpenAI
 try:
-    from anthropic import Anthropic
+    import anthropic
     ANTHROPIC_AVAILABLE = True
+    API_ERRORS += (anthropic.APIStatusError, anthropic.APIConnectionError)
 except ImportError:
     ANTHROPIC_AVAILABLE = False
     logger.warning("Anthropic package not available, falling back to OpenAI")
 
 try:
-    from openai import OpenAI
+    import openai
     OPENAI_AVAILABLE = True
+    API_ERRORS += (openai.APIStatusError, openai.APIConnectionError)
 except ImportError:
     OPENAI_AVAILABLE = False
     logger.warning("OpenAI package not available")
 
+# Retry policy for code generation calls: full-jitter exponential backoff
+RETRY_MAX_ATTEMPTS = 5
+RETRY_MIN_WAIT = 1   # seconds
+RETRY_MAX_WAIT = 30  # seconds
+# HTTP statuses worth retrying (timeout, conflict, rate limit), besides 5xx;
+# other 4xx errors (bad key, oversized prompt, ...) fail immediately
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429})
 
-class CodeGeneratorAgent:
-    """
-    Code generator agent that creates extraction code based on JSON schema
-    Supports both Anthropic and OpenAI APIs
+
+def _is_retryable(error: Exception) -> bool:
+    """True for connection errors, timeouts and transient HTTP status errors"""
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        # APIConnectionError (and its APITimeoutError subclass) has no status
+        return True
+    return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+
+
+def _retry_delay(attempt: int) -> float:
+    """Random delay in [RETRY_MIN_WAIT, min(RETRY_MAX_WAIT, 2**attempt)] seconds"""
+    return max(RETRY_MIN_WAIT, random.uniform(0, min(RETRY_MAX_WAIT, 2 ** attempt)))
+
+
+def _dumps_sorted(obj: Any, indent: bool = False) -> str:
+    """Serialize obj as JSON with sorted keys (canonical form for prompts and cache keys)"""
+    return json_utils.dumps(obj, indent=indent, sort_keys=True).decode('utf-8')
+
+
+def _extract_fenced_code(text: str) -> Optional[str]:
     """
+    Return the contents of the first ``` fenced block, or None
     
-    def __init__(self):
-        # Determine which API to use based on configuration
-        # Use Anthropic if base_url is set and not the default OpenAI endpoint
-        # Check if it's a custom Anthropic endpoint (like opensphereai)
-        base_url_lower = (Settings.ANTHROPIC_BASE_URL or "").lower()
-        use_anthropic = (
-            ANTHROPIC_AVAILABLE and 
-            Settings.ANTHROPIC_BASE_URL and 
-            (base_url_lower != 'https://api.anthropic.com' and
-             ('opensphereai' in base_url_lower or
-              'anthropic' in base_url_lower or
-              not base_url_lower.startswith('http://35.220.164.252')))  # Not the OpenAI endpoint
-        )
-        
-        if use_anthropic and ANTHROPIC_AVAILABLE:
-            self.client_type = 'anthropic'
-            self.client = Anthropic(
-                api_key=Settings.ANTHROPIC_API_KEY,
-                base_url=Settings.ANTHROPIC_BASE_URL
-            )
-            self.model = Settings.ANTHROPIC_MODEL
-            logger.info(f"Using Anthropic API for code generation: {Settings.ANTHROPIC_BASE_URL}")
-        elif OPENAI_AVAILABLE:
-            self.client_type = 'openai'
-            self.client = OpenAI(
-                api_key=Settings.OPENAI_API_KEY,
-                base_url=Settings.OPENAI_BASE_URL
-            )
-            self.model = Settings.OPENAI_MODEL
-            logger.info(f"Using OpenAI API for code generation: {Settings.OPENAI_BASE_URL}")
-        else:
-            raise ImportError("Neither Anthropic nor OpenAI packages are available")
-    
-    def generate_extraction_code(self, json_schema: Dict[str, Any], language: str = 'python') -> str:
-        """
-        Generate extraction code based on JSON schema
-        """
-        # Check schema size and optimize if needed
-        schema_str = json.dumps(json_schema, indent=2, ensure_ascii=False)
-        schema_size = len(schema_str)
-        
-        # If schema is too large, use a simplified version
-        # Increased threshold to support larger schemas (100KB)
-        SCHEMA_SIZE_THRESHOLD = 100000  # ~100KB
-        if schema_size > SCHEMA_SIZE_THRESHOLD:
-            logger.warning(f"Schema is very large ({schema_size} chars), using simplified version for prompt")
-            json_schema = self._simplify_schema(json_schema)
-        else:
-            logger.info(f"Schema size: {schema_size} chars (within limit of {SCHEMA_SIZE_THRESHOLD})")
-        
-        prompt = self._build_code_generation_prompt(json_schema, language)
-        prompt_size = len(prompt)
-        logger.info(f"Code generation prompt size: {prompt_size} chars")
-        
-        # Retry logic for API calls
-        max_retries = 3
-        retry_delay = 2  # seconds
-        
-        for attempt in range(max_retries):
-            try:
-                # Use Anthropic API if configured, otherwise OpenAI
-                if self.client_type == 'anthropic':
-                    # Anthropic API with thinking support (as per user's template)
-                    response = self.client.messages.create(
-                        model=self.model,
-                        max_tokens=16000,
-                        thinking={
-                            "type": "enabled",
-                            "budget_tokens": 10000
-                        },
-                        system=self._get_system_prompt(),
-                        messages=[{
-                            "role": "user",
-                            "content": prompt
-                        }]
-                    )
-                    
-                    # Extract text from Anthropic response
-                    # Response contains blocks (thinking and text)
-                    code = ""
-                    for block in response.content:
-                        if block.type == "thinking":
-                            logger.debug(f"Thinking summary: {block.thinking}")
-                        elif block.type == "text":
-                            code = block.text
-                    
-                    if not code:
-                        logger.error("No text content found in Anthropic response")
-                        return f"# Error: No text content in response"
-                        
-                else:
-                    # OpenAI API
-                    response = self.client.chat.completions.create(
-                        model=self.model,
-                        messages=[
-                            {"role": "system", "content": self._get_system_prompt()},
-                            {"role": "user", "content": prompt}
-                        ],
-                        temperature=0.2,
-                        max_tokens=16000,  # Increased limit for longer code generation
-                        timeout=300  # 5 minutes timeout for large schemas
-                    )
-                    
-                    # Handle OpenAI response
-                    if hasattr(response, 'choices') and len(response.choices) > 0:
-                        code = response.choices[0].message.content
-                    else:
-                        logger.error(f"Unexpected response format: {type(response)}")
-                        return f"# Error: Unexpected response format: {type(response)}"
-                
-                # Extract code from markdown if present
-                import re
-                code_match = re.search(r'```(?:python|python3)?\s*(.*?)```', code, re.DOTALL)
-                if code_match:
-                    return code_match.group(1).strip()
-                
-                return code.strip()
-                
-            except Exception as e:
-                error_msg = str(e)
-                # Check if it's a 502 or timeout error
-                if "502" in error_msg or "Bad Gateway" in error_msg:
-                    logger.warning(f"502 Bad Gateway error (attempt {attempt + 1}/{max_retries}). This may be due to:")
-                    logger.warning(f"  - Server overload or timeout")
-                    logger.warning(f"  - Request too large (prompt size: {prompt_size} chars)")
-                    logger.warning(f"  - Network issues")
-                
-                if attempt < max_retries - 1:
-                    logger.warning(f"Attempt {attempt + 1}/{max_retries} failed: {e}. Retrying in {retry_delay} seconds...")
-                    import time
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
-                else:
-                    logger.error(f"Failed to generate extraction code after {max_retries} attempts: {e}")
-                    logger.info("Using fallback code generator...")
-                    # Return a basic template code as fallback
-                    return self._generate_fallback_code(json_schema)
-    
-    def _get_system_prompt(self) -> str:
-        return """You are an expert code generator specializing in HTML content extraction.
+    A language tag on the opening fence line (```python, ```python3, ...)
+    is skipped. Linear str.find scan instead of a DOTALL regex.
+    """
+    i = text.find("```")
+    if i < 0:
+        return None
+    start = i + 3
+    line_end = text.find("\n", start)
+    if line_end >= 0:
+        tag = text[start:line_end].strip()
+        if not tag or tag.isidentifier():
+            start = line_end + 1
+    j = text.find("```", start)
+    if j < 0:
+        return None
+    return text[start:j]
+
+
+# Anthropic extended thinking budget for code generation, scaled by schema size
+THINKING_MIN_SECTIONS = 2  # at or below this, thinking is skipped
+THINKING_TOKENS_PER_SECTION = 256
+THINKING_MIN_BUDGET = 1024  # API minimum
+THINKING_MAX_BUDGET = 10000
+
+# Free-text schema fields that do not change the generated extraction logic.
+# Schemas re-synthesized for the same page template usually differ only here.
+SCHEMA_PROSE_KEYS = frozenset({"description", "notes", "extraction_notes"})
+
+# Stable key so the provider routes code generation calls to the same prefix cache
+PROMPT_CACHE_KEY = "codegen-v1"
+
+# Number of built prompts kept per agent instance
+PROMPT_CACHE_SIZE = 128
+
+# Static system prompt (role + interface specification). It must stay
+# byte-identical across calls so provider-side prompt caching can reuse it.
+CODEGEN_SYSTEM_PROMPT = """You are an expert code generator specializing in HTML content extraction.
 You MUST generate code that STRICTLY follows the required interface specification.
 DO NOT create custom method names or return types - follow the specification EXACTLY.
-The code must be production-ready, robust, and handle edge cases."""
-    
-    def _build_code_generation_prompt(self, json_schema: Dict[str, Any], language: str) -> str:
-        schema_json = json.dumps(json_schema, indent=2, ensure_ascii=False)
-        
-        # Count sections for logging
-        sections_count = len(json_schema.get('sections', []))
-        
-        return f"""Generate {language} code to extract content from HTML files based on the following JSON schema:
-
-{schema_json}
+The code must be production-ready, robust, and handle edge cases.
 
 CRITICAL INTERFACE REQUIREMENTS (MUST BE STRICTLY FOLLOWED):
 ===========================================================
@@ -205,7 +133,11 @@ CRITICAL INTERFACE REQUIREMENTS (MUST BE STRICTLY FOLLOWED):
 
 3. IMPLEMENTATION REQUIREMENTS:
    - Use lxml (etree) for HTML parsing (preferred) or BeautifulSoup
+   - If you use BeautifulSoup, ALWAYS use the 'lxml' parser: BeautifulSoup(html_content, 'lxml'), never 'html.parser'
    - Implement robust XPath-based extraction
+   - The same HTMLExtractor instance is reused to extract many HTML files:
+     do schema-dependent setup once in __init__ (walk the schema, build etree.XPath objects and
+     re.compile patterns there) and only apply them in extract()
    - Handle missing elements gracefully (return None for single values, [] for lists)
    - Include comprehensive error handling (try-except blocks)
    - Add clear comments explaining extraction logic
@@ -213,10 +145,10 @@ CRITICAL INTERFACE REQUIREMENTS (MUST BE STRICTLY FOLLOWED):
    - Use pathlib.Path or os.path.join() for cross-platform path handling
    - When html_content is provided, use it directly
    - When file_path is provided, read the file and parse it
-   - Extract all {sections_count} sections defined in the schema
+   - Extract all sections defined in the schema
 
 4. SCHEMA CONSTANT (OPTIONAL BUT RECOMMENDED):
-   - MAY define SCHEMA constant at module level: SCHEMA: Dict[str, Any] = {{...}}
+   - MAY define SCHEMA constant at module level: SCHEMA: Dict[str, Any] = {...}
    - If defined, should match the schema structure passed to __init__
 
 5. FORBIDDEN:
@@ -240,53 +172,352 @@ class HTMLExtractor:
     def extract(self, html_content: Optional[str] = None, file_path: Optional[str] = None) -> Dict[str, Any]:
         # Implementation here
         # Must return Dict[str, Any] with section names as keys
-        result = {{}}
+        result = {}
         for section in self.sections:
             section_name = section.get("name")
             # ... extract content ...
             result[section_name] = extracted_value
         return result
 ```
+"""
+
+# Static start of the code generation user prompt (formatted per language)
+CODEGEN_PROMPT_PREFIX = """Generate {language} code to extract content from HTML files based on the JSON schema below.
+Follow the CRITICAL INTERFACE REQUIREMENTS from the system prompt EXACTLY.
+Generate the complete code following this EXACT interface specification.
 
-Generate the complete code following this EXACT interface specification."""
+=== DYNAMIC CONTENT ===
+"""
+
+
+class CodeGeneratorAgent:
+    """
+    Code generator agent that creates extraction code based on JSON schema
+    Supports both Anthropic and OpenAI APIs
+    """
+    
+    def __init__(self):
+        # Determine which API to use based on configuration
+        # Use Anthropic if base_url is set and not the default OpenAI endpoint
+        # Check if it's a custom Anthropic endpoint (like opensphereai)
+        base_url_lower = (Settings.ANTHROPIC_BASE_URL or "").lower()
+        use_anthropic = (
+            ANTHROPIC_AVAILABLE and 
+            Settings.ANTHROPIC_BASE_URL and 
+            (base_url_lower != 'https://api.anthropic.com' and
+             ('opensphereai' in base_url_lower or
+              'anthropic' in base_url_lower or
+              not base_url_lower.startswith('http://35.220.164.252')))  # Not the OpenAI endpoint
+        )
+        
+        if use_anthropic and ANTHROPIC_AVAILABLE:
+            self.client_type = 'anthropic'
+            self.client = get_anthropic_sync(Settings.ANTHROPIC_API_KEY, Settings.ANTHROPIC_BASE_URL)
+            self.model = Settings.ANTHROPIC_MODEL
+            self._call = self._call_anthropic
+            logger.info(f"Using Anthropic API for code generation: {Settings.ANTHROPIC_BASE_URL}")
+        elif OPENAI_AVAILABLE:
+            self.client_type = 'openai'
+            self.client = get_openai_sync(Settings.OPENAI_API_KEY, Settings.OPENAI_BASE_URL)
+            self.model = Settings.OPENAI_MODEL
+            self._call = self._call_openai
+            logger.info(f"Using OpenAI API for code generation: {Settings.OPENAI_BASE_URL}")
+        else:
+            raise ImportError("Neither Anthropic nor OpenAI packages are available")
+        
+        # Static part of the user prompt for the default language, built once
+        self._codegen_static_prefix = CODEGEN_PROMPT_PREFIX.format(language='python')
+        
+        # True when the last generate_extraction_code call returned fallback template code
+        self.used_fallback = False
+        # Built prompts by (schema hash, language), least recently used first
+        self._prompt_cache: "OrderedDict[Tuple[str, str], Tuple[Dict[str, Any], str]]" = OrderedDict()
+        self._prompt_cache_lock = threading.Lock()
+    
+    def generate_extraction_code(self, json_schema: Dict[str, Any], language: str = 'python') -> str:
+        """
+        Generate extraction code based on JSON schema
+        
+        Results are cached on disk: an exact match on the canonical schema is
+        tried first, then a structural match that ignores descriptive text.
+        If the API call fails, fallback template code is returned and
+        used_fallback is set.
+        """
+        self.used_fallback = False
+        # Compact canonical dump, shared by the cache keys and the prompt size check
+        canonical = _dumps_sorted(json_schema)
+        exact_key, structure_key = self._cache_keys(json_schema, language, canonical)
+        cached = _llm_cache.get(exact_key) or _llm_cache.get(structure_key)
+        if cached is not None:
+            logger.info(f"Using cached extraction code (cache stats: {_llm_cache.stats()})")
+            return cached
+        
+        json_schema, prompt = self._prepare_prompt(json_schema, language, canonical)
+        sections_count = len(json_schema.get('sections', []))
+        
+        try:
+            code = self._call_llm_with_retry(prompt, sections_count)
+        except Exception as e:
+            logger.error(f"Failed to generate extraction code: {e}")
+            logger.info("Using fallback code generator...")
+            # Return a basic template code as fallback
+            self.used_fallback = True
+            return self._generate_fallback_code(json_schema)
+        
+        if not code:
+            return "# Error: No text content in response"
+        
+        code = self._extract_code(code)
+        if code:
+            _llm_cache.put(exact_key, code)
+            _llm_cache.put(structure_key, code)
+        return code
+    
+    def _prepare_prompt(self, json_schema: Dict[str, Any], language: str, canonical: str):
+        """
+        Build the code generation prompt, simplifying oversized schemas
+        
+        Prompts are memoized per (schema content hash, language), so retries
+        and repeated runs over the same schema skip serialization.
+        
+        Args:
+            json_schema: JSON schema
+            language: Target language
+            canonical: Compact canonical dump of json_schema (_dumps_sorted)
+        
+        Returns:
+            (schema used for the prompt, prompt)
+        """
+        raw = canonical.encode('utf-8')
+        key = (hashlib.blake2b(raw, digest_size=16).hexdigest(), language)
+        # Cached schemas are private copies: callers may modify what they get
+        # back, and the schema passed in may be the caller's own dict
+        with self._prompt_cache_lock:
+            entry = self._prompt_cache.get(key)
+            if entry is not None:
+                self._prompt_cache.move_to_end(key)
+        if entry is not None:
+            prompt_schema, prompt = entry
+            return copy.deepcopy(prompt_schema), prompt
+        
+        prompt_schema, prompt = self._prepare_prompt_uncached(json_schema, language, len(raw))
+        with self._prompt_cache_lock:
+            self._prompt_cache[key] = (copy.deepcopy(prompt_schema), prompt)
+            self._prompt_cache.move_to_end(key)
+            if len(self._prompt_cache) > PROMPT_CACHE_SIZE:
+                self._prompt_cache.popitem(last=False)
+        return prompt_schema, prompt
+    
+    def _prepare_prompt_uncached(self, json_schema: Dict[str, Any], language: str, schema_size: int):
+        """Body of _prepare_prompt; schema_size is the compact canonical dump's byte count"""
+        # If schema is too large, use a simplified version. The size is the
+        # compact JSON byte count, the prompt itself is serialized only once.
+        # Increased threshold to support larger schemas (100KB)
+        SCHEMA_SIZE_THRESHOLD = 100000  # ~100KB
+        if schema_size > SCHEMA_SIZE_THRESHOLD:
+            logger.warning(f"Schema is very large ({schema_size} bytes), using simplified version for prompt")
+            json_schema = self._simplify_schema(json_schema)
+        else:
+            logger.info(f"Schema size: {schema_size} bytes (within limit of {SCHEMA_SIZE_THRESHOLD})")
+        
+        prompt = self._build_code_generation_prompt(json_schema, language)
+        logger.info(f"Code generation prompt size: {len(prompt)} chars")
+        return json_schema, prompt
+    
+    def _extract_code(self, text: str) -> str:
+        """
+        Extract code from a markdown code block if present
+        """
+        fenced_code = _extract_fenced_code(text)
+        if fenced_code is not None:
+            text = fenced_code
+        return text.strip()
+    
+    def _call_llm_with_retry(self, prompt: str, sections_count: int) -> Optional[str]:
+        """
+        Call the API, retrying transient API errors with jittered exponential backoff
+        
+        Non-transient errors (e.g. 400/401/403/404/422) are raised at once.
+        """
+        for attempt in range(1, RETRY_MAX_ATTEMPTS + 1):
+            try:
+                return self._call(prompt, sections_count)
+            except API_ERRORS as e:
+                if not _is_retryable(e):
+                    logger.error(f"API call failed with a non-retryable error: {e}")
+                    raise
+                
+                error_msg = str(e)
+                # Check if it's a 502 or timeout error
+                if "502" in error_msg or "Bad Gateway" in error_msg:
+                    logger.warning(f"502 Bad Gateway error (attempt {attempt}/{RETRY_MAX_ATTEMPTS}). This may be due to:")
+                    logger.warning(f"  - Server overload or timeout")
+                    logger.warning(f"  - Request too large (prompt size: {len(prompt)} chars)")
+                    logger.warning(f"  - Network issues")
+                
+                if attempt == RETRY_MAX_ATTEMPTS:
+                    logger.error(f"API call failed after {RETRY_MAX_ATTEMPTS} attempts: {e}")
+                    raise
+                
+                delay = _retry_delay(attempt)
+                logger.warning(f"Attempt {attempt}/{RETRY_MAX_ATTEMPTS} failed: {e}. Retrying in {delay:.1f} seconds...")
+                time.sleep(delay)
+    
+    def _call_anthropic(self, prompt: str, sections_count: int) -> Optional[str]:
+        """
+        Send the code generation prompt once to Anthropic and return the raw response text
+        
+        The response is streamed and reading stops as soon as the closing
+        code fence arrives instead of waiting for trailing commentary.
+        """
+        with self.client.messages.stream(**self._anthropic_params(prompt, sections_count)) as stream:
+            code = read_text(stream.text_stream, stop=code_block_closed)
+        if not code:
+            logger.error("No text content found in Anthropic response")
+        return code
+    
+    def _call_openai(self, prompt: str, sections_count: int) -> Optional[str]:
+        """
+        Send the code generation prompt once to OpenAI and return the raw response text
+        
+        Streams like _call_anthropic; sections_count is unused (no thinking budget).
+        """
+        with self.client.chat.completions.create(
+            **self._openai_params(prompt),
+            timeout=300,  # 5 minutes timeout for large schemas
+            extra_body={"prompt_cache_key": PROMPT_CACHE_KEY},
+            stream=True
+        ) as stream:
+            return read_text(iter_openai_text(stream), stop=code_block_closed)
+    
+    def _anthropic_params(self, prompt: str, sections_count: int) -> Dict[str, Any]:
+        """
+        Request parameters for an Anthropic code generation call
+        
+        The thinking budget scales with the number of schema sections
+        (THINKING_TOKENS_PER_SECTION each, between THINKING_MIN_BUDGET and
+        THINKING_MAX_BUDGET); thinking is skipped for tiny schemas.
+        """
+        params = {
+            "model": self.model,
+            "max_tokens": 16000,
+            "system": [{
+                "type": "text",
+                "text": self._get_system_prompt(),
+                "cache_control": {"type": "ephemeral"}
+            }],
+            "messages": [{
+                "role": "user",
+                "content": prompt
+            }]
+        }
+        
+        if sections_count <= THINKING_MIN_SECTIONS:
+            logger.info(f"Schema has {sections_count} sections, thinking disabled")
+        else:
+            budget = max(THINKING_MIN_BUDGET, min(THINKING_MAX_BUDGET, sections_count * THINKING_TOKENS_PER_SECTION))
+            logger.info(f"Thinking budget: {budget} tokens for {sections_count} sections")
+            params["thinking"] = {
+                "type": "enabled",
+                "budget_tokens": budget
+            }
+        return params
+    
+    def _openai_params(self, prompt: str) -> Dict[str, Any]:
+        """
+        Request parameters for an OpenAI code generation call
+        """
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": self._get_system_prompt()},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.2,
+            "max_tokens": 16000  # Increased limit for longer code generation
+        }
+    
+    def _cache_keys(self, json_schema: Dict[str, Any], language: str, canonical: str):
+        """
+        Return (exact_key, structure_key) for the code generation cache
+        
+        canonical is the compact canonical dump of json_schema (_dumps_sorted).
+        """
+        def strip_prose(value):
+            if isinstance(value, dict):
+                return {k: strip_prose(v) for k, v in value.items() if k not in SCHEMA_PROSE_KEYS}
+            if isinstance(value, list):
+                return [strip_prose(v) for v in value]
+            return value
+        
+        structure = _dumps_sorted(strip_prose(json_schema))
+        prefix = ("codegen", self.client_type, self.model, language, CODEGEN_SYSTEM_PROMPT)
+        return (
+            _llm_cache.make_key(*prefix, canonical),
+            _llm_cache.make_key(*prefix, "structure", structure),
+        )
+    
+    def _get_system_prompt(self) -> str:
+        return CODEGEN_SYSTEM_PROMPT
+    
+    def _build_code_generation_prompt(self, json_schema: Dict[str, Any], language: str) -> str:
+        """
+        Build the user prompt, serializing the schema (indented) once
+        
+        Args:
+            json_schema: JSON schema (already simplified if oversized)
+            language: Target language
+        """
+        # The interface specification lives in the (static) system prompt and
+        # the user prompt starts with a precomputed static prefix; everything
+        # per-schema is strictly a suffix so the prefix stays cacheable
+        if language == 'python':
+            prefix = self._codegen_static_prefix
+        else:
+            prefix = CODEGEN_PROMPT_PREFIX.format(language=language)
+        return (
+            f"{prefix}The schema defines {len(json_schema.get('sections', []))} sections; extract all of them.\n\n"
+            + _dumps_sorted(json_schema, indent=True)
+        )
     
     def _simplify_schema(self, json_schema: Dict[str, Any]) -> Dict[str, Any]:
         """
         Simplify schema to reduce prompt size while keeping essential information
         """
-        simplified = {
-            "schema_version": json_schema.get("schema_version", "1.0"),
-            "description": json_schema.get("description", ""),
-            "sections": []
-        }
+        sections = json_schema.get('sections', ())
+        simplified_sections = []
+        append = simplified_sections.append
         
-        sections = json_schema.get('sections', [])
-        # Keep only essential fields for each section
+        # Keep only essential fields for each section (one lookup per key)
         for section in sections:
+            get = section.get
+            xpath = get("xpath", "")
+            xpath_list = get("xpath_list")
             simplified_section = {
-                "name": section.get("name", ""),
-                "description": section.get("description", ""),
-                "xpath": section.get("xpath", ""),
-                "is_list": section.get("is_list", False)
+                "name": get("name", ""),
+                "description": get("description", ""),
+                "xpath": xpath,
+                "is_list": get("is_list", False)
             }
             # Only include xpath_list if it exists and is different from xpath
-            if "xpath_list" in section and section.get("xpath") != section.get("xpath_list", [None])[0]:
-                simplified_section["xpath_list"] = section["xpath_list"][:3]  # Limit to first 3
-        
-            simplified["sections"].append(simplified_section)
+            if xpath_list and xpath_list[0] != xpath:
+                simplified_section["xpath_list"] = xpath_list[:3]  # Limit to first 3
+            append(simplified_section)
         
         logger.info(f"Simplified schema from {len(sections)} sections, keeping essential fields only")
-        return simplified
+        return {
+            "schema_version": json_schema.get("schema_version", "1.0"),
+            "description": json_schema.get("description", ""),
+            "sections": simplified_sections
+        }
     
     def _generate_fallback_code(self, json_schema: Dict[str, Any]) -> str:
         """
         Generate a basic fallback code template when API fails
         """
-        # Convert JSON schema to Python-compatible format
-        # Replace JSON false/true with Python False/True
-        sections_json = json.dumps(json_schema.get('sections', []), indent=8, ensure_ascii=False)
-        # Replace JSON boolean values with Python boolean values
-        sections_json = sections_json.replace(': false', ': False').replace(': true', ': True')
+        # pformat emits a Python literal directly (True/False/None), so no
+        # JSON -> Python post-processing is needed
+        sections_repr = pprint.pformat(json_schema.get('sections', []), indent=4, width=100, sort_dicts=False)
         
         return f'''# HTML Content Extraction Code
 # Generated from schema (API generation failed, using fallback template)
@@ -315,7 +546,7 @@ def extract_content(html_content: str) -> Dict[str, Any]:
         result = {{}}
         
         # Extract sections from schema
-        sections = {sections_json}
+        sections = {sections_repr}
         
         for section in sections:
             name = section.get('name', '')
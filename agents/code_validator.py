@@ -2,29 +2,217 @@
 Code Validator Agent - Validates generated code for syntax errors and robustness
 """
 import ast
+import copy
+import hashlib
+import json
 import logging
 import re
-from typing import Dict, Any, List, Optional, Tuple
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, Any, List, Optional, Tuple, Callable
 from config import Settings
+from ._clients import get_anthropic_sync, get_openai_sync
+from ._streaming import iter_openai_text, read_text
 
 logger = logging.getLogger(__name__)
 
 # Try to import Anthropic, fallback to OpenAI
 try:
-    from anthropic import Anthropic
+    import anthropic
     ANTHROPIC_AVAILABLE = True
 except ImportError:
     ANTHROPIC_AVAILABLE = False
     logger.warning("Anthropic package not available, falling back to OpenAI")
 
 try:
-    from openai import OpenAI
+    import openai
     OPENAI_AVAILABLE = True
 except ImportError:
     OPENAI_AVAILABLE = False
     logger.warning("OpenAI package not available")
 
 
+# Number of validation results kept per agent instance
+VALIDATION_CACHE_SIZE = 256
+
+# Number of parsed ASTs kept (trees are much larger than the source)
+PARSE_CACHE_SIZE = 32
+
+# AI review output budget: sized from the code length, within these bounds
+REVIEW_MIN_OUTPUT_TOKENS = 2048
+REVIEW_MAX_OUTPUT_TOKENS = 16000
+# Thinking budget per reported problem when Settings.ENABLE_THINKING is set
+REVIEW_THINKING_TOKENS_PER_ISSUE = 2000
+
+# Fixed substrings consulted by _check_robustness
+_ROBUSTNESS_KEYWORDS = (
+    'def extract', 'try', 'except',
+    'xpath', 'XPath', 'find', 'findall',
+    'open(', 'read_file', 'Path(',
+    'lxml', 'etree', 'json', 'logging', 'logger',
+    'import lxml', 'from lxml', 'import json', 'from json', 'import logging', 'from logging',
+    ':\\', '.html',
+)
+
+# Precompiled patterns used by the static checks
+# A line (not starting with a comment or docstring quote) containing a
+# non-raw string literal with an unknown escape sequence
+_INVALID_ESCAPE_LINE = re.compile(
+    r'''^(?![^\S\n]*(?:#|"""|\'\'\'))[^\n]*?'''
+    r'''(?:[^r\n]"[^"\n]*\\[^\\"nrtbf\n]|[^r\n]'[^'\n]*\\[^\\'nrtbf\n])''',
+    re.MULTILINE
+)
+_JSON_BOOL = re.compile(r':\s*(true|false)\s*[,}]')
+_JSON_FALSE = re.compile(r':\s*false\s*([,}])')
+_JSON_TRUE = re.compile(r':\s*true\s*([,}])')
+_XPATH_PATTERNS = tuple(re.compile(p) for p in (
+    r'\.xpath\s*\(',
+    r'etree\.XPath\s*\(',
+    r'findall\s*\(',
+    r'find\s*\('
+))
+_NONE_CHECK = re.compile(r'\bif\s+.*\s+is\s+not\s+None\b|\bif\s+.*\s+is\s+None\b|\bif\s+.*\s+!=\s+None\b|\bif\s+.*\s+==\s+None\b')
+_EMPTY_CHECK = re.compile(r'len\s*\(\s*\w+\s*\)\s*==\s*0|len\s*\(\s*\w+\s*\)\s*>\s*0|\w+\s+if\s+\w+\s+else')
+_FILE_ERROR_HANDLING = re.compile(r'FileNotFoundError|IOError|OSError|except.*:')
+_HARDCODED_PATH_WIN = re.compile(r'[CD]:\\[^"]*')
+_HARDCODED_PATH_HTML = re.compile(r'/.*/[^"]*\.html')
+_RETURN_STATEMENT = re.compile(r'return\s+')
+_INPUT_VALIDATION = re.compile(r'if\s+.*\s+is\s+None|if\s+not\s+.*|assert\s+')
+
+# Precompiled patterns used to pull code out of AI review responses
+_CODE_BLOCK = re.compile(r'```(?:python3?|py)?[ \t]*\n(.*?)\n```', re.DOTALL)
+_MD_CODE_BLOCK = re.compile(r'```(?:python|python3)?\s*(.*?)```', re.DOTALL)
+_LEADING_FENCE = re.compile(r'^```+\s*', re.MULTILINE)
+_TRAILING_FENCE = re.compile(r'\s*```+$', re.MULTILINE)
+_CODE_AFTER_MARKER = re.compile(
+    r'(?:fixed code|corrected code|updated code|here.*?code)[:\n]+(.*?)(?:\n\n|\Z)',
+    re.DOTALL | re.IGNORECASE
+)
+# Any of the keywords that make extracted text look like Python code
+_PY_KEYWORD = re.compile(r'(?:def|import|class|from|if|return) ')
+_MD_PYTHON_FENCE = re.compile(r'```(?:python|python3)?\s*')
+_MD_FENCE = re.compile(r'```\s*')
+# Bullet lines ("- ..." / "* ...") of a review, stripped like str.strip()
+_BULLET_LINE = re.compile(r'^\s*([-*].*?)\s*$', re.MULTILINE)
+
+# Line-anchored fences of the fixed code block in a streamed review
+_OPEN_FENCE = re.compile(r'^```(?:python|python3)?[^\S\n]*\n', re.MULTILINE)
+_CLOSE_FENCE = re.compile(r'^```[^\S\n]*$', re.MULTILINE)
+
+
+def _review_code_block_closed(text: str) -> bool:
+    """True once the first fenced code block of a review response is closed"""
+    opening = _OPEN_FENCE.search(text)
+    return opening is not None and _CLOSE_FENCE.search(text, opening.end()) is not None
+
+
+# Instructions of the review prompt
+REVIEW_INSTRUCTIONS = """Please:
+1. Fix any syntax errors
+2. Address robustness issues (error handling, None checks, etc.)
+3. Fix interface compliance issues (function signatures, return types)
+4. Ensure code follows Python best practices
+5. Use proper path handling (pathlib.Path or raw strings)
+6. Replace any JSON boolean values (true/false) with Python booleans (True/False)
+7. Add proper error handling where needed
+
+CRITICAL INTERFACE REQUIREMENTS (MUST BE STRICTLY ENFORCED):
+- MUST define class named exactly 'HTMLExtractor' (case-sensitive)
+- HTMLExtractor.__init__() MUST have EXACT signature: __init__(self, schema: Dict[str, Any], logger: Optional[logging.Logger] = None) -> None
+- Parameter name MUST be exactly 'schema' (not json_schema, not extraction_schema)
+- MUST have method named exactly 'extract' (NOT extract_from_string, extract_from_file, extract_content, etc.)
+- extract() method MUST have EXACT signature: extract(self, html_content: Optional[str] = None, file_path: Optional[str] = None) -> Dict[str, Any]
+- Parameter names MUST be exactly 'html_content' and 'file_path' (no variations)
+- extract() method MUST return Dict[str, Any] (plain dictionary, NOT ExtractionResult, NOT dataclass, NOT list, NOT other types)
+- DO NOT create methods named extract_from_string, extract_from_file, extract_content, etc.
+- DO NOT return custom result types (ExtractionResult, dataclass, etc.)"""
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse(source: str) -> Tuple[Optional[ast.Module], Optional[SyntaxError]]:
+    """
+    Parse source once, returning (tree, None) or (None, SyntaxError)
+    
+    Cached by content, so the static checks and the review parsing share
+    one tokenize/parse of the same code (AI reviews often return the same
+    fixed code again). The returned tree is shared: treat it as read-only.
+    """
+    try:
+        # Same as ast.parse(source)
+        return compile(source, '<unknown>', 'exec', ast.PyCF_ONLY_AST), None
+    except SyntaxError as e:
+        # Drop the traceback so the cache does not keep frames alive
+        return None, e.with_traceback(None)
+
+
+def _syntax_error(source: str) -> Optional[str]:
+    """Return the SyntaxError message of source, or None if it parses"""
+    error = _parse(source)[1]
+    return None if error is None else str(error)
+
+
+def _count_matches(pattern: re.Pattern, text: str, limit: Optional[int] = None) -> int:
+    """
+    Count non-overlapping matches without materializing them (as findall
+    would); stop at limit when only a threshold matters
+    """
+    return sum(1 for _ in islice(pattern.finditer(text), limit))
+
+
+def _review_max_tokens(code: str) -> int:
+    """Output budget of a review: room for the fixed code plus a short summary"""
+    return min(len(code) * 4 // 3 + REVIEW_MIN_OUTPUT_TOKENS, REVIEW_MAX_OUTPUT_TOKENS)
+
+
+def _issue_count(validation_result: Dict[str, Any]) -> int:
+    """Number of problems reported by the static checks"""
+    return (len(validation_result.get("syntax_errors", [])) +
+            len(validation_result.get("robustness_issues", [])) +
+            len(validation_result.get("interface_issues", [])))
+
+
+# Return types extract() must not use
+FORBIDDEN_RETURN_TYPES = frozenset({'ExtractionResult', 'dataclass', 'List', 'Tuple'})
+
+
+def _return_type_name(node: Optional[ast.expr]) -> Optional[str]:
+    """
+    Outer type name of a return annotation, read from the AST
+    
+    'Dict' for Dict[str, Any], 'Dict' for typing.Dict, 'dict' for dict.
+    Optional[X], Union[X, None] and X | None resolve to X; string
+    annotations are parsed first. Returns None for anything else.
+    """
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        try:
+            node = ast.parse(node.value, mode='eval').body
+        except SyntaxError:
+            return None
+    
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    if isinstance(node, ast.Subscript):
+        name = _return_type_name(node.value)
+        if name == 'Optional':
+            return _return_type_name(node.slice)
+        if name == 'Union' and isinstance(node.slice, ast.Tuple):
+            members = [elt for elt in node.slice.elts
+                       if not (isinstance(elt, ast.Constant) and elt.value is None)]
+            return _return_type_name(members[0]) if len(members) == 1 else name
+        return name
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitOr):
+        # X | None
+        if isinstance(node.right, ast.Constant) and node.right.value is None:
+            return _return_type_name(node.left)
+        if isinstance(node.left, ast.Constant) and node.left.value is None:
+            return _return_type_name(node.right)
+    return None
+
+
 class CodeValidatorAgent:
     """
     Code validator agent that checks generated code for syntax errors,
@@ -45,27 +233,29 @@ class CodeValidatorAgent:
         
         if use_anthropic and ANTHROPIC_AVAILABLE:
             self.client_type = 'anthropic'
-            self.client = Anthropic(
-                api_key=Settings.ANTHROPIC_API_KEY,
-                base_url=Settings.ANTHROPIC_BASE_URL
-            )
+            self.client = get_anthropic_sync(Settings.ANTHROPIC_API_KEY, Settings.ANTHROPIC_BASE_URL)
             self.model = Settings.ANTHROPIC_MODEL
             logger.info(f"Using Anthropic API for code validation: {Settings.ANTHROPIC_BASE_URL}")
         elif OPENAI_AVAILABLE:
             self.client_type = 'openai'
-            self.client = OpenAI(
-                api_key=Settings.OPENAI_API_KEY,
-                base_url=Settings.OPENAI_BASE_URL
-            )
+            self.client = get_openai_sync(Settings.OPENAI_API_KEY, Settings.OPENAI_BASE_URL)
             self.model = Settings.OPENAI_MODEL
             logger.info(f"Using OpenAI API for code validation: {Settings.OPENAI_BASE_URL}")
         else:
             raise ImportError("Neither Anthropic nor OpenAI packages are available")
+        
+        # validate_code results by (code hash, schema hash), least recently used first
+        self._validation_cache: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._validation_lock = threading.Lock()
     
     def validate_code(self, code: str, json_schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Validate code for syntax errors and robustness issues
         
+        Results are memoized per (code, schema) content hash, so re-submitting
+        identical code skips parsing, the static checks and the AI review.
+        Results whose AI review failed (timeout, API error) are not memoized.
+        
         Args:
             code: Python code to validate
             json_schema: Optional JSON schema for context
@@ -73,67 +263,120 @@ class CodeValidatorAgent:
         Returns:
             Dictionary with validation results
         """
-        result = {
-            "valid": True,
-            "syntax_errors": [],
-            "robustness_issues": [],
-            "interface_issues": [],  # New: interface compliance issues
-            "suggestions": [],
-            "fixed_code": None,
-            "warnings": []
-        }
-        
-        # Step 1: Syntax validation
-        syntax_result = self._check_syntax(code)
-        result["syntax_errors"] = syntax_result["errors"]
-        result["warnings"].extend(syntax_result["warnings"])
-        
-        if syntax_result["errors"]:
-            result["valid"] = False
-            logger.error(f"Syntax errors found: {len(syntax_result['errors'])}")
+        code_hash = hashlib.blake2b(code.encode('utf-8'), digest_size=16).hexdigest()
+        schema_hash = ""
+        if json_schema is not None:
+            schema_json = json.dumps(json_schema, sort_keys=True, ensure_ascii=False, default=str)
+            schema_hash = hashlib.blake2b(schema_json.encode('utf-8'), digest_size=16).hexdigest()
+        
+        key = (code_hash, schema_hash)
+        with self._validation_lock:
+            result = self._validation_cache.get(key)
+            if result is not None:
+                self._validation_cache.move_to_end(key)
+                # Callers may modify the result; never hand out the cached object
+                return copy.deepcopy(result)
+        
+        result, cacheable = self._validate_uncached(code, json_schema)
+        if cacheable:
+            with self._validation_lock:
+                self._validation_cache[key] = result
+                self._validation_cache.move_to_end(key)
+                if len(self._validation_cache) > VALIDATION_CACHE_SIZE:
+                    self._validation_cache.popitem(last=False)
+        return copy.deepcopy(result)
+    
+    def _validate_uncached(self, code: str, json_schema: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Body of validate_code
         
-        # Step 2: Static analysis for robustness
-        robustness_result = self._check_robustness(code)
-        result["robustness_issues"] = robustness_result["issues"]
-        result["warnings"].extend(robustness_result["warnings"])
+        Returns:
+            (validation result, whether it may be memoized: False if the AI review failed)
+        """
+        result, needs_review = self._run_static_checks(code)
         
-        if robustness_result["issues"]:
-            logger.warning(f"Robustness issues found: {len(robustness_result['issues'])}")
-            result["valid"] = False  # Mark as invalid if robustness issues found
+        # Step 4: AI-powered code review
+        if needs_review:
+            logger.info("Running AI code review to fix issues and improve robustness...")
+            try:
+                review = self._ai_code_review(code, result, json_schema)
+            except Exception as e:
+                logger.error(f"AI code review failed: {e}")
+                self._apply_review(result, {"suggestions": [], "fixed_code": None})
+                return result, False
+            self._apply_review(result, review)
+        
+        return result, True
+    
+    def _run_static_checks(self, code: str) -> Tuple[Dict[str, Any], bool]:
+        """
+        Run the syntax, robustness and interface checks
         
-        # Step 3: Interface compliance check (input/output validation)
-        interface_result = self._check_interface_compliance(code)
-        result["interface_issues"] = interface_result["issues"]
-        result["warnings"].extend(interface_result["warnings"])
+        Returns:
+            (validation result without AI review, whether an AI review is needed)
+        """
+        # Step 1: Syntax validation
+        syntax_errors, syntax_warnings, tree = self._check_syntax(code)
+        robustness_issues, robustness_warnings = [], []
+        interface_issues, interface_warnings = [], []
+        
+        if syntax_errors:
+            logger.error(f"Syntax errors found: {len(syntax_errors)}")
+            # The static checks below would only report on code that does not
+            # parse; go straight to the AI review, which is what fixes it
+        else:
+            # Step 2: Static analysis for robustness
+            robustness_issues, robustness_warnings = self._check_robustness(code)
+            if robustness_issues:
+                logger.warning(f"Robustness issues found: {len(robustness_issues)}")
+            
+            # Step 3: Interface compliance check (input/output validation)
+            interface_issues, interface_warnings = self._check_interface_compliance(code, tree)
+            if interface_issues:
+                logger.warning(f"Interface compliance issues found: {len(interface_issues)}")
         
-        if interface_result["issues"]:
-            logger.warning(f"Interface compliance issues found: {len(interface_result['issues'])}")
-            result["valid"] = False  # Mark as invalid if interface issues found
+        result = {
+            # Invalid on syntax errors, robustness issues or interface issues
+            "valid": not (syntax_errors or robustness_issues or interface_issues),
+            "syntax_errors": syntax_errors,
+            "robustness_issues": robustness_issues,
+            "interface_issues": interface_issues,
+            "suggestions": [],
+            "fixed_code": None,
+            "warnings": [*syntax_warnings, *robustness_warnings, *interface_warnings]
+        }
         
-        # Step 4: AI-powered code review
         # Always review if there are syntax errors, robustness issues, interface issues, or warnings
-        if result["syntax_errors"] or result["robustness_issues"] or result.get("interface_issues", []) or robustness_result["warnings"]:
-            logger.info("Running AI code review to fix issues and improve robustness...")
-            ai_review = self._ai_code_review(code, result, json_schema)
-            result["suggestions"] = ai_review.get("suggestions", [])
-            result["fixed_code"] = ai_review.get("fixed_code")
-            if result["fixed_code"]:
-                logger.info("AI provided fixed code")
-            else:
-                logger.warning("AI review did not provide fixed code")
-        
-        return result
+        needs_review = bool(
+            syntax_errors or robustness_issues or interface_issues or robustness_warnings
+        )
+        return result, needs_review
+    
+    def _apply_review(self, result: Dict[str, Any], ai_review: Dict[str, Any]) -> None:
+        """Copy an AI review's suggestions and fixed code into a validation result"""
+        result["suggestions"] = ai_review.get("suggestions", [])
+        result["fixed_code"] = ai_review.get("fixed_code")
+        if result["fixed_code"]:
+            logger.info("AI provided fixed code")
+        else:
+            logger.warning("AI review did not provide fixed code")
     
-    def _check_syntax(self, code: str) -> Dict[str, Any]:
+    def _check_syntax(self, code: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Optional[ast.Module]]:
         """
         Check Python syntax using AST parser
+        
+        Returns:
+            (errors, warnings, parsed tree or None if parsing failed)
         """
         errors = []
         warnings = []
+        tree = None
         
         try:
             # Try to parse the code
-            ast.parse(code)
+            tree, e = _parse(code)
+            if e is not None:
+                raise e
         except SyntaxError as e:
             errors.append({
                 "type": "SyntaxError",
@@ -150,41 +393,49 @@ class CodeValidatorAgent:
         
         # Check for common Python issues
         # Check for invalid escape sequences
-        lines = code.split('\n')
-        for i, line in enumerate(lines, 1):
-            # Check for invalid escape sequences (not in raw strings or comments)
-            if not line.strip().startswith('#') and not line.strip().startswith('"""') and not line.strip().startswith("'''"):
-                if re.search(r'[^r]"[^"]*\\[^\\"nrtbf]', line) or re.search(r"[^r]'[^']*\\[^\\'nrtbf]", line):
-                    warnings.append({
-                        "type": "InvalidEscapeSequence",
-                        "message": f"Possible invalid escape sequence in line {i}",
-                        "line": i,
-                        "suggestion": "Use raw string (r\"...\") or escape backslashes"
-                    })
+        # (not in raw strings or comments): one multiline scan yields at most
+        # one match per offending line
+        if '\\' in code:
+            line_no, pos = 1, 0
+            for match in _INVALID_ESCAPE_LINE.finditer(code):
+                line_no += code.count('\n', pos, match.start())
+                pos = match.start()
+                warnings.append({
+                    "type": "InvalidEscapeSequence",
+                    "message": f"Possible invalid escape sequence in line {line_no}",
+                    "line": line_no,
+                    "suggestion": "Use raw string (r\"...\") or escape backslashes"
+                })
         
         # Check for JSON boolean values in Python code
-        if re.search(r':\s*(true|false)\s*[,}]', code):
+        if ('true' in code or 'false' in code) and _JSON_BOOL.search(code):
             warnings.append({
                 "type": "JSONBooleanInPython",
                 "message": "Found JSON boolean values (true/false) in Python code",
                 "suggestion": "Replace with Python boolean values (True/False)"
             })
         
-        return {"errors": errors, "warnings": warnings}
+        return errors, warnings, tree
     
-    def _check_robustness(self, code: str) -> Dict[str, Any]:
+    def _check_robustness(self, code: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
         """
         Check code robustness using static analysis
+        
+        Returns:
+            (issues, warnings)
         """
         issues = []
         warnings = []
         
+        # Probe every fixed keyword once; the checks below consult this set
+        present = {keyword for keyword in _ROBUSTNESS_KEYWORDS if keyword in code}
+        
         # Check for error handling in extraction functions
-        extraction_functions = ['def extract', 'def extract_content', 'def extract_batch']
-        has_extraction_func = any(func in code for func in extraction_functions)
+        # ('def extract' also covers def extract_content / def extract_batch)
+        has_extraction_func = 'def extract' in present
         if has_extraction_func:
             # Check if main extraction functions have error handling
-            if 'try' not in code or 'except' not in code:
+            if 'try' not in present or 'except' not in present:
                 issues.append({
                     "type": "MissingErrorHandling",
                     "severity": "high",
@@ -192,18 +443,18 @@ class CodeValidatorAgent:
                     "suggestion": "Add try-except blocks to handle parsing errors, file I/O errors, and XPath failures"
                 })
         
+        # Regex scans below are gated behind cheap substring probes for the
+        # literal text their patterns require
+        
         # Check for None checks after XPath operations
-        xpath_patterns = [
-            r'\.xpath\s*\(',
-            r'etree\.XPath\s*\(',
-            r'findall\s*\(',
-            r'find\s*\('
-        ]
-        has_xpath = any(re.search(pattern, code) for pattern in xpath_patterns)
+        has_xpath = (
+            ('xpath' in present or 'XPath' in present or 'find' in present)
+            and any(pattern.search(code) for pattern in _XPATH_PATTERNS)
+        )
         if has_xpath:
             # Check if code handles None results from XPath
-            xpath_usage_count = sum(len(re.findall(pattern, code)) for pattern in xpath_patterns)
-            none_check_count = len(re.findall(r'\bif\s+.*\s+is\s+not\s+None\b|\bif\s+.*\s+is\s+None\b|\bif\s+.*\s+!=\s+None\b|\bif\s+.*\s+==\s+None\b', code))
+            xpath_usage_count = sum(_count_matches(pattern, code) for pattern in _XPATH_PATTERNS)
+            none_check_count = _count_matches(_NONE_CHECK, code)
             if xpath_usage_count > none_check_count:
                 issues.append({
                     "type": "MissingNoneCheck",
@@ -215,10 +466,10 @@ class CodeValidatorAgent:
         # Check for empty list handling
         if has_xpath:
             list_operations = ['xpath', 'findall']
-            has_list_ops = any(op in code for op in list_operations)
+            has_list_ops = any(op in present for op in list_operations)
             if has_list_ops:
                 # Check if code checks for empty lists
-                empty_checks = len(re.findall(r'len\s*\(\s*\w+\s*\)\s*==\s*0|len\s*\(\s*\w+\s*\)\s*>\s*0|\w+\s+if\s+\w+\s+else', code))
+                empty_checks = _count_matches(_EMPTY_CHECK, code, limit=2)
                 if empty_checks < 2:  # Should have at least some empty checks
                     warnings.append({
                         "type": "MissingEmptyCheck",
@@ -229,10 +480,9 @@ class CodeValidatorAgent:
         
         # Check for proper error handling in file operations
         file_operations = ['open(', 'read_file', 'Path(']
-        has_file_ops = any(op in code for op in file_operations)
+        has_file_ops = any(op in present for op in file_operations)
         if has_file_ops:
-            file_error_handling = len(re.findall(r'FileNotFoundError|IOError|OSError|except.*:', code))
-            if file_error_handling == 0:
+            if not _FILE_ERROR_HANDLING.search(code):
                 issues.append({
                     "type": "MissingFileErrorHandling",
                     "severity": "high",
@@ -249,10 +499,10 @@ class CodeValidatorAgent:
         missing_imports = []
         for module, keywords in required_imports.items():
             # Check if module is used but not imported
-            module_used = any(keyword in code for keyword in keywords)
+            module_used = any(keyword in present for keyword in keywords)
             if module_used:
                 # Check if imported
-                if f'import {module}' not in code and f'from {module}' not in code:
+                if f'import {module}' not in present and f'from {module}' not in present:
                     missing_imports.append(module)
         
         if missing_imports:
@@ -264,7 +514,8 @@ class CodeValidatorAgent:
             })
         
         # Check for hardcoded paths
-        if re.search(r'[CD]:\\[^"]*', code) or re.search(r'/.*/[^"]*\.html', code):
+        if ((':\\' in present and _HARDCODED_PATH_WIN.search(code)) or
+                ('.html' in present and _HARDCODED_PATH_HTML.search(code))):
             issues.append({
                 "type": "HardcodedPath",
                 "severity": "medium",
@@ -273,10 +524,9 @@ class CodeValidatorAgent:
             })
         
         # Check for proper return value handling
-        if 'def extract' in code:
+        if has_extraction_func:
             # Check if function handles edge cases in return values
-            return_statements = len(re.findall(r'return\s+', code))
-            if return_statements < 2:
+            if code.count('return') < 2 or _count_matches(_RETURN_STATEMENT, code, limit=2) < 2:
                 warnings.append({
                     "type": "LimitedReturnPaths",
                     "severity": "low",
@@ -285,10 +535,9 @@ class CodeValidatorAgent:
                 })
         
         # Check for defensive programming - validate inputs
-        if 'def extract' in code or 'def extract_content' in code:
+        if has_extraction_func:
             # Check if function validates input parameters
-            input_validation = len(re.findall(r'if\s+.*\s+is\s+None|if\s+not\s+.*|assert\s+', code))
-            if input_validation == 0:
+            if not _INPUT_VALIDATION.search(code):
                 warnings.append({
                     "type": "MissingInputValidation",
                     "severity": "medium",
@@ -296,130 +545,138 @@ class CodeValidatorAgent:
                     "suggestion": "Add input validation to check for None, empty strings, or invalid file paths"
                 })
         
-        return {"issues": issues, "warnings": warnings}
+        return issues, warnings
     
-    def _check_interface_compliance(self, code: str) -> Dict[str, Any]:
+    def _check_interface_compliance(self, code: str, tree: Optional[ast.Module] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
         """
         Strictly check interface compliance:
         - Input parameter validation (function signatures)
         - Output format validation (return types)
         - Required class/function structure
+        
+        tree is the AST already parsed by _check_syntax; code is only parsed
+        here when it is not given.
+        
+        Returns:
+            (issues, warnings)
         """
         issues = []
         warnings = []
         
         try:
             # Parse code to AST for detailed analysis
-            tree = ast.parse(code)
+            if tree is None:
+                tree, error = _parse(code)
+                if error is not None:
+                    raise error
             
-            # Check for HTMLExtractor class
+            # HTMLExtractor and SCHEMA are module-level definitions: look for
+            # them in tree.body instead of walking every node
             html_extractor_class = None
             extract_method = None
-            extract_content_func = None
+            has_schema_constant = False
             
-            for node in ast.walk(tree):
+            for node in tree.body:
                 # Find HTMLExtractor class
                 if isinstance(node, ast.ClassDef) and node.name == 'HTMLExtractor':
                     html_extractor_class = node
+                
+                # Check for SCHEMA constant (optional but recommended)
+                elif isinstance(node, ast.Assign):
+                    if any(isinstance(target, ast.Name) and target.id == 'SCHEMA' for target in node.targets):
+                        has_schema_constant = True
+            
+            # Check __init__ and extract methods
+            for item in (html_extractor_class.body if html_extractor_class else ()):
+                if not isinstance(item, ast.FunctionDef):
+                    continue
+                
+                if item.name == '__init__':
+                    init_params = [arg.arg for arg in item.args.args if arg.arg != 'self']
                     
-                    # Check __init__ method
-                    for item in node.body:
-                        if isinstance(item, ast.FunctionDef) and item.name == '__init__':
-                            init_params = [arg.arg for arg in item.args.args if arg.arg != 'self']
-                            
-                            # Must have 'schema' parameter
-                            if 'schema' not in init_params:
-                                issues.append({
-                                    "type": "MissingSchemaParameter",
-                                    "severity": "high",
-                                    "message": "HTMLExtractor.__init__() must accept 'schema' parameter",
-                                    "suggestion": "Add 'schema: Dict[str, Any]' parameter to __init__ method"
-                                })
-                            
-                            # Check type hints
-                            if item.args.args:
-                                schema_arg = None
-                                for i, arg in enumerate(item.args.args):
-                                    if arg.arg == 'schema':
-                                        schema_arg = arg
-                                        break
-                                
-                                if schema_arg and item.returns is None:
-                                    # Check if annotation exists
-                                    if not hasattr(schema_arg, 'annotation') or schema_arg.annotation is None:
-                                        warnings.append({
-                                            "type": "MissingTypeHint",
-                                            "severity": "medium",
-                                            "message": "HTMLExtractor.__init__ schema parameter should have type hint",
-                                            "suggestion": "Add type hint: schema: Dict[str, Any]"
-                                        })
+                    # Must have 'schema' parameter
+                    if 'schema' not in init_params:
+                        issues.append({
+                            "type": "MissingSchemaParameter",
+                            "severity": "high",
+                            "message": "HTMLExtractor.__init__() must accept 'schema' parameter",
+                            "suggestion": "Add 'schema: Dict[str, Any]' parameter to __init__ method"
+                        })
                     
-                    # Check extract method
-                    for item in node.body:
-                        if isinstance(item, ast.FunctionDef) and item.name == 'extract':
-                            extract_method = item
-                            
-                            # Check parameters - must accept html_content or file_path
-                            params = [arg.arg for arg in item.args.args if arg.arg != 'self']
-                            has_html_content = 'html_content' in params
-                            has_file_path = 'file_path' in params
-                            
-                            if not has_html_content and not has_file_path:
-                                issues.append({
-                                    "type": "InvalidExtractParameters",
-                                    "severity": "high",
-                                    "message": "extract() method must accept 'html_content' or 'file_path' parameter",
-                                    "suggestion": "Add parameter: html_content: Optional[str] = None, file_path: Optional[str] = None"
-                                })
-                            
-                            # Check return type annotation
-                            if item.returns is None:
-                                issues.append({
-                                    "type": "MissingReturnType",
-                                    "severity": "high",
-                                    "message": "extract() method must have return type annotation",
-                                    "suggestion": "Add return type: -> Dict[str, Any]"
-                                })
-                            else:
-                                # Verify return type is Dict
-                                return_type_str = ast.unparse(item.returns) if hasattr(ast, 'unparse') else str(item.returns)
-                                if 'Dict' not in return_type_str and 'dict' not in return_type_str.lower():
-                                    issues.append({
-                                        "type": "InvalidReturnType",
-                                        "severity": "high",
-                                        "message": f"extract() method must return Dict[str, Any], found: {return_type_str}",
-                                        "suggestion": "Change return type annotation to: -> Dict[str, Any]"
-                                    })
-            
-            # Check for forbidden method/function names
-            for node in ast.walk(tree):
-                if isinstance(node, ast.FunctionDef):
-                    func_name = node.name
-                    # Check if it's a standalone function (not in HTMLExtractor class)
-                    is_standalone = True
-                    for parent in ast.walk(tree):
-                        if isinstance(parent, ast.ClassDef) and parent.name == 'HTMLExtractor':
-                            if node in parent.body:
-                                is_standalone = False
+                    # Check type hints
+                    if item.args.args:
+                        schema_arg = None
+                        for i, arg in enumerate(item.args.args):
+                            if arg.arg == 'schema':
+                                schema_arg = arg
                                 break
+                        
+                        if schema_arg and item.returns is None:
+                            # Check if annotation exists
+                            if not hasattr(schema_arg, 'annotation') or schema_arg.annotation is None:
+                                warnings.append({
+                                    "type": "MissingTypeHint",
+                                    "severity": "medium",
+                                    "message": "HTMLExtractor.__init__ schema parameter should have type hint",
+                                    "suggestion": "Add type hint: schema: Dict[str, Any]"
+                                })
+                
+                elif item.name == 'extract':
+                    extract_method = item
+                    
+                    # Check parameters - must accept html_content or file_path
+                    params = [arg.arg for arg in item.args.args if arg.arg != 'self']
+                    has_html_content = 'html_content' in params
+                    has_file_path = 'file_path' in params
                     
-                    # Forbidden standalone functions
-                    if is_standalone and func_name == 'extract_content':
+                    if not has_html_content and not has_file_path:
                         issues.append({
-                            "type": "ForbiddenFunction",
+                            "type": "InvalidExtractParameters",
                             "severity": "high",
-                            "message": "Standalone extract_content() function is forbidden. MUST use HTMLExtractor class with extract() method.",
-                            "suggestion": "Remove extract_content() function and use HTMLExtractor.extract() method instead"
+                            "message": "extract() method must accept 'html_content' or 'file_path' parameter",
+                            "suggestion": "Add parameter: html_content: Optional[str] = None, file_path: Optional[str] = None"
                         })
                     
-                    # Check for forbidden method names in HTMLExtractor class
-                    if not is_standalone and func_name in ['extract_from_string', 'extract_from_file']:
+                    # Check return type annotation
+                    if item.returns is None:
                         issues.append({
-                            "type": "ForbiddenMethodName",
+                            "type": "MissingReturnType",
                             "severity": "high",
-                            "message": f"Method '{func_name}' is forbidden. MUST use 'extract' method only.",
-                            "suggestion": "Rename to 'extract' method with signature: extract(self, html_content: Optional[str] = None, file_path: Optional[str] = None) -> Dict[str, Any]"
+                            "message": "extract() method must have return type annotation",
+                            "suggestion": "Add return type: -> Dict[str, Any]"
                         })
+                    else:
+                        # Verify return type is Dict
+                        if 'dict' not in (_return_type_name(item.returns) or '').lower():
+                            return_type_str = ast.unparse(item.returns)
+                            issues.append({
+                                "type": "InvalidReturnType",
+                                "severity": "high",
+                                "message": f"extract() method must return Dict[str, Any], found: {return_type_str}",
+                                "suggestion": "Change return type annotation to: -> Dict[str, Any]"
+                            })
+            
+            # Check for forbidden method/function names: standalone functions
+            # live in the module body, methods in the HTMLExtractor class body
+            for node in tree.body:
+                # Forbidden standalone functions
+                if isinstance(node, ast.FunctionDef) and node.name == 'extract_content':
+                    issues.append({
+                        "type": "ForbiddenFunction",
+                        "severity": "high",
+                        "message": "Standalone extract_content() function is forbidden. MUST use HTMLExtractor class with extract() method.",
+                        "suggestion": "Remove extract_content() function and use HTMLExtractor.extract() method instead"
+                    })
+            
+            for item in (html_extractor_class.body if html_extractor_class else ()):
+                # Check for forbidden method names in HTMLExtractor class
+                if isinstance(item, ast.FunctionDef) and item.name in ['extract_from_string', 'extract_from_file']:
+                    issues.append({
+                        "type": "ForbiddenMethodName",
+                        "severity": "high",
+                        "message": f"Method '{item.name}' is forbidden. MUST use 'extract' method only.",
+                        "suggestion": "Rename to 'extract' method with signature: extract(self, html_content: Optional[str] = None, file_path: Optional[str] = None) -> Dict[str, Any]"
+                    })
             
             # Must have HTMLExtractor class (extract_content function is NOT allowed)
             if html_extractor_class is None:
@@ -434,26 +691,15 @@ class CodeValidatorAgent:
             if extract_method:
                 # Check return type more strictly
                 if extract_method.returns:
-                    return_type_str = ast.unparse(extract_method.returns) if hasattr(ast, 'unparse') else str(extract_method.returns)
                     # Check for forbidden return types
-                    forbidden_types = ['ExtractionResult', 'dataclass', 'List[', 'Tuple[']
-                    for forbidden in forbidden_types:
-                        if forbidden in return_type_str:
-                            issues.append({
-                                "type": "InvalidReturnType",
-                                "severity": "high",
-                                "message": f"extract() method MUST return Dict[str, Any], found: {return_type_str}",
-                                "suggestion": "Change return type to: -> Dict[str, Any] (plain dictionary, not dataclass or other types)"
-                            })
-            
-            # Check for SCHEMA constant (optional but recommended)
-            has_schema_constant = False
-            for node in ast.walk(tree):
-                if isinstance(node, ast.Assign):
-                    for target in node.targets:
-                        if isinstance(target, ast.Name) and target.id == 'SCHEMA':
-                            has_schema_constant = True
-                            break
+                    if _return_type_name(extract_method.returns) in FORBIDDEN_RETURN_TYPES:
+                        return_type_str = ast.unparse(extract_method.returns)
+                        issues.append({
+                            "type": "InvalidReturnType",
+                            "severity": "high",
+                            "message": f"extract() method MUST return Dict[str, Any], found: {return_type_str}",
+                            "suggestion": "Change return type to: -> Dict[str, Any] (plain dictionary, not dataclass or other types)"
+                        })
             
             if not has_schema_constant:
                 warnings.append({
@@ -476,65 +722,87 @@ class CodeValidatorAgent:
                 "suggestion": "Manual review recommended"
             })
         
-        return {"issues": issues, "warnings": warnings}
+        return issues, warnings
     
     def _ai_code_review(self, code: str, validation_result: Dict[str, Any], json_schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Use AI to review code and provide suggestions or fixes
+        
+        API errors propagate; validate_code handles them. The response is streamed and reading stops once the fixed code block
+        is closed; the trailing summary of changes is not needed.
         """
-        try:
-            # Build review prompt
-            prompt = self._build_review_prompt(code, validation_result, json_schema)
-            
-            if self.client_type == 'anthropic':
-                # Use maximum tokens supported (128000), leave small buffer
-                response = self.client.messages.create(
-                    model=self.model,
-                    max_tokens=127000,
-                    thinking={
-                        "type": "enabled",
-                        "budget_tokens": 10000
-                    },
-                    system=self._get_system_prompt(),
-                    messages=[{
-                        "role": "user",
-                        "content": prompt
-                    }]
-                )
-                
-                # Extract text from Anthropic response
-                review_text = ""
-                for block in response.content:
-                    if block.type == "text":
-                        review_text = block.text
-            else:
-                # Use maximum tokens supported (128000), leave small buffer for safety
-                # Set to 127000 to ensure we don't exceed the limit
-                max_tokens = 127000
-                
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": self._get_system_prompt()},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.2,
-                    max_tokens=max_tokens
-                )
-                
-                review_text = response.choices[0].message.content
-            
-            # Parse AI response
-            return self._parse_ai_review(review_text, code)
+        # Build review prompt
+        prompt = self._build_review_prompt(code, validation_result, json_schema)
+        review_text = self._review_completion(
+            prompt, _review_max_tokens(code), _issue_count(validation_result),
+            stop=_review_code_block_closed
+        )
+        
+        # Parse AI response
+        return self._parse_ai_review(review_text, code)
+    
+    def _review_completion(self, prompt: str, max_tokens: int, issue_count: int,
+                           stop: Optional[Callable[[str], bool]] = None) -> str:
+        """
+        Stream a review response and return its text
+        
+        Args:
+            prompt: Review prompt
+            max_tokens: Output budget (excluding any thinking budget)
+            issue_count: Number of reported problems, scales the thinking budget
+            stop: Optional predicate to stop reading the stream early
+        """
+        if self.client_type == 'anthropic':
+            params = {
+                "model": self.model,
+                "max_tokens": max_tokens,
+                "system": self._get_system_prompt(),
+                "messages": [{
+                    "role": "user",
+                    "content": prompt
+                }]
+            }
+            if Settings.ENABLE_THINKING:
+                # Scale thinking with the number of problems found; the
+                # budget counts towards max_tokens
+                budget = REVIEW_THINKING_TOKENS_PER_ISSUE * max(1, issue_count)
+                params["thinking"] = {
+                    "type": "enabled",
+                    "budget_tokens": budget
+                }
+                params["max_tokens"] = max_tokens + budget
             
-        except Exception as e:
-            logger.error(f"AI code review failed: {e}")
-            return {"suggestions": [], "fixed_code": None}
+            with self.client.messages.stream(**params) as stream:
+                return read_text(stream.text_stream, stop=stop)
+        
+        with self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": self._get_system_prompt()},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+            max_tokens=max_tokens,
+            stream=True
+        ) as stream:
+            return read_text(iter_openai_text(stream), stop=stop)
     
     def _build_review_prompt(self, code: str, validation_result: Dict[str, Any], json_schema: Optional[Dict[str, Any]] = None) -> str:
         """
         Build prompt for AI code review
         """
+        return f"""Review and fix the following Python code for HTML content extraction.
+
+{self._build_review_context(code, validation_result, json_schema)}
+
+{REVIEW_INSTRUCTIONS}
+
+Return the fixed code in a markdown code block, and provide a brief summary of changes made."""
+    
+    def _build_review_context(self, code: str, validation_result: Dict[str, Any], json_schema: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Issues, code and schema context of one snippet for a review prompt
+        """
         issues_summary = []
         if validation_result.get("syntax_errors"):
             issues_summary.append(f"Syntax Errors: {len(validation_result['syntax_errors'])}")
@@ -553,41 +821,16 @@ class CodeValidatorAgent:
         
         schema_context = ""
         if json_schema:
-            import json
             schema_context = f"\n\nJSON Schema Context:\n{json.dumps(json_schema, indent=2, ensure_ascii=False)[:1000]}"
         
-        return f"""Review and fix the following Python code for HTML content extraction.
-
-Issues Found:
+        return f"""Issues Found:
 {chr(10).join(issues_summary) if issues_summary else "No critical issues found"}
 
 Code to Review:
 ```python
 {code}
 ```
-{schema_context}
-
-Please:
-1. Fix any syntax errors
-2. Address robustness issues (error handling, None checks, etc.)
-3. Fix interface compliance issues (function signatures, return types)
-4. Ensure code follows Python best practices
-5. Use proper path handling (pathlib.Path or raw strings)
-6. Replace any JSON boolean values (true/false) with Python booleans (True/False)
-7. Add proper error handling where needed
-
-CRITICAL INTERFACE REQUIREMENTS (MUST BE STRICTLY ENFORCED):
-- MUST define class named exactly 'HTMLExtractor' (case-sensitive)
-- HTMLExtractor.__init__() MUST have EXACT signature: __init__(self, schema: Dict[str, Any], logger: Optional[logging.Logger] = None) -> None
-- Parameter name MUST be exactly 'schema' (not json_schema, not extraction_schema)
-- MUST have method named exactly 'extract' (NOT extract_from_string, extract_from_file, extract_content, etc.)
-- extract() method MUST have EXACT signature: extract(self, html_content: Optional[str] = None, file_path: Optional[str] = None) -> Dict[str, Any]
-- Parameter names MUST be exactly 'html_content' and 'file_path' (no variations)
-- extract() method MUST return Dict[str, Any] (plain dictionary, NOT ExtractionResult, NOT dataclass, NOT list, NOT other types)
-- DO NOT create methods named extract_from_string, extract_from_file, extract_content, etc.
-- DO NOT return custom result types (ExtractionResult, dataclass, etc.)
-
-Return the fixed code in a markdown code block, and provide a brief summary of changes made."""
+{schema_context}"""
     
     def _get_system_prompt(self) -> str:
         return """You are an expert Python code reviewer specializing in code quality, robustness, and best practices.
@@ -598,57 +841,10 @@ Focus on making code production-ready, robust, and maintainable."""
         """
         Parse AI review response to extract suggestions and fixed code
         """
-        suggestions = []
-        fixed_code = None
-        
-        # Try multiple patterns to extract code from markdown code blocks
-        # Pattern 1: ```python ... ``` or ```python3 ... ```
-        code_match = re.search(r'```(?:python|python3)?\s*(.*?)```', review_text, re.DOTALL)
-        if code_match:
-            fixed_code = code_match.group(1).strip()
-        else:
-            # Pattern 2: Look for code block without language specifier
-            code_match = re.search(r'```\s*(.*?)```', review_text, re.DOTALL)
-            if code_match:
-                fixed_code = code_match.group(1).strip()
-        
-        # Clean up the extracted code
-        if fixed_code:
-            # Remove any remaining markdown artifacts
-            fixed_code = fixed_code.strip()
-            
-            # Remove any remaining ``` markers that might be in the code
-            fixed_code = re.sub(r'^```+\s*', '', fixed_code, flags=re.MULTILINE)
-            fixed_code = re.sub(r'\s*```+$', '', fixed_code, flags=re.MULTILINE)
-            
-            # Remove leading/trailing whitespace
-            fixed_code = fixed_code.strip()
-            
-            # Validate that the extracted code is actually Python code
-            # Check if it looks like Python (has Python keywords or structure)
-            if not any(keyword in fixed_code for keyword in ['def ', 'import ', 'class ', 'from ', 'if ', 'return ']):
-                logger.warning("Extracted code doesn't look like Python, may be invalid")
-                # Try to find actual code in the response
-                # Look for code after "Here's the fixed code:" or similar markers
-                code_after_marker = re.search(
-                    r'(?:fixed code|corrected code|updated code|here.*?code)[:\n]+(.*?)(?:\n\n|\Z)', 
-                    review_text, 
-                    re.DOTALL | re.IGNORECASE
-                )
-                if code_after_marker:
-                    potential_code = code_after_marker.group(1).strip()
-                    # Remove markdown code blocks from potential code
-                    potential_code = re.sub(r'```(?:python|python3)?\s*', '', potential_code)
-                    potential_code = re.sub(r'```\s*', '', potential_code)
-                    potential_code = potential_code.strip()
-                    if len(potential_code) > 100:  # Reasonable code length
-                        fixed_code = potential_code
+        fixed_code = self._extract_fixed_code(review_text)
         
         # Extract suggestions from text
-        lines = review_text.split('\n')
-        for line in lines:
-            if line.strip().startswith('-') or line.strip().startswith('*'):
-                suggestions.append(line.strip())
+        suggestions = _BULLET_LINE.findall(review_text)
         
         # If no valid code found, use original code
         if not fixed_code or len(fixed_code) < 100:
@@ -656,12 +852,11 @@ Focus on making code production-ready, robust, and maintainable."""
             fixed_code = original_code
         else:
             # Validate syntax of extracted code
-            try:
-                import ast
-                ast.parse(fixed_code)
+            syntax_error = _syntax_error(fixed_code)
+            if syntax_error is None:
                 logger.info("Extracted fixed code passes syntax validation")
-            except SyntaxError as e:
-                logger.error(f"Extracted fixed code has syntax errors: {e}")
+            else:
+                logger.error(f"Extracted fixed code has syntax errors: {syntax_error}")
                 logger.warning("Using original code instead")
                 fixed_code = original_code
         
@@ -670,6 +865,70 @@ Focus on making code production-ready, robust, and maintainable."""
             "fixed_code": fixed_code
         }
     
+    def _extract_fixed_code(self, review_text: str) -> Optional[str]:
+        """
+        Extract the fixed code from an AI review response
+        
+        The common case, a ```python block that already compiles, is
+        returned as is; anything else goes through the cleanup heuristics.
+        """
+        # Extract code from markdown code blocks, scanning from the first fence
+        start = review_text.find('```')
+        if start == -1:
+            return None
+        
+        # Pattern 1: line-delimited ```python / ```py / ``` blocks; the
+        # longest one is the fixed code, not a snippet quoted in the summary
+        blocks = [match.group(1) for match in _CODE_BLOCK.finditer(review_text, start)]
+        if blocks:
+            fixed_code = max(blocks, key=len).strip()
+            # Fast path: valid Python has no fence artifacts to strip
+            if len(fixed_code) >= 100 and _syntax_error(fixed_code) is None:
+                return fixed_code
+        else:
+            # Pattern 2: any fenced block, e.g. with the code on the fence line
+            code_match = _MD_CODE_BLOCK.search(review_text, start)
+            if not code_match:
+                return None
+            fixed_code = code_match.group(1).strip()
+        
+        if fixed_code:
+            fixed_code = self._clean_extracted_code(fixed_code, review_text)
+        return fixed_code
+    
+    def _clean_extracted_code(self, fixed_code: str, review_text: str) -> str:
+        """
+        Strip markdown artifacts from extracted code, falling back to the
+        code after a "fixed code" marker if it doesn't look like Python
+        """
+        # Remove any remaining markdown artifacts
+        fixed_code = fixed_code.strip()
+        
+        # Remove any remaining ``` markers that might be in the code
+        fixed_code = _LEADING_FENCE.sub('', fixed_code)
+        fixed_code = _TRAILING_FENCE.sub('', fixed_code)
+        
+        # Remove leading/trailing whitespace
+        fixed_code = fixed_code.strip()
+        
+        # Validate that the extracted code is actually Python code
+        # Check if it looks like Python (has Python keywords or structure)
+        if not _PY_KEYWORD.search(fixed_code):
+            logger.warning("Extracted code doesn't look like Python, may be invalid")
+            # Try to find actual code in the response
+            # Look for code after "Here's the fixed code:" or similar markers
+            code_after_marker = _CODE_AFTER_MARKER.search(review_text)
+            if code_after_marker:
+                potential_code = code_after_marker.group(1).strip()
+                # Remove markdown code blocks from potential code
+                potential_code = _MD_PYTHON_FENCE.sub('', potential_code)
+                potential_code = _MD_FENCE.sub('', potential_code)
+                potential_code = potential_code.strip()
+                if len(potential_code) > 100:  # Reasonable code length
+                    fixed_code = potential_code
+        
+        return fixed_code
+    
     def fix_code(self, code: str, validation_result: Dict[str, Any]) -> str:
         """
         Attempt to automatically fix code based on validation results
@@ -678,8 +937,8 @@ Focus on making code production-ready, robust, and maintainable."""
         
         # Auto-fix common issues
         # Fix JSON boolean values
-        fixed_code = re.sub(r':\s*false\s*([,}])', r': False\1', fixed_code)
-        fixed_code = re.sub(r':\s*true\s*([,}])', r': True\1', fixed_code)
+        fixed_code = _JSON_FALSE.sub(r': False\1', fixed_code)
+        fixed_code = _JSON_TRUE.sub(r': True\1', fixed_code)
         
         # Fix invalid escape sequences in string literals (basic fix)
         # This is complex, so we'll rely on AI for most fixes
@@ -1,157 +1,75 @@
+import importlib.util
 import json
 import logging
-from typing import Dict, Any, Optional, List
+import re
+from functools import lru_cache
+from typing import Dict, Any, Optional, List, Callable, Tuple
 from pathlib import Path
 from config import Settings
+from . import _llm_cache
+from ._clients import get_anthropic_sync, get_openai_sync
+from ._json import dumps_compact, extract_first_json_object, loads
+from ._streaming import code_block_closed, iter_openai_text, leading_json_object, read_text
 
 logger = logging.getLogger(__name__)
 
-# Try to import Anthropic, fallback to OpenAI
-try:
-    from anthropic import Anthropic
-    ANTHROPIC_AVAILABLE = True
-except ImportError:
-    ANTHROPIC_AVAILABLE = False
+# Check for Anthropic / OpenAI without importing them; only the backend
+# actually used is imported (by the _clients factories)
+ANTHROPIC_AVAILABLE = importlib.util.find_spec("anthropic") is not None
+if not ANTHROPIC_AVAILABLE:
     logger.warning("Anthropic package not available, falling back to OpenAI")
 
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
+if not OPENAI_AVAILABLE:
     logger.warning("OpenAI package not available")
 
+# Which API to use is fixed by configuration, so decide once at import
+_base_url_lower = (Settings.ANTHROPIC_BASE_URL or "").lower()
+_USE_ANTHROPIC = bool(
+    ANTHROPIC_AVAILABLE and 
+    Settings.ANTHROPIC_BASE_URL and 
+    (_base_url_lower != 'https://api.anthropic.com' and
+     ('opensphereai' in _base_url_lower or
+      'anthropic' in _base_url_lower or
+      not _base_url_lower.startswith('http://35.220.164.252')))
+)
 
-class MarkdownConverterAgent:
-    """
-    Markdown converter agent that:
-    1. Analyzes JSON extraction results to identify main content fields
-    2. Generates code to convert JSON to Markdown format
-    3. Ensures proper Markdown syntax compliance
-    """
-    
-    def __init__(self):
-        # Determine which API to use based on configuration
-        base_url_lower = (Settings.ANTHROPIC_BASE_URL or "").lower()
-        use_anthropic = (
-            ANTHROPIC_AVAILABLE and 
-            Settings.ANTHROPIC_BASE_URL and 
-            (base_url_lower != 'https://api.anthropic.com' and
-             ('opensphereai' in base_url_lower or
-              'anthropic' in base_url_lower or
-              not base_url_lower.startswith('http://35.220.164.252')))
-        )
-        
-        if use_anthropic:
-            self.client = Anthropic(api_key=Settings.ANTHROPIC_API_KEY)
-            self.model = Settings.ANTHROPIC_MODEL
-            self.use_anthropic = True
-        elif OPENAI_AVAILABLE:
-            self.client = OpenAI(
-                api_key=Settings.ANTHROPIC_API_KEY,
-                base_url=Settings.ANTHROPIC_BASE_URL
-            )
-            self.model = Settings.ANTHROPIC_MODEL
-            self.use_anthropic = False
-        else:
-            raise ImportError("Neither Anthropic nor OpenAI packages are available")
-    
-    def analyze_content_fields(self, json_results: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """
-        Analyze JSON results to identify which fields contain main content
-        Returns analysis of content field structure
-        """
-        if not json_results:
-            return {"error": "No JSON results provided"}
-        
-        # Sample a few results to understand structure
-        sample_results = json_results[:3] if len(json_results) >= 3 else json_results
-        
-        prompt = self._build_content_analysis_prompt(sample_results)
-        
-        try:
-            if self.use_anthropic:
-                response = self.client.messages.create(
-                    model=self.model,
-                    max_tokens=4000,
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-                result = response.content[0].text
-            else:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": self._get_system_prompt()},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.3,
-                    max_tokens=4000
-                )
-                result = response.choices[0].message.content
-            
-            try:
-                return json.loads(result)
-            except json.JSONDecodeError:
-                # Try to extract JSON from markdown code block
-                import re
-                json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', result, re.DOTALL)
-                if json_match:
-                    return json.loads(json_match.group(1))
-                logger.warning("Failed to parse JSON, returning raw result")
-                return {"raw_result": result, "error": "Failed to parse JSON response"}
-        except Exception as e:
-            logger.error(f"Failed to analyze content fields: {e}")
-            return {"error": str(e)}
-    
-    def generate_markdown_converter_code(self, content_analysis: Dict[str, Any], sample_json: Dict[str, Any], retry: bool = False) -> str:
-        """
-        Generate Python code to convert JSON results to Markdown format
-        """
-        prompt = self._build_converter_generation_prompt(content_analysis, sample_json, retry=retry)
-        
-        try:
-            if self.use_anthropic:
-                response = self.client.messages.create(
-                    model=self.model,
-                    max_tokens=8000,
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-                code = response.content[0].text
-            else:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": self._get_system_prompt()},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.3,
-                    max_tokens=8000
-                )
-                code = response.choices[0].message.content
-            
-            # Extract code from markdown code block if present
-            import re
-            code_match = re.search(r'```(?:python)?\s*(.*?)\s*```', code, re.DOTALL)
-            if code_match:
-                return code_match.group(1).strip()
-            return code.strip()
-        except Exception as e:
-            logger.error(f"Failed to generate markdown converter code: {e}")
-            raise
-    
-    def _get_system_prompt(self) -> str:
-        return """You are an expert in content analysis and Markdown conversion.
+
+@lru_cache(maxsize=1)
+def _get_client() -> Tuple[Any, str, bool]:
+    """Return the shared (client, model, use_anthropic) for all converter agents"""
+    if _USE_ANTHROPIC:
+        # Sent to ANTHROPIC_BASE_URL, like the code generator and validator
+        # (the converter used to call api.anthropic.com whatever the setting)
+        return get_anthropic_sync(Settings.ANTHROPIC_API_KEY, Settings.ANTHROPIC_BASE_URL), Settings.ANTHROPIC_MODEL, True
+    if OPENAI_AVAILABLE:
+        return get_openai_sync(Settings.ANTHROPIC_API_KEY, Settings.ANTHROPIC_BASE_URL), Settings.ANTHROPIC_MODEL, False
+    raise ImportError("Neither Anthropic nor OpenAI packages are available")
+
+
+# Precompiled pattern for pulling code out of fenced markdown blocks
+_PY_CODE_BLOCK = re.compile(r'```(?:python)?\s*(.*?)\s*```', re.DOTALL)
+
+# Markers of a converter in an unfenced response, and the short follow-up
+# asking the model to re-emit it fenced
+_CONVERTER_CLASS = 'class MarkdownConverter'
+_CONVERT_METHOD = 'def convert'
+_REEMIT_FENCED_PROMPT = "Re-emit the Python code from your previous answer wrapped in a single ```python fence. No commentary."
+
+
+def _compiles(code: str) -> bool:
+    try:
+        compile(code, '<string>', 'exec')
+    except (SyntaxError, ValueError):
+        return False
+    return True
+
+
+_SYSTEM_PROMPT = """You are an expert in content analysis and Markdown conversion.
 You analyze JSON extraction results to identify main content fields and generate
 robust Python code to convert JSON to properly formatted Markdown."""
-    
-    def _build_content_analysis_prompt(self, sample_results: List[Dict[str, Any]]) -> str:
-        sample_json = json.dumps(sample_results, indent=2, ensure_ascii=False)
-        
-        return f"""Analyze the following JSON extraction results and identify which fields contain the main article content (body text).
+
+_CONTENT_ANALYSIS_PROMPT = """Analyze the following JSON extraction results and identify which fields contain the main article content (body text).
 
 JSON Results (sample):
 {sample_json}
@@ -177,19 +95,10 @@ Return your analysis as JSON with the following structure:
     }},
     "recommendations": "Brief explanation of how to convert to Markdown"
 }}"""
-    
-    def _build_converter_generation_prompt(self, content_analysis: Dict[str, Any], sample_json: Dict[str, Any], retry: bool = False) -> str:
-        analysis_json = json.dumps(content_analysis, indent=2, ensure_ascii=False)
-        sample_json_str = json.dumps(sample_json, indent=2, ensure_ascii=False)
-        
-        # Use regular string concatenation to avoid issues with triple quotes in f-strings
-        prompt = """Generate Python code to convert JSON extraction results to Markdown format.
 
-Content Analysis:
-{analysis_json}
-
-Sample JSON Structure:
-{sample_json_str}
+# Static interface specification, sent first so providers can cache it
+# as a prompt prefix; only _CONVERTER_DATA_PROMPT varies between calls
+_CONVERTER_SPEC = """Generate Python code to convert JSON extraction results to Markdown format.
 
 CRITICAL INTERFACE REQUIREMENTS (MUST BE STRICTLY FOLLOWED):
 ===========================================================
@@ -226,6 +135,9 @@ CRITICAL INTERFACE REQUIREMENTS (MUST BE STRICTLY FOLLOWED):
      * Lists: Convert to Markdown lists
      * Nested structures: Handle appropriately
    - Include proper error handling (try-except blocks)
+   - convert() is called once per file on the same instance: compile regexes and
+     build lookup tables once in __init__ (or an optional warmup(self) -> None
+     method), not inside convert()
    - Preserve content hierarchy (title, metadata, body, etc.)
    - Clean HTML tags and convert to Markdown equivalents:
      * <h1>-<h6> -> # - ######
@@ -274,16 +186,19 @@ class MarkdownConverter:
         return markdown
 ```
 
+"""
+
+_CONVERTER_DATA_PROMPT = """Content Analysis:
+{analysis_json}
+
+Sample JSON Structure:
+{sample_json_str}
+
 Generate complete, production-ready Python code with all necessary imports.
 The code should be reusable, handle edge cases gracefully, and MUST be syntactically valid Python.
-MUST strictly follow the interface specification above.""".format(
-            analysis_json=analysis_json,
-            sample_json_str=sample_json_str
-        )
-        
-        if retry:
-            # Add extra emphasis on syntax correctness for retry
-            retry_warning = """
+MUST strictly follow the interface specification above."""
+
+_RETRY_WARNING = """
 
 ⚠️ RETRY MODE - PREVIOUS ATTEMPT HAD SYNTAX ERRORS ⚠️
 ===========================================================
@@ -300,6 +215,174 @@ CRITICAL SYNTAX REQUIREMENTS (MUST FOLLOW):
 
 The previous code had syntax errors. Please be EXTREMELY careful with string quotes and f-string syntax.
 """
-            prompt = prompt + retry_warning
+
+
+class MarkdownConverterAgent:
+    """
+    Markdown converter agent that:
+    1. Analyzes JSON extraction results to identify main content fields
+    2. Generates code to convert JSON to Markdown format
+    3. Ensures proper Markdown syntax compliance
+    """
+    
+    def __init__(self):
+        self.client, self.model, self.use_anthropic = _get_client()
+    
+    def analyze_content_fields(self, json_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Analyze JSON results to identify which fields contain main content
+        Returns analysis of content field structure
+        """
+        if not json_results:
+            return {"error": "No JSON results provided"}
+        
+        # Sample a few results to understand structure
+        sample_results = json_results[:3] if len(json_results) >= 3 else json_results
+        
+        prompt = self._build_content_analysis_prompt(sample_results)
+        cache_key = _llm_cache.make_key("content_analysis", self.model, str(self.use_anthropic), _SYSTEM_PROMPT, prompt)
+        cached = _llm_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Using cached content field analysis")
+            return loads(cached)
+        
+        try:
+            # Stop reading once the top-level JSON object is closed
+            result = self._complete(
+                prompt, 4000,
+                stop=lambda text: leading_json_object(text) is not None,
+                trigger="}"
+            )
+            
+            try:
+                analysis = loads(result)
+                json_text = result
+            except json.JSONDecodeError:
+                # Try to extract the JSON object (bare or inside a markdown
+                # code block; the stream may have stopped before a closing fence)
+                json_text = extract_first_json_object(result)
+                if not json_text:
+                    logger.warning("Failed to parse JSON, returning raw result")
+                    return {"raw_result": result, "error": "Failed to parse JSON response"}
+                analysis = loads(json_text)
+            if isinstance(analysis, dict) and 'error' not in analysis:
+                _llm_cache.put(cache_key, json_text)
+            return analysis
+        except Exception as e:
+            logger.error(f"Failed to analyze content fields: {e}")
+            return {"error": str(e)}
+    
+    def generate_markdown_converter_code(self, content_analysis: Dict[str, Any], sample_json: Dict[str, Any], retry: bool = False) -> str:
+        """
+        Generate Python code to convert JSON results to Markdown format
+        """
+        prompt = self._build_converter_generation_prompt(content_analysis, sample_json, retry=retry)
+        
+        try:
+            # Stop reading once the code block is closed; any trailing
+            # commentary would be discarded anyway
+            code = self._complete(prompt, 8000, stop=code_block_closed, cached_prefix=_CONVERTER_SPEC)
+            
+            # Extract code from markdown code block if present
+            code_match = _PY_CODE_BLOCK.search(code)
+            if code_match:
+                return code_match.group(1).strip()
+            code = code.strip()
+            
+            # The converter is there but unfenced and mixed with prose: ask for
+            # just the fenced code instead of regenerating it from scratch
+            if _CONVERTER_CLASS in code and _CONVERT_METHOD in code and not _compiles(code):
+                logger.warning("Converter code is not in a code block, asking the model to re-emit it fenced")
+                reemitted = self._complete(
+                    prompt, min(len(code) + 500, 8000),
+                    stop=code_block_closed, cached_prefix=_CONVERTER_SPEC,
+                    followup=[
+                        {"role": "assistant", "content": code},
+                        {"role": "user", "content": _REEMIT_FENCED_PROMPT}
+                    ]
+                )
+                code_match = _PY_CODE_BLOCK.search(reemitted)
+                if code_match:
+                    return code_match.group(1).strip()
+            return code
+        except Exception as e:
+            logger.error(f"Failed to generate markdown converter code: {e}")
+            raise
+    
+    def _complete(self, prompt: str, max_tokens: int,
+                  stop: Optional[Callable[[str], bool]] = None, trigger: str = "`",
+                  cached_prefix: Optional[str] = None,
+                  followup: Optional[List[Dict[str, str]]] = None) -> str:
+        """
+        Stream a completion, returning early once stop(text) is true
+        
+        Args:
+            prompt: User prompt
+            max_tokens: Output token budget
+            stop: Optional predicate to stop reading the stream early
+            trigger: Character a delta must contain before stop is checked
+            cached_prefix: Optional static text sent before prompt; marked as
+                a cache breakpoint for Anthropic (OpenAI caches prefixes itself)
+            followup: Optional further assistant/user turns after the prompt
+            
+        Returns:
+            Response text (possibly truncated after the stop point)
+        """
+        followup = followup or []
+        if self.use_anthropic:
+            content = prompt
+            if cached_prefix:
+                content = [
+                    {"type": "text", "text": cached_prefix, "cache_control": {"type": "ephemeral"}},
+                    {"type": "text", "text": prompt}
+                ]
+            with self.client.messages.stream(
+                model=self.model,
+                max_tokens=max_tokens,
+                messages=[
+                    {"role": "user", "content": content},
+                    *followup
+                ]
+            ) as stream:
+                return read_text(stream.text_stream, stop=stop, trigger=trigger)
+        
+        if cached_prefix:
+            prompt = cached_prefix + prompt
+        with self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": self._get_system_prompt()},
+                {"role": "user", "content": prompt},
+                *followup
+            ],
+            temperature=0.3,
+            max_tokens=max_tokens,
+            stream=True
+        ) as stream:
+            return read_text(iter_openai_text(stream), stop=stop, trigger=trigger)
+    
+    def _get_system_prompt(self) -> str:
+        return _SYSTEM_PROMPT
+    
+    def _build_content_analysis_prompt(self, sample_results: List[Dict[str, Any]]) -> str:
+        sample_json = dumps_compact(sample_results)
+        return _CONTENT_ANALYSIS_PROMPT.format(sample_json=sample_json)
+    
+    def _build_converter_generation_prompt(self, content_analysis: Dict[str, Any], sample_json: Dict[str, Any], retry: bool = False) -> str:
+        """
+        Build the per-call part of the converter prompt; it is sent after
+        the static _CONVERTER_SPEC prefix
+        """
+        analysis_json = dumps_compact(content_analysis)
+        sample_json_str = dumps_compact(sample_json)
+        
+        prompt = _CONVERTER_DATA_PROMPT.format(
+            analysis_json=analysis_json,
+            sample_json_str=sample_json_str
+        )
+        
+        if retry:
+            # Add extra emphasis on syntax correctness for retry
+            prompt = prompt + _RETRY_WARNING
         
         return prompt
@@ -1,12 +1,76 @@
 import json
 import logging
-from typing import List, Dict, Any
-from openai import OpenAI
+from typing import List, Dict, Any, Optional
 from config import Settings
+from . import _llm_cache
+from ._clients import get_openai_sync
+from ._json import dumps_compact, extract_first_json_object, loads
 
 logger = logging.getLogger(__name__)
 
 
+_SYSTEM_PROMPT = """You are an orchestrator agent coordinating multiple AI agents to analyze HTML structures.
+Your role is to synthesize analysis results from different agents and make final decisions.
+You should identify common patterns across multiple HTML files and create a unified understanding."""
+
+_SCHEMA_SYSTEM_PROMPT = """You are generating a JSON schema that represents the structure of HTML content.
+The schema should include:
+1. XPath paths to key content sections
+2. Descriptions of what each section represents (e.g., "comments", "article body", "title")
+3. Patterns that identify similar elements
+4. Metadata about the structure
+
+Output must be valid JSON."""
+
+_COORDINATION_PROMPT = """Analyze the following HTML files and their analysis results:
+
+HTML Files: {html_files}
+
+Analysis Results:
+{analysis_results}
+
+Please synthesize these results and identify:
+1. Common structural patterns across all files
+2. Key content sections (title, body, comments, etc.)
+3. XPath patterns that work across multiple files
+4. Any inconsistencies or edge cases
+
+Return your analysis as JSON with the following structure:
+{{
+    "common_patterns": [...],
+    "content_sections": [...],
+    "xpath_patterns": [...],
+    "inconsistencies": [...]
+}}"""
+
+_SCHEMA_GENERATION_PROMPT = """Based on the following analysis data, generate a comprehensive JSON schema:
+
+{analysis_data}
+
+The schema should follow this structure:
+{{
+    "schema_version": "1.0",
+    "description": "Schema for extracting content from HTML pages",
+    "sections": [
+        {{
+            "name": "section_name",
+            "description": "What this section represents (e.g., 'comments', 'article body')",
+            "xpath": "xpath_expression",
+            "xpath_list": ["xpath1", "xpath2", ...],
+            "is_list": true/false,
+            "attributes": {{"key": "value"}},
+            "notes": "Additional notes"
+        }}
+    ],
+    "metadata": {{
+        "total_sections": number,
+        "extraction_notes": "..."
+    }}
+}}
+
+Ensure all XPath expressions are valid and can extract the intended content."""
+
+
 class Orchestrator:
     """
     Main orchestrator agent that coordinates multiple agents
@@ -14,17 +78,18 @@ class Orchestrator:
     """
     
     def __init__(self):
-        self.client = OpenAI(
-            api_key=Settings.OPENAI_API_KEY,
-            base_url=Settings.OPENAI_BASE_URL
-        )
+        self.client = get_openai_sync(Settings.OPENAI_API_KEY, Settings.OPENAI_BASE_URL)
         self.model = Settings.OPENAI_MODEL
-        
+    
     def coordinate_analysis(self, html_files: List[str], analysis_results: Dict[str, Any]) -> Dict[str, Any]:
         """
         Coordinate the analysis process and synthesize results
         """
         prompt = self._build_coordination_prompt(html_files, analysis_results)
+        cache_key = self._coordination_cache_key(prompt)
+        cached = _llm_cache.get(cache_key)
+        if cached is not None:
+            return loads(cached)
         
         response = self.client.chat.completions.create(
             model=self.model,
@@ -35,6 +100,16 @@ class Orchestrator:
             temperature=0.3
         )
         
+        return self._parse_coordination_response(response, cache_key)
+    
+    def _coordination_cache_key(self, prompt: str) -> str:
+        return _llm_cache.make_key("coordination", self.model, "0.3", _SYSTEM_PROMPT, prompt)
+    
+    def _parse_coordination_response(self, response, cache_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Parse a coordination response; responses that parse as JSON are
+        stored in the LLM cache under cache_key
+        """
         # Handle response - should be a ChatCompletion object
         if hasattr(response, 'choices') and len(response.choices) > 0:
             result = response.choices[0].message.content
@@ -42,10 +117,13 @@ class Orchestrator:
             logger.error(f"Unexpected response format: {type(response)}")
             return {"error": f"Unexpected response format: {type(response)}"}
         try:
-            return json.loads(result)
+            parsed = loads(result)
         except json.JSONDecodeError:
             logger.warning("Failed to parse JSON, returning raw result")
             return {"raw_result": result}
+        if cache_key is not None:
+            _llm_cache.put(cache_key, result)
+        return parsed
     
     def generate_final_schema(self, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -86,17 +164,12 @@ class Orchestrator:
             
             # Try to parse JSON
             try:
-                return json.loads(result)
+                return loads(result)
             except json.JSONDecodeError:
-                # Try to extract JSON from markdown code blocks
-                import re
-                json_match = re.search(r'```json\s*(\{.*?\})\s*```', result, re.DOTALL)
-                if json_match:
-                    return json.loads(json_match.group(1))
-                # Try to extract JSON directly
-                json_match = re.search(r'\{.*\}', result, re.DOTALL)
-                if json_match:
-                    return json.loads(json_match.group(0))
+                # Try to extract the JSON object (bare or inside a markdown code block)
+                json_text = extract_first_json_object(result)
+                if json_text:
+                    return loads(json_text)
                 logger.warning("Failed to parse JSON, returning raw result")
                 return {"raw_result": result, "error": "Failed to parse JSON"}
         except Exception as e:
@@ -104,67 +177,19 @@ class Orchestrator:
             return {"error": str(e)}
     
     def _get_system_prompt(self) -> str:
-        return """You are an orchestrator agent coordinating multiple AI agents to analyze HTML structures.
-Your role is to synthesize analysis results from different agents and make final decisions.
-You should identify common patterns across multiple HTML files and create a unified understanding."""
+        return _SYSTEM_PROMPT
     
     def _get_schema_system_prompt(self) -> str:
-        return """You are generating a JSON schema that represents the structure of HTML content.
-The schema should include:
-1. XPath paths to key content sections
-2. Descriptions of what each section represents (e.g., "comments", "article body", "title")
-3. Patterns that identify similar elements
-4. Metadata about the structure
-
-Output must be valid JSON."""
+        return _SCHEMA_SYSTEM_PROMPT
     
     def _build_coordination_prompt(self, html_files: List[str], analysis_results: Dict[str, Any]) -> str:
-        return f"""Analyze the following HTML files and their analysis results:
-
-HTML Files: {', '.join(html_files)}
-
-Analysis Results:
-{json.dumps(analysis_results, indent=2, ensure_ascii=False)}
-
-Please synthesize these results and identify:
-1. Common structural patterns across all files
-2. Key content sections (title, body, comments, etc.)
-3. XPath patterns that work across multiple files
-4. Any inconsistencies or edge cases
-
-Return your analysis as JSON with the following structure:
-{{
-    "common_patterns": [...],
-    "content_sections": [...],
-    "xpath_patterns": [...],
-    "inconsistencies": [...]
-}}"""
+        return _COORDINATION_PROMPT.format(
+            html_files=', '.join(html_files),
+            analysis_results=dumps_compact(analysis_results)
+        )
     
     def _build_schema_generation_prompt(self, analysis_data: Dict[str, Any]) -> str:
-        return f"""Based on the following analysis data, generate a comprehensive JSON schema:
-
-{json.dumps(analysis_data, indent=2, ensure_ascii=False)}
-
-The schema should follow this structure:
-{{
-    "schema_version": "1.0",
-    "description": "Schema for extracting content from HTML pages",
-    "sections": [
-        {{
-            "name": "section_name",
-            "description": "What this section represents (e.g., 'comments', 'article body')",
-            "xpath": "xpath_expression",
-            "xpath_list": ["xpath1", "xpath2", ...],
-            "is_list": true/false,
-            "attributes": {{"key": "value"}},
-            "notes": "Additional notes"
-        }}
-    ],
-    "metadata": {{
-        "total_sections": number,
-        "extraction_notes": "..."
-    }}
-}}
-
-Ensure all XPath expressions are valid and can extract the intended content."""
+        return _SCHEMA_GENERATION_PROMPT.format(
+            analysis_data=dumps_compact(analysis_data)
+        )
 
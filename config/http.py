@@ -0,0 +1,46 @@
+"""
+Shared HTTP client for API calls
+
+One httpx.Client (HTTP/2 when the optional 'h2' package is installed) is
+shared by every synchronous API client, so requests reuse pooled
+keep-alive connections instead of each client opening its own.
+"""
+import atexit
+import importlib.util
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Generous read timeout: code generation responses can take minutes
+HTTP_TIMEOUT_SECONDS = 300.0
+HTTP_CONNECT_TIMEOUT_SECONDS = 10.0
+HTTP_MAX_CONNECTIONS = 64
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 64
+
+
+def http_client_kwargs() -> dict:
+    """Keyword arguments shared by the sync and async httpx clients"""
+    import httpx
+
+    http2 = importlib.util.find_spec("h2") is not None
+    if not http2:
+        logger.debug("h2 package not installed, using HTTP/1.1 connection pooling")
+    return {
+        "http2": http2,
+        "timeout": httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+        "limits": httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+        ),
+        "follow_redirects": True,
+    }
+
+
+@lru_cache(maxsize=None)
+def get_http_client():
+    """Shared synchronous httpx client, closed at interpreter exit"""
+    import httpx
+    client = httpx.Client(**http_client_kwargs())
+    atexit.register(client.close)
+    return client
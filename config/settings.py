@@ -1,8 +1,89 @@
 import os
+import re
+from functools import lru_cache
 from pathlib import Path
-from dotenv import load_dotenv
+from typing import Callable, List, Optional, Tuple
 
-load_dotenv()
+try:
+    import fcntl
+except ImportError:
+    # Windows: 没有 fcntl，计数器读写不加锁
+    fcntl = None
+
+# 设置 SKIP_DOTENV=1 可跳过 .env 文件加载（环境变量已由部署环境直接提供时）
+if os.getenv('SKIP_DOTENV') != '1':
+    from dotenv import load_dotenv
+    load_dotenv()
+
+# output 目录下记录下一个流程编号的计数器文件
+FLOW_COUNTER_FILE = '.next_flow_id'
+
+# 流程文件夹名：flow{N}
+_FLOW_DIR_RE = re.compile(r'flow(\d+)')
+
+
+@lru_cache(maxsize=32)
+def _ensure_dir(path: Path) -> Path:
+    """创建目录（每个路径在进程内只创建一次）"""
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _list_flow_dirs(output_dir: Path) -> List[Tuple[int, Path]]:
+    """
+    列出 output 目录下的 flow 文件夹，按流程编号升序返回 (编号, 路径)
+    （os.scandir 的目录项自带文件类型，判断是否为目录不需要额外 stat）
+    """
+    flow_dirs = []
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            match = _FLOW_DIR_RE.fullmatch(entry.name)
+            if match and entry.is_dir():
+                flow_dirs.append((int(match.group(1)), Path(entry.path)))
+    flow_dirs.sort()
+    return flow_dirs
+
+
+def _scan_next_flow_id(output_dir: Path) -> int:
+    """
+    扫描 output 目录下已存在的 flow 文件夹，返回最大编号 + 1
+    （仅在计数器文件不存在时用于重建计数器）
+    """
+    flow_dirs = _list_flow_dirs(output_dir)
+    return flow_dirs[-1][0] + 1 if flow_dirs else 1
+
+
+def _update_flow_counter(output_dir: Path, update: Callable[[int], int]) -> int:
+    """
+    在文件锁内读取流程计数器，写回 update(当前值)
+    
+    Returns:
+        int: 更新前的计数器值
+    """
+    _ensure_dir(output_dir)
+    fd = os.open(output_dir / FLOW_COUNTER_FILE, os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        data = os.read(fd, 32).strip()
+        current = int(data) if data.isdigit() else _scan_next_flow_id(output_dir)
+        new = update(current)
+        if new != current or not data.isdigit():
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, str(new).encode())
+        return current
+    finally:
+        # 关闭文件描述符同时释放锁
+        os.close(fd)
+
+
+@lru_cache(maxsize=32)
+def _ensure_flow_dir(output_dir: Path, flow_id: int) -> Path:
+    """创建流程目录，并保证计数器不小于 flow_id + 1"""
+    flow_dir = _ensure_dir(output_dir / f'flow{flow_id}')
+    _update_flow_counter(output_dir, lambda n: max(n, flow_id + 1))
+    return flow_dir
 
 
 class Settings:
@@ -51,6 +132,17 @@ class Settings:
     else:
         OUTPUT_DIR = (DATA_DIR / 'output').resolve()
     
+    # 缓存目录（LLM 响应缓存等）
+    CACHE_DIR = Path(os.getenv('CACHE_DIR', DATA_DIR / 'cache')).resolve()
+    # 设置 LLM_CACHE_DISABLE=1 可关闭 LLM 响应缓存（每次都重新请求）
+    LLM_CACHE_DISABLE = os.getenv('LLM_CACHE_DISABLE', '0').lower() in ('1', 'true', 'yes')
+    
+    # 抽取结果输出格式：json（每个 HTML 一个 JSON 文件）或 jsonl（每批一个 JSON Lines 文件，适合大量文件）
+    EXTRACTION_OUTPUT_FORMAT = os.getenv('EXTRACTION_OUTPUT_FORMAT', 'json').lower()
+    
+    # Markdown 转换的并行进程数：0 表示使用 CPU 核数，1 表示在主进程中串行转换
+    CONVERSION_JOBS = int(os.getenv('CONVERSION_JOBS', '0'))
+    
     # 流程输出目录（支持多个流程，每个流程有独立的输出目录）
     # 格式：output/flow{N}/ 其中N为流程编号
     @classmethod
@@ -64,39 +156,41 @@ class Settings:
         Returns:
             Path: 流程输出目录路径
         """
-        flow_dir = cls.OUTPUT_DIR / f'flow{flow_id}'
-        flow_dir.mkdir(parents=True, exist_ok=True)
-        return flow_dir
+        return _ensure_flow_dir(cls.OUTPUT_DIR, flow_id)
     
     @classmethod
-    def get_next_flow_id(cls) -> int:
+    def get_next_flow_id(cls, allocate: bool = False) -> int:
         """
-        获取下一个可用的流程编号（自动递增）
-        扫描 output 目录下已存在的 flow 文件夹，返回下一个可用的编号
+        获取下一个可用的流程编号
+        读取 output 目录下的计数器文件；计数器不存在时扫描已有的 flow 文件夹重建
+        
+        Args:
+            allocate: 为 True 时在锁内分配该编号（计数器递增），并发运行不会拿到同一个编号；
+                为 False 时只查看编号（仅用于显示，不要据此创建流程目录）
         
         Returns:
             int: 下一个可用的流程编号
         """
+        if allocate:
+            return _update_flow_counter(cls.OUTPUT_DIR, lambda n: n + 1)
+        
         if not cls.OUTPUT_DIR.exists():
             return 1
         
-        # 扫描已存在的 flow 文件夹
-        existing_flows = []
-        for item in cls.OUTPUT_DIR.iterdir():
-            if item.is_dir() and item.name.startswith('flow'):
-                try:
-                    # 提取 flow 后面的数字
-                    flow_num = int(item.name[4:])  # 'flow' 是4个字符
-                    existing_flows.append(flow_num)
-                except ValueError:
-                    # 如果无法解析数字，跳过
-                    continue
+        return _update_flow_counter(cls.OUTPUT_DIR, lambda n: n)
+    
+    @classmethod
+    def list_flow_dirs(cls) -> List[Tuple[int, Path]]:
+        """
+        列出已存在的流程输出目录
         
-        if not existing_flows:
-            return 1
+        Returns:
+            List[Tuple[int, Path]]: (流程编号, 目录路径)，按编号升序
+        """
+        if not cls.OUTPUT_DIR.exists():
+            return []
         
-        # 返回最大的编号 + 1
-        return max(existing_flows) + 1
+        return _list_flow_dirs(cls.OUTPUT_DIR)
     
     @classmethod
     def get_next_flow_output_dir(cls) -> Path:
@@ -106,8 +200,7 @@ class Settings:
         Returns:
             Path: 下一个可用的流程输出目录路径
         """
-        next_flow_id = cls.get_next_flow_id()
-        return cls.get_flow_output_dir(next_flow_id)
+        return cls.get_flow_output_dir(cls.get_next_flow_id(allocate=True))
     
     # ==================== API配置 ====================
     # OpenAI settings
@@ -122,6 +215,11 @@ class Settings:
     # Use exactly as user configured, no modification
     ANTHROPIC_BASE_URL = os.getenv('ANTHROPIC_BASE_URL', 'https://api.anthropic.com')
     ANTHROPIC_MODEL = os.getenv('ANTHROPIC_MODEL', 'claude-3-5-sonnet-20241022')
+    # 分析模型的上下文窗口大小，以及为响应预留的 token 数（用于按 token 截断 HTML）
+    ANALYZER_CONTEXT_TOKENS = int(os.getenv('ANALYZER_CONTEXT_TOKENS', '200000'))
+    ANALYZER_MAX_OUTPUT_TOKENS = int(os.getenv('ANALYZER_MAX_OUTPUT_TOKENS', '16000'))
+    # 代码审查（validator）是否启用 Anthropic extended thinking，默认关闭
+    ENABLE_THINKING = os.getenv('ENABLE_THINKING', 'false').lower() in ('1', 'true', 'yes')
     
     # Vision settings - use same base_url as OpenAI
     VISION_API_KEY = os.getenv('VISION_API_KEY') or OPENAI_API_KEY
@@ -133,11 +231,24 @@ class Settings:
     # ==================== 其他配置 ====================
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     
+    # 并发调用 API 的最大请求数（用于批量分析多个文件）
+    MAX_CONCURRENCY = int(os.getenv('MAX_CONCURRENCY', '8'))
+    
+    # 视觉分析（Step 2）的最大并发数；每个调用都会启动一个无头浏览器，因此单独限制
+    VISUAL_CONCURRENCY = int(os.getenv('VISUAL_CONCURRENCY', '2'))
+    
+    # get_path_info / initialize_directories 的缓存状态
+    _path_info_cache: Optional[dict] = None
+    _dirs_initialized: bool = False
+    
     @classmethod
     def initialize_directories(cls) -> None:
         """
-        初始化并创建所有必需的目录结构
+        初始化并创建所有必需的目录结构（每个进程只执行一次）
         """
+        if cls._dirs_initialized:
+            return
+        
         directories = [
             cls.DATA_DIR,
             cls.INPUT_DIR,
@@ -150,6 +261,17 @@ class Settings:
         
         for directory in directories:
             directory.mkdir(parents=True, exist_ok=True)
+        cls._dirs_initialized = True
+    
+    @classmethod
+    def reset_cache(cls) -> None:
+        """
+        清除路径相关缓存（修改路径配置后调用）
+        """
+        cls._path_info_cache = None
+        cls._dirs_initialized = False
+        _ensure_dir.cache_clear()
+        _ensure_flow_dir.cache_clear()
     
     @classmethod
     def validate(cls) -> bool:
@@ -174,16 +296,19 @@ class Settings:
         Returns:
             dict: 路径配置字典
         """
-        return {
-            'project_root': str(cls.PROJECT_ROOT),
-            'data_dir': str(cls.DATA_DIR),
-            'input_dir': str(cls.INPUT_DIR),
-            'typical_dir': str(cls.TYPICAL_DIR),
-            'typical_urls_file': str(cls.TYPICAL_URLS_FILE),
-            'typical_html_dir': str(cls.TYPICAL_HTML_DIR),
-            'spread_dir': str(cls.SPREAD_DIR),
-            'spread_urls_file': str(cls.SPREAD_URLS_FILE),
-            'spread_html_dir': str(cls.SPREAD_HTML_DIR),
-            'output_dir': str(cls.OUTPUT_DIR),
-        }
+        if cls._path_info_cache is None:
+            cls._path_info_cache = {
+                'project_root': str(cls.PROJECT_ROOT),
+                'data_dir': str(cls.DATA_DIR),
+                'input_dir': str(cls.INPUT_DIR),
+                'typical_dir': str(cls.TYPICAL_DIR),
+                'typical_urls_file': str(cls.TYPICAL_URLS_FILE),
+                'typical_html_dir': str(cls.TYPICAL_HTML_DIR),
+                'spread_dir': str(cls.SPREAD_DIR),
+                'spread_urls_file': str(cls.SPREAD_URLS_FILE),
+                'spread_html_dir': str(cls.SPREAD_HTML_DIR),
+                'output_dir': str(cls.OUTPUT_DIR),
+                'cache_dir': str(cls.CACHE_DIR),
+            }
+        return dict(cls._path_info_cache)
 
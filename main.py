@@ -3,22 +3,669 @@
 Main entry point for HTML Agent Analysis System
 """
 import os
-import json
+import sys
+import mmap
+import queue
+import types
+import pickle
+import hashlib
+import inspect
+import traceback
 import logging
 import argparse
+import threading
+import itertools
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from functools import lru_cache, partial
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator, Union, get_args, get_origin, get_type_hints
+from lxml import etree, html as lxml_html
 from config import Settings
 
 from agents import Orchestrator, AnalyzerAgent, CodeGeneratorAgent, CodeValidatorAgent, MarkdownConverterAgent
 from utils import HTMLParser, VisualAnalyzer, URLDownloader
 from utils.logger import setup_logging
+from utils import json_utils
 from utils.checkpoint import CheckpointManager
+from utils.code_fixer import compile_error, fix_markdown_converter_syntax
 
 # Setup beautiful logging
 logger = setup_logging(log_dir="logs", level=Settings.LOG_LEVEL)
 
 
+def _write_json(path: Path, obj: Any) -> None:
+    """Write obj to path as indented UTF-8 JSON"""
+    Path(path).write_bytes(json_utils.dumps(obj, indent=True))
+
+
+class _FilenameCharTable(dict):
+    """
+    str.translate table mapping characters not allowed in result JSON
+    filenames to '_' (allowed: word characters as in regex \\w, '-' and '.')
+    
+    Entries are filled in on first lookup, so non-ASCII names work too.
+    """
+    def __missing__(self, code: int) -> int:
+        char = chr(code)
+        self[code] = code if char.isalnum() or char in '_-.' else ord('_')
+        return self[code]
+
+
+_FILENAME_TABLE = _FilenameCharTable()
+
+# Extractors built by _worker_extractor, one per code path and version
+# (mtime_ns, size) in each worker process
+_worker_extractors: Dict[Tuple[str, Tuple[int, int]], Any] = {}
+
+# Extraction batching: aim for this many batches per worker (for load
+# balancing), with at most EXTRACTION_MAX_BATCH files per batch
+EXTRACTION_BATCHES_PER_WORKER = 4
+EXTRACTION_MAX_BATCH = 256
+
+# Encoded results waiting for the batch writer thread (bounds memory when
+# the disk is slower than extraction)
+EXTRACTION_WRITE_QUEUE_SIZE = 64
+
+# HTML files the batch reader thread may read ahead of extraction
+EXTRACTION_PREFETCH_SIZE = 8
+
+# Result JSON files at least this large are memory-mapped when loaded
+JSON_MMAP_THRESHOLD = 4 * 1024 * 1024
+
+# Extraction results in 'jsonl' output format: one file per batch, one
+# {"file": <result JSON filename>, "result": {...}} record per line
+EXTRACTION_JSONL_PATTERN = 'results-{:06d}.jsonl'
+
+# Converters built by _worker_converter, one per code path in each worker process
+_worker_converters: Dict[str, Any] = {}
+
+# Fewer extraction results than this are converted to Markdown in-process
+CONVERSION_MIN_PARALLEL = 4
+
+# Extraction results sent to a conversion worker per round-trip
+CONVERSION_CHUNK_SIZE = 8
+
+
+def _result_filename(file_name: str) -> str:
+    """
+    Result JSON filename for an HTML file: .html/.htm replaced by .json,
+    invalid characters replaced by '_'
+    """
+    return f"{file_name.removesuffix('.html').removesuffix('.htm')}.json".translate(_FILENAME_TABLE)
+
+
+def _load_extraction_module(code_path: str) -> Any:
+    """
+    Import generated extraction code from code_path
+    
+    The module is registered in sys.modules (generated code using e.g.
+    dataclasses needs that) under a name unique to code_path, so code
+    loaded from different paths never replaces each other's module.
+    """
+    module_name = f"extraction_code_{hashlib.sha256(code_path.encode('utf-8')).hexdigest()[:12]}"
+    spec = importlib.util.spec_from_file_location(module_name, code_path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Failed to load extraction code from {code_path}")
+    
+    extraction_module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = extraction_module
+    spec.loader.exec_module(extraction_module)
+    return extraction_module
+
+
+@lru_cache(maxsize=64)
+def _validate_extractor(code_path: str, mtime_ns: int, size: int) -> Tuple[Any, Tuple[str, ...]]:
+    """
+    Load generated extraction code and check it follows the HTMLExtractor interface
+    
+    Cached by path, mtime and size, so re-running extraction on unchanged
+    code skips the import and signature checks. Failures are not cached.
+    
+    Returns:
+        (extraction module, names of extract()'s parameters)
+    """
+    extraction_module = _load_extraction_module(code_path)
+    
+    # Strictly follow the required interface
+    # 1. Must have HTMLExtractor class
+    if not hasattr(extraction_module, 'HTMLExtractor'):
+        raise ValueError("Generated code MUST define 'HTMLExtractor' class. Found classes: " + 
+                       str([name for name in dir(extraction_module) if isinstance(getattr(extraction_module, name, None), type)]))
+    extractor_class = extraction_module.HTMLExtractor
+    
+    # 2. Must have schema parameter in __init__
+    init_signature = inspect.signature(extractor_class.__init__)
+    init_params = list(init_signature.parameters.keys())
+    
+    if 'schema' not in init_params:
+        raise ValueError(f"HTMLExtractor.__init__ MUST accept 'schema' parameter. Found parameters: {init_params}")
+    
+    # 3. Must have extract method (exact name, not extract_from_string, etc.)
+    if not hasattr(extractor_class, 'extract'):
+        available_methods = [name for name in dir(extractor_class) if not name.startswith('_') and callable(getattr(extractor_class, name))]
+        raise ValueError(f"HTMLExtractor MUST have 'extract' method. Found methods: {available_methods}")
+    
+    # 4. Verify extract method signature
+    extract_sig = inspect.signature(extractor_class.extract)
+    extract_params = list(extract_sig.parameters.keys())
+    
+    # Must have html_content or file_path parameter
+    if 'html_content' not in extract_params and 'file_path' not in extract_params:
+        raise ValueError(f"extract() method MUST accept 'html_content' or 'file_path' parameter. Found parameters: {extract_params}")
+    
+    # Must return Dict[str, Any]
+    if extract_sig.return_annotation == inspect.Signature.empty:
+        raise ValueError("extract() method MUST have return type annotation: -> Dict[str, Any]")
+    
+    return_type_str = str(extract_sig.return_annotation)
+    if 'Dict' not in return_type_str and 'dict' not in return_type_str.lower():
+        raise ValueError(f"extract() method MUST return Dict[str, Any]. Found return type: {return_type_str}")
+    
+    return extraction_module, tuple(extract_params)
+
+
+def _parse_html_tree(html_content: str) -> Optional[etree._Element]:
+    """Parse html_content with lxml.html, or return None if it can't be parsed"""
+    try:
+        return lxml_html.fromstring(html_content.encode('utf-8'), parser=lxml_html.HTMLParser(encoding='utf-8'))
+    except (etree.LxmlError, ValueError) as e:
+        logger.debug(f"Could not pre-parse HTML: {e}")
+        return None
+
+
+def _worker_extractor(code_path: str, code_version: Tuple[int, int], schema: Dict[str, Any]) -> Any:
+    """
+    HTMLExtractor for code_path in this worker process
+    
+    The extraction module is loaded (and the extractor instantiated) once
+    per process and code version, and reused for every batch. Only for
+    worker processes: each runs one batch at a time, so the extractor is
+    never called concurrently.
+    """
+    key = (code_path, code_version)
+    extractor = _worker_extractors.get(key)
+    if extractor is None:
+        extractor = _load_extraction_module(code_path).HTMLExtractor(schema=schema)
+        _worker_extractors[key] = extractor
+    return extractor
+
+
+def _load_html(html_file: Dict[str, str], pass_path: bool = False) -> Dict[str, str]:
+    """
+    Return html_file with its 'content' read from 'path'
+    
+    Entries that already carry content, have no path, or (pass_path) are
+    read by the extractor itself are returned unchanged. A failed read is
+    recorded as 'read_error' instead of raising.
+    """
+    file_path = html_file.get('path', '')
+    if html_file.get('content') or not file_path or pass_path:
+        return html_file
+    try:
+        return {**html_file, 'content': HTMLParser.read_html_file(file_path)}
+    except Exception as e:
+        logger.warning(f"Failed to read {file_path}: {e}")
+        return {**html_file, 'read_error': str(e)}
+
+
+def _extract_one(html_file: Dict[str, str], extract: Callable[..., Any], results_dir: Path,
+                 write_queue: Optional[queue.Queue] = None, pass_tree: bool = False,
+                 pass_path: bool = False, jsonl: bool = False) -> Dict[str, Any]:
+    """
+    Run the generated extractor on one HTML file and save its result JSON
+    
+    HTML is read from html_file['path'] unless html_file carries its 'content'
+    (or pass_path is set, in which case the extractor reads the file itself).
+    
+    Args:
+        extract: The extractor's bound extract method
+        write_queue: If given, the encoded result is handed to the batch
+            writer thread instead of being written here
+        pass_tree: extract() accepts parsed_tree; the HTML is parsed once
+            with lxml.html and passed in so the extractor need not parse it
+        pass_path: extract() only accepts file_path; files are not read
+            here but passed to the extractor by path
+        jsonl: Encode the result as a JSON Lines record for the batch file
+            (requires write_queue)
+    
+    Returns:
+        Summary entry for the file ('status' is 'success' or 'failed')
+    """
+    html_file = _load_html(html_file, pass_path)
+    html_content = html_file.get('content', '')
+    file_path = html_file.get('path', '')
+    file_name = html_file.get('name', 'unknown')
+    read_by_extractor = pass_path and not html_content and bool(file_path)
+    
+    if 'read_error' in html_file:
+        return {
+            'file': file_name,
+            'path': file_path,
+            'status': 'failed',
+            'error': f"Failed to read file: {html_file['read_error']}"
+        }
+    
+    if not html_content and not read_by_extractor:
+        logger.warning(f"No HTML content for {file_name}")
+        return {
+            'file': file_name,
+            'path': file_path,
+            'status': 'failed',
+            'error': 'No HTML content available'
+        }
+    
+    try:
+        # Extract content using the generated code
+        # Strictly follow the interface: extract(html_content=...) or extract(file_path=...)
+        tree = _parse_html_tree(html_content) if pass_tree else None
+        if read_by_extractor:
+            result = extract(file_path=file_path)
+        elif tree is not None:
+            result = extract(html_content=html_content, parsed_tree=tree)
+        else:
+            result = extract(html_content=html_content)
+        
+        # Result must be Dict[str, Any]
+        if not isinstance(result, dict):
+            raise TypeError(f"extract() method MUST return Dict[str, Any], got {type(result)}")
+        
+        # Save individual result JSON file to results directory
+        json_filename = _result_filename(file_name)
+        result_path = results_dir / json_filename
+        if jsonl:
+            data = json_utils.dumps({'file': json_filename, 'result': result})
+        else:
+            data = json_utils.dumps(result, indent=True)
+        entry = {
+            'file': file_name,
+            'path': file_path,
+            'status': 'success',
+            'result_file': json_filename
+        }
+        if write_queue is None:
+            result_path.write_bytes(data)
+        else:
+            write_queue.put((entry, result_path, data))
+        
+        logger.info(f"Successfully extracted {file_name} -> extraction_results/{json_filename}")
+        return entry
+    except Exception as e:
+        logger.error(f"Failed to extract content from {file_name}: {e}")
+        return {
+            'file': file_name,
+            'path': file_path,
+            'status': 'failed',
+            'error': str(e)
+        }
+
+
+def _json_writer(write_queue: queue.Queue, jsonl_path: Optional[Path] = None) -> None:
+    """
+    Write (entry, path, data) items from write_queue until a None sentinel
+    
+    Each result is written to its own file at path or, with jsonl_path,
+    appended as one line of that file (the entry records 'jsonl_file' and
+    the line's byte 'offset'). A failed write marks the file's summary
+    entry as failed.
+    """
+    jsonl_file = None
+    try:
+        while True:
+            item = write_queue.get()
+            if item is None:
+                return
+            entry, path, data = item
+            try:
+                if jsonl_path is None:
+                    path.write_bytes(data)
+                else:
+                    if jsonl_file is None:
+                        jsonl_file = open(jsonl_path, 'wb')
+                    offset = jsonl_file.tell()
+                    jsonl_file.write(data)
+                    jsonl_file.write(b'\n')
+                    entry['jsonl_file'] = jsonl_path.name
+                    entry['offset'] = offset
+            except OSError as e:
+                logger.error(f"Failed to save result for {entry['file']}: {e}")
+                entry.pop('result_file', None)
+                entry['status'] = 'failed'
+                entry['error'] = f"Failed to write result: {str(e)}"
+    finally:
+        if jsonl_file is not None:
+            jsonl_file.close()
+
+
+def _html_reader(html_files: List[Dict[str, str]], pass_path: bool,
+                 read_queue: queue.Queue, stop: threading.Event) -> None:
+    """Put _load_html(html_file) for each file on read_queue, in order, until stopped"""
+    for html_file in html_files:
+        if stop.is_set():
+            return
+        read_queue.put(_load_html(html_file, pass_path))
+
+
+def _extract_batch(html_files: List[Dict[str, str]], code_path: str, code_version: Tuple[int, int],
+                   schema: Dict[str, Any], results_dir: str, pass_tree: bool = False, pass_path: bool = False,
+                   jsonl_name: Optional[str] = None, in_thread: bool = False) -> List[Dict[str, Any]]:
+    """
+    Run _extract_one on a batch of HTML files, returning their summary entries in order
+    
+    code_version is the code file's (mtime_ns, size). With jsonl_name, the
+    batch's results go to that one JSON Lines file in results_dir instead
+    of one JSON file each. With in_thread (thread pool fallback), the batch
+    gets its own extractor, so extractors keeping per-call state on self
+    are never shared between threads.
+    
+    The batch runs as a three-stage pipeline: a reader thread reads files
+    ahead of extraction, extraction runs here, and a writer thread saves
+    the results, so file reads and writes overlap extraction.
+    """
+    try:
+        if in_thread:
+            extraction_module = _validate_extractor(code_path, *code_version)[0]
+            extract = extraction_module.HTMLExtractor(schema=schema).extract
+        else:
+            extract = _worker_extractor(code_path, code_version, schema).extract
+    except Exception as e:
+        logger.error(f"Failed to load extractor from {code_path}: {e}")
+        return [{
+            'file': html_file.get('name', 'unknown'),
+            'path': html_file.get('path', ''),
+            'status': 'failed',
+            'error': str(e)
+        } for html_file in html_files]
+    
+    results_path = Path(results_dir)
+    read_queue = queue.Queue(maxsize=EXTRACTION_PREFETCH_SIZE)
+    stop_reading = threading.Event()
+    reader = threading.Thread(target=_html_reader, args=(html_files, pass_path, read_queue, stop_reading), daemon=True)
+    write_queue = queue.Queue(maxsize=EXTRACTION_WRITE_QUEUE_SIZE)
+    jsonl_path = results_path / jsonl_name if jsonl_name else None
+    writer = threading.Thread(target=_json_writer, args=(write_queue, jsonl_path), daemon=True)
+    reader.start()
+    writer.start()
+    try:
+        return [_extract_one(read_queue.get(), extract, results_path, write_queue, pass_tree, pass_path, jsonl_path is not None) for _ in html_files]
+    finally:
+        # If extraction stopped early, unblock the reader so it can exit
+        stop_reading.set()
+        while reader.is_alive():
+            try:
+                read_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        # Entries are only final once every queued write has finished
+        write_queue.put(None)
+        writer.join()
+
+
+def _read_json_file(path: Path) -> Any:
+    """
+    Load a JSON file
+    
+    The raw bytes are parsed directly (no text decoding pass); files of
+    JSON_MMAP_THRESHOLD bytes or more are memory-mapped instead of read.
+    """
+    with open(path, 'rb') as f:
+        if json_utils.ORJSON_AVAILABLE and os.fstat(f.fileno()).st_size >= JSON_MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                return json_utils.loads(view)
+        return json_utils.loads(f.read())
+
+
+def _iter_extraction_results(results_dir: Path) -> Iterator[Tuple[str, Callable[[], Any]]]:
+    """
+    Yield (result JSON filename, loader) for every extraction result in results_dir
+    
+    Per-file results (*.json) are read when loader() is called; JSON Lines
+    batch files (*.jsonl) are streamed, skipping unreadable lines.
+    """
+    for json_file in results_dir.glob('*.json'):
+        yield json_file.name, partial(_read_json_file, json_file)
+    
+    for jsonl_file in sorted(results_dir.glob('*.jsonl')):
+        with open(jsonl_file, 'rb') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json_utils.loads(line)
+                    json_name = record['file']
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Skipping unreadable record {jsonl_file.name}:{line_number}: {e}")
+                    continue
+                yield json_name, partial(record.get, 'result')
+
+
+def _load_converter_module(code_path: str) -> Any:
+    """
+    Import generated markdown converter code from code_path
+    
+    Registered in sys.modules under a name unique to code_path, like
+    _load_extraction_module, so cached converters from different paths
+    never replace each other's module.
+    """
+    module_name = f"markdown_converter_{hashlib.sha256(code_path.encode('utf-8')).hexdigest()[:12]}"
+    spec = importlib.util.spec_from_file_location(module_name, code_path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Failed to load markdown converter code from {code_path}")
+    
+    converter_module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = converter_module
+    spec.loader.exec_module(converter_module)
+    return converter_module
+
+
+def _annotation_includes_str(func: Callable[..., Any], annotation: Any) -> bool:
+    """
+    True if func's return annotation is str, or a Union including str
+    (Optional[str], str | None, ...)
+    
+    String annotations (e.g. under `from __future__ import annotations`)
+    are resolved first; ones that can't be resolved fall back to
+    looking for 'str' in the text.
+    """
+    if isinstance(annotation, str):
+        try:
+            annotation = get_type_hints(func).get('return', annotation)
+        except Exception:
+            return 'str' in annotation
+    if annotation is str:
+        return True
+    return get_origin(annotation) in (Union, types.UnionType) and str in get_args(annotation)
+
+
+@lru_cache(maxsize=64)
+def _validate_converter(code_path: str, mtime_ns: int, size: int) -> Any:
+    """
+    Load generated markdown converter code and check it follows the MarkdownConverter interface
+    
+    Cached by path, mtime and size, like _validate_extractor. Failures
+    are not cached.
+    
+    Returns:
+        The MarkdownConverter class
+    """
+    converter_module = _load_converter_module(code_path)
+    
+    # Strictly follow the required interface
+    # 1. Must have MarkdownConverter class
+    if not hasattr(converter_module, 'MarkdownConverter'):
+        raise ValueError("Generated code MUST define 'MarkdownConverter' class. Found classes: " + 
+                       str([name for name in dir(converter_module) if isinstance(getattr(converter_module, name, None), type)]))
+    converter_class = converter_module.MarkdownConverter
+    
+    # 2. Verify __init__ signature (should have no required parameters)
+    init_signature = inspect.signature(converter_class.__init__)
+    init_params = [p for p in init_signature.parameters.keys() if p != 'self']
+    if init_params:
+        # Check if all params have defaults
+        for param_name in init_params:
+            param = init_signature.parameters[param_name]
+            if param.default == inspect.Parameter.empty:
+                raise ValueError(f"MarkdownConverter.__init__() MUST have no required parameters. Found: {init_params}")
+    
+    # 3. Must have convert method (exact name)
+    if not hasattr(converter_class, 'convert'):
+        available_methods = [name for name in dir(converter_class) if not name.startswith('_') and callable(getattr(converter_class, name))]
+        raise ValueError(f"MarkdownConverter MUST have 'convert' method. Found methods: {available_methods}")
+    
+    # 4. Verify convert method signature
+    convert_sig = inspect.signature(converter_class.convert)
+    convert_params = list(convert_sig.parameters.keys())
+    
+    # Must have json_data parameter
+    if 'json_data' not in convert_params:
+        raise ValueError(f"convert() method MUST accept 'json_data' parameter. Found parameters: {convert_params}")
+    
+    # Must return str
+    if convert_sig.return_annotation == inspect.Signature.empty:
+        raise ValueError("convert() method MUST have return type annotation: -> str")
+    
+    if not _annotation_includes_str(converter_class.convert, convert_sig.return_annotation):
+        # Allow Optional[str] or Union[str, ...] but must include str
+        raise ValueError(f"convert() method MUST return str. Found return type: {convert_sig.return_annotation}")
+    
+    return converter_class
+
+
+def _new_converter(converter_class: Any) -> Any:
+    """
+    Instantiate a MarkdownConverter, calling its optional warmup() method
+    
+    warmup() lets a converter compile regexes/templates before the first
+    convert() call instead of lazily on it.
+    """
+    converter = converter_class()
+    warmup = getattr(converter, 'warmup', None)
+    if callable(warmup):
+        warmup()
+    return converter
+
+
+def _worker_converter(code_path: str) -> Any:
+    """
+    MarkdownConverter for code_path in this worker process
+    
+    The converter module is imported in the worker rather than pickled,
+    once per process, and the converter reused for every result.
+    """
+    converter = _worker_converters.get(code_path)
+    if converter is None:
+        converter = _new_converter(_load_converter_module(code_path).MarkdownConverter)
+        _worker_converters[code_path] = converter
+    return converter
+
+
+def _convert_one(json_name: str, load_result: Callable[[], Any], convert: Callable[..., Any],
+                 markdown_output_dir: Path) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    Convert one extraction result to Markdown and save it
+    
+    Returns:
+        (result JSON filename, Markdown filename or None, error or None);
+        plain tuples are cheaper than dicts to send back from workers, and
+        summary entries are built from them only when the summary is written
+    """
+    try:
+        # Load JSON
+        json_data = load_result()
+        
+        # Convert to Markdown
+        # Strictly follow the interface: convert(json_data=...)
+        markdown_content = convert(json_data=json_data)
+        
+        # Result must be str
+        if not isinstance(markdown_content, str):
+            raise TypeError(f"convert() method MUST return str, got {type(markdown_content)}")
+        
+        # Generate markdown filename
+        markdown_filename = Path(json_name).stem + '.md'
+        markdown_path = markdown_output_dir / markdown_filename
+        
+        # Save Markdown file: encoded once and written in a single call,
+        # bypassing the text layer's buffering (no flush/fsync needed)
+        markdown_path.write_bytes(markdown_content.encode('utf-8'))
+        
+        logger.info(f"Successfully converted {json_name} to {markdown_filename}")
+        return json_name, markdown_filename, None
+    except Exception as e:
+        logger.error(f"Failed to convert {json_name}: {e}")
+        return json_name, None, str(e)
+
+
+def _convert_in_worker(extraction_result: Tuple[str, Callable[[], Any]], code_path: str,
+                       markdown_output_dir: str) -> Tuple[str, Optional[str], Optional[str]]:
+    """_convert_one for a (result JSON filename, loader) pair, run in a worker process"""
+    json_name, load_result = extraction_result
+    try:
+        convert = _worker_converter(code_path).convert
+    except Exception as e:
+        logger.error(f"Failed to load markdown converter from {code_path}: {e}")
+        return json_name, None, str(e)
+    return _convert_one(json_name, load_result, convert, Path(markdown_output_dir))
+
+
+def _analyze_files_concurrently(analyze: Callable[[str, str], Dict[str, Any]], html_files: List[Dict[str, str]],
+                                file_identifiers: List[str], concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Call analyze(content, file identifier) for every HTML file, returning the results in input order
+    
+    The calls are latency-bound API requests, so they run on a thread pool
+    of up to concurrency threads (default Settings.MAX_CONCURRENCY).
+    """
+    max_workers = max(1, min(concurrency or Settings.MAX_CONCURRENCY or 8, len(html_files)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(
+            lambda html_file, file_identifier: analyze(html_file['content'], file_identifier),
+            html_files, file_identifiers
+        ))
+
+
+# Marker file in a Step 5 flow directory whose extraction code is the
+# fallback template (code generation failed), so the next run regenerates it
+FALLBACK_CODE_MARKER = '.fallback'
+
+# Checkpoint step -> key of the pipeline step it completes (completed_steps)
+CHECKPOINT_STEP_KEYS = {
+    'text_analysis': 'step1',
+    'visual_analysis': 'step2',
+    'synthesized': 'step3',
+    'schema': 'step4',
+    'code': 'step5',
+}
+
+# Checkpoint step -> (data fields restored when resuming from it, description),
+# in pipeline order; later steps' checkpoints also carry the data of every earlier step
+CHECKPOINT_STEP_FIELDS = {
+    'text_analysis': (('analysis_results',), 'text analysis results'),
+    'visual_analysis': (('visual_results', 'analysis_results'), 'visual analysis results'),
+    'synthesized': (('synthesized', 'analysis_results', 'visual_results'), 'synthesized results'),
+    'schema': (('schema', 'synthesized', 'analysis_results', 'visual_results'), 'schema'),
+    'code_generated': (('code', 'schema', 'synthesized', 'analysis_results', 'visual_results'), 'generated code'),
+    'code_validated': (('code', 'schema', 'synthesized', 'analysis_results', 'visual_results'), 'validated code'),
+    'code': (('code', 'schema', 'synthesized', 'analysis_results', 'visual_results'), 'validated code'),
+}
+
+# Pipeline position of each resumable checkpoint step
+CHECKPOINT_STEP_RANK = {step: rank for rank, step in enumerate(CHECKPOINT_STEP_FIELDS)}
+
+
+def _load_checkpoint_index(flow_dirs: List[Tuple[int, Path]]) -> Dict[int, Dict[str, Any]]:
+    """
+    Checkpoint of every flow directory in flow_dirs, keyed by flow id
+    
+    Read once per run, so the resume logic of each step looks checkpoints
+    up here instead of re-scanning the output directory and re-reading the JSON.
+    """
+    checkpoint_index = {}
+    for flow_num, flow_dir in flow_dirs:
+        checkpoint = CheckpointManager(flow_dir).load_checkpoint()
+        if checkpoint:
+            checkpoint_index[flow_num] = checkpoint
+    return checkpoint_index
+
+
 class HTMLAgentSystem:
     """
     Main system that coordinates all agents for HTML analysis
@@ -138,6 +785,8 @@ class HTMLAgentSystem:
            
         3. Input/Output:
            - Input: html_content (str) OR file_path (str), at least one must be provided
+           - If extract() also accepts 'parsed_tree', it receives html_content
+             already parsed with lxml.html.fromstring
            - Output: Dict[str, Any] with extracted data, keys are section names from schema
            
         4. Schema Constant (Optional but Recommended):
@@ -156,10 +805,6 @@ class HTMLAgentSystem:
                 return {"section1": value1, "section2": value2, ...}
         ```
         """
-        import importlib.util
-        import sys
-        from typing import Optional
-        
         # Check spread directory for HTML files or URLs
         spread_html_dir = Settings.SPREAD_HTML_DIR
         spread_urls_file = Settings.SPREAD_URLS_FILE
@@ -168,8 +813,8 @@ class HTMLAgentSystem:
         
         # Check if HTML files exist
         if spread_html_dir.exists() and any(spread_html_dir.iterdir()):
-            # Load existing HTML files
-            html_files = HTMLParser.load_html_files(str(spread_html_dir))
+            # List existing HTML files; the extraction workers read them
+            html_files = HTMLParser.list_html_files(str(spread_html_dir))
             html_files_to_process = html_files
             logger.info(f"Found {len(html_files_to_process)} HTML files in spread/html directory")
         elif spread_urls_file.exists():
@@ -202,165 +847,92 @@ class HTMLAgentSystem:
         
         # Load and execute the generated code
         try:
-            # Load the extraction code module
-            spec = importlib.util.spec_from_file_location("extraction_code", code_path)
-            if spec is None or spec.loader is None:
-                raise ImportError(f"Failed to load extraction code from {code_path}")
-            
-            extraction_module = importlib.util.module_from_spec(spec)
-            sys.modules['extraction_code'] = extraction_module
-            spec.loader.exec_module(extraction_module)
-            
-            # Strictly follow the required interface
-            # 1. Must have HTMLExtractor class
-            if not hasattr(extraction_module, 'HTMLExtractor'):
-                raise ValueError("Generated code MUST define 'HTMLExtractor' class. Found classes: " + 
-                               str([name for name in dir(extraction_module) if isinstance(getattr(extraction_module, name, None), type)]))
+            # Load and validate the extraction code module (cached per file version)
+            code_stat = code_path.stat()
+            code_version = (code_stat.st_mtime_ns, code_stat.st_size)
+            extraction_module, extract_params = _validate_extractor(str(code_path), *code_version)
             
-            # 2. Must have schema parameter in __init__
-            import inspect
-            init_signature = inspect.signature(extraction_module.HTMLExtractor.__init__)
-            init_params = list(init_signature.parameters.keys())
+            # Extractors without html_content are given file paths and read the
+            # files themselves. Extractors that take html_content keep getting
+            # it decoded here (their file_path branch may guess the encoding
+            # differently); those that also accept parsed_tree get an lxml tree
+            pass_path = 'html_content' not in extract_params
+            pass_tree = 'parsed_tree' in extract_params and not pass_path
             
-            if 'schema' not in init_params:
-                raise ValueError(f"HTMLExtractor.__init__ MUST accept 'schema' parameter. Found parameters: {init_params}")
-            
-            # 3. Get schema (prefer module SCHEMA constant, fallback to passed schema)
+            # Get schema (prefer module SCHEMA constant, fallback to passed schema)
             if hasattr(extraction_module, 'SCHEMA'):
                 schema_to_use = extraction_module.SCHEMA
             else:
                 schema_to_use = json_schema
             
-            # 4. Instantiate extractor with schema
-            extractor = extraction_module.HTMLExtractor(schema=schema_to_use)
-            
-            # 5. Must have extract method (exact name, not extract_from_string, etc.)
-            if not hasattr(extractor, 'extract'):
-                available_methods = [name for name in dir(extractor) if not name.startswith('_') and callable(getattr(extractor, name))]
-                raise ValueError(f"HTMLExtractor MUST have 'extract' method. Found methods: {available_methods}")
-            
-            # 6. Verify extract method signature
-            extract_method = getattr(extractor, 'extract')
-            extract_sig = inspect.signature(extract_method)
-            extract_params = list(extract_sig.parameters.keys())
-            
-            # Must have html_content or file_path parameter
-            if 'html_content' not in extract_params and 'file_path' not in extract_params:
-                raise ValueError(f"extract() method MUST accept 'html_content' or 'file_path' parameter. Found parameters: {extract_params}")
-            
-            # Must return Dict[str, Any]
-            if extract_sig.return_annotation == inspect.Signature.empty:
-                raise ValueError("extract() method MUST have return type annotation: -> Dict[str, Any]")
-            
-            return_type_str = str(extract_sig.return_annotation)
-            if 'Dict' not in return_type_str and 'dict' not in return_type_str.lower():
-                raise ValueError(f"extract() method MUST return Dict[str, Any]. Found return type: {return_type_str}")
-            
-            extract_func = extract_method
+            # Instantiate extractor with schema (fails early if __init__ rejects it)
+            extraction_module.HTMLExtractor(schema=schema_to_use)
             
             # Create results directory for extraction results
             results_dir = output_dir / 'extraction_results'
             results_dir.mkdir(parents=True, exist_ok=True)
             logger.info(f"Created results directory: {results_dir}")
             
-            # Process each HTML file and save individual JSON files
-            results_summary = []
-            processed_count = 0
-            failed_count = 0
+            # Results of an earlier run (in either output format) would
+            # otherwise be read alongside the new ones by the Markdown step
+            jsonl = Settings.EXTRACTION_OUTPUT_FORMAT == 'jsonl'
+            for pattern in ('*.json', '*.jsonl'):
+                for stale_file in results_dir.glob(pattern):
+                    stale_file.unlink()
             
+            # Process HTML files in parallel, one task per file. Workers read
+            # the files themselves, so only path/name/url are sent to them
+            tasks = []
             for html_file in html_files_to_process:
-                html_content = html_file.get('content', '')
-                file_path = html_file.get('path', '')
-                file_name = html_file.get('name', 'unknown')
-                
-                if not html_content and file_path:
-                    # Try to read from file
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            html_content = f.read()
-                    except Exception as e:
-                        logger.warning(f"Failed to read {file_path}: {e}")
-                        failed_count += 1
-                        results_summary.append({
-                            'file': file_name,
-                            'path': file_path,
-                            'status': 'failed',
-                            'error': f"Failed to read file: {str(e)}"
-                        })
-                        continue
-                
-                if not html_content:
-                    logger.warning(f"No HTML content for {file_name}")
-                    failed_count += 1
-                    results_summary.append({
-                        'file': file_name,
-                        'path': file_path,
-                        'status': 'failed',
-                        'error': 'No HTML content available'
-                    })
-                    continue
-                
-                try:
-                    # Extract content using the generated code
-                    # Strictly follow the interface: extract(html_content=..., file_path=...)
-                    if html_content:
-                        result = extractor.extract(html_content=html_content)
-                    elif file_path:
-                        result = extractor.extract(file_path=file_path)
-                    else:
-                        raise ValueError("Either html_content or file_path must be provided")
-                    
-                    # Result must be Dict[str, Any]
-                    if not isinstance(result, dict):
-                        raise TypeError(f"extract() method MUST return Dict[str, Any], got {type(result)}")
-                    
-                    # Generate JSON filename from HTML filename
-                    # Remove .html extension and add .json
-                    json_filename = file_name.rsplit('.html', 1)[0] if file_name.endswith('.html') else file_name
-                    json_filename = json_filename.rsplit('.htm', 1)[0] if json_filename.endswith('.htm') else json_filename
-                    json_filename = f"{json_filename}.json"
-                    
-                    # Clean filename to remove invalid characters
-                    import re
-                    json_filename = re.sub(r'[^\w\-_\.]', '_', json_filename)
-                    
-                    # Save individual result JSON file to results directory
-                    individual_result_path = results_dir / json_filename
-                    with open(individual_result_path, 'w', encoding='utf-8') as f:
-                        json.dump(result, f, indent=2, ensure_ascii=False)
-                    
-                    logger.info(f"Successfully extracted and saved result for {file_name} to extraction_results/{json_filename}")
-                    
-                    processed_count += 1
-                    results_summary.append({
-                        'file': file_name,
-                        'path': file_path,
-                        'status': 'success',
-                        'result_file': json_filename
-                    })
-                except Exception as e:
-                    logger.error(f"Failed to extract content from {file_name}: {e}")
-                    failed_count += 1
-                    results_summary.append({
-                        'file': file_name,
-                        'path': file_path,
-                        'status': 'failed',
-                        'error': str(e)
-                    })
+                task = {key: html_file[key] for key in ('path', 'name', 'url') if key in html_file}
+                if not task.get('path'):
+                    task['content'] = html_file.get('content', '')
+                tasks.append(task)
+            
+            # The schema is sent to every worker; fall back to threads if
+            # it can't be pickled (e.g. a module SCHEMA holding custom objects)
+            try:
+                pickle.dumps(schema_to_use)
+                executor_class = ProcessPoolExecutor
+            except Exception:
+                executor_class = ThreadPoolExecutor
+            
+            # Files are sent to workers in batches: one submit, one pickled
+            # schema and one result round-trip per batch instead of per file
+            max_workers = min(os.cpu_count() or 1, len(tasks))
+            batch_size = min(EXTRACTION_MAX_BATCH, -(-len(tasks) // (max_workers * EXTRACTION_BATCHES_PER_WORKER)))
+            results_summary = [None] * len(tasks)
+            with executor_class(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(_extract_batch, tasks[start:start + batch_size], str(code_path), code_version, schema_to_use, str(results_dir),
+                                    pass_tree, pass_path, EXTRACTION_JSONL_PATTERN.format(start) if jsonl else None,
+                                    executor_class is ThreadPoolExecutor): start
+                    for start in range(0, len(tasks), batch_size)
+                }
+                for future in as_completed(futures):
+                    start = futures[future]
+                    batch_results = future.result()
+                    results_summary[start:start + len(batch_results)] = batch_results
+            
+            processed_count = sum(1 for entry in results_summary if entry['status'] == 'success')
+            failed_count = len(results_summary) - processed_count
             
             # Save summary file with all results (in flow5 directory, not in results folder)
             summary_path = output_dir / 'extraction_results_summary.json'
-            with open(summary_path, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'total_files': len(html_files_to_process),
-                    'processed_files': processed_count,
-                    'failed_files': failed_count,
-                    'results_directory': 'extraction_results',
-                    'results': results_summary
-                }, f, indent=2, ensure_ascii=False)
+            _write_json(summary_path, {
+                'total_files': len(html_files_to_process),
+                'processed_files': processed_count,
+                'failed_files': failed_count,
+                'results_directory': 'extraction_results',
+                'output_format': 'jsonl' if jsonl else 'json',
+                'results': results_summary
+            })
             
             logger.info(f"Extraction summary saved to {summary_path}")
-            logger.info(f"Generated {processed_count} individual result JSON files in extraction_results/ directory")
+            if jsonl:
+                logger.info(f"Wrote {processed_count} results to JSON Lines batch files in extraction_results/ directory")
+            else:
+                logger.info(f"Generated {processed_count} individual result JSON files in extraction_results/ directory")
             
             return {
                 'processed_count': processed_count,
@@ -372,171 +944,13 @@ class HTMLAgentSystem:
             
         except Exception as e:
             logger.error(f"Failed to execute extraction code: {e}")
-            import traceback
             logger.error(traceback.format_exc())
             return None
     
-    def _fix_markdown_converter_syntax(self, code: str, syntax_error: SyntaxError) -> str:
-        """
-        Attempt to fix common syntax errors in generated markdown converter code
-        """
-        import re
-        
-        lines = code.split('\n')
-        error_line_num = syntax_error.lineno - 1 if syntax_error.lineno and syntax_error.lineno <= len(lines) else len(lines) - 1
-        
-        if error_line_num < len(lines):
-            error_line = lines[error_line_num]
-            
-            # Fix unterminated f-strings
-            if 'f"' in error_line or "f'" in error_line or 'f"""' in error_line or "f'''" in error_line:
-                # Check for triple-quoted f-strings first
-                if 'f"""' in error_line:
-                    # Find the start of the f-string
-                    f_start = error_line.find('f"""')
-                    if f_start != -1:
-                        # Check if it's closed on the same line
-                        remaining = error_line[f_start + 4:]
-                        if '"""' not in remaining:
-                            # Not closed, need to find where it should end
-                            # Look ahead for closing triple quotes
-                            found_close = False
-                            for i in range(error_line_num + 1, min(error_line_num + 20, len(lines))):
-                                if '"""' in lines[i]:
-                                    found_close = True
-                                    break
-                            
-                            if not found_close:
-                                # Add closing triple quotes at end of current line or next logical place
-                                # If line ends with newline escape, it's probably a multi-line string
-                                if error_line.rstrip().endswith('\\n') or error_line.rstrip().endswith('\\'):
-                                    # Convert to proper multi-line f-string or add closing
-                                    # Try to find a good place to close it
-                                    if error_line_num + 1 < len(lines):
-                                        next_line = lines[error_line_num + 1]
-                                        # If next line is part of the string content, we need to close after it
-                                        if next_line.strip() and not next_line.strip().startswith('"""'):
-                                            # Look for where the string should end
-                                            # Common pattern: f"""\n{content}\n"""
-                                            # Find the next non-indented line or closing pattern
-                                            for i in range(error_line_num + 1, min(error_line_num + 10, len(lines))):
-                                                if lines[i].strip() and not lines[i].startswith(' ') and not lines[i].startswith('\t'):
-                                                    # Found next statement, close before it
-                                                    lines[i-1] = lines[i-1].rstrip() + '"""'
-                                                    break
-                                            else:
-                                                # No clear end, close at end of next line
-                                                if error_line_num + 1 < len(lines):
-                                                    lines[error_line_num + 1] = lines[error_line_num + 1].rstrip() + '"""'
-                                                else:
-                                                    lines[error_line_num] = error_line.rstrip() + '"""'
-                                        else:
-                                            # Already has closing, might be a different issue
-                                            pass
-                                    else:
-                                        lines[error_line_num] = error_line.rstrip() + '"""'
-                                else:
-                                    # Simple case, just add closing
-                                    lines[error_line_num] = error_line.rstrip() + '"""'
-                
-                elif "f'''" in error_line:
-                    # Similar logic for triple single quotes
-                    f_start = error_line.find("f'''")
-                    if f_start != -1:
-                        remaining = error_line[f_start + 4:]
-                        if "'''" not in remaining:
-                            found_close = False
-                            for i in range(error_line_num + 1, min(error_line_num + 20, len(lines))):
-                                if "'''" in lines[i]:
-                                    found_close = True
-                                    break
-                            
-                            if not found_close:
-                                if error_line.rstrip().endswith('\\n') or error_line.rstrip().endswith('\\'):
-                                    if error_line_num + 1 < len(lines):
-                                        next_line = lines[error_line_num + 1]
-                                        if next_line.strip() and not next_line.strip().startswith("'''"):
-                                            for i in range(error_line_num + 1, min(error_line_num + 10, len(lines))):
-                                                if lines[i].strip() and not lines[i].startswith(' ') and not lines[i].startswith('\t'):
-                                                    lines[i-1] = lines[i-1].rstrip() + "'''"
-                                                    break
-                                            else:
-                                                if error_line_num + 1 < len(lines):
-                                                    lines[error_line_num + 1] = lines[error_line_num + 1].rstrip() + "'''"
-                                                else:
-                                                    lines[error_line_num] = error_line.rstrip() + "'''"
-                                    else:
-                                        lines[error_line_num] = error_line.rstrip() + "'''"
-                                else:
-                                    lines[error_line_num] = error_line.rstrip() + "'''"
-                
-                # Fix regular f-strings (f" or f')
-                elif 'f"' in error_line or "f'" in error_line:
-                    # Check if f-string is not properly closed
-                    f_string_pattern = r'f["\']'
-                    matches = list(re.finditer(f_string_pattern, error_line))
-                    
-                    if matches:
-                        last_match = matches[-1]
-                        quote_char = error_line[last_match.end() - 1]
-                        remaining = error_line[last_match.end():]
-                        
-                        # Count quotes in remaining part
-                        quote_count = remaining.count(quote_char)
-                        # Count escaped quotes
-                        escaped_quotes = remaining.count('\\' + quote_char)
-                        # Actual unescaped quotes
-                        unescaped_quotes = quote_count - escaped_quotes
-                        
-                        # If odd number of unescaped quotes, string is not closed
-                        if unescaped_quotes % 2 == 0:  # Even means not closed (opening quote not counted)
-                            # Check if line ends without closing quote
-                            if not error_line.rstrip().endswith(quote_char):
-                                # Check if next line might be continuation
-                                if error_line_num + 1 < len(lines):
-                                    next_line = lines[error_line_num + 1]
-                                    # If next line is indented and has content, might be part of the string
-                                    if next_line.strip() and (next_line.startswith(' ') or next_line.startswith('\t')):
-                                        # This is likely a multi-line string that should use triple quotes
-                                        # Convert to triple-quoted f-string
-                                        # Find the opening f"
-                                        f_pos = error_line.find('f"')
-                                        if f_pos != -1:
-                                            # Replace f" with f""" and find where to close
-                                            lines[error_line_num] = error_line[:f_pos+1] + '"""' + error_line[f_pos+2:]
-                                            # Find where to close (next non-indented line or end of block)
-                                            for i in range(error_line_num + 1, min(error_line_num + 15, len(lines))):
-                                                if lines[i].strip() and not (lines[i].startswith(' ') or lines[i].startswith('\t')):
-                                                    # Found next statement, close before it
-                                                    lines[i-1] = lines[i-1].rstrip() + '"""'
-                                                    break
-                                            else:
-                                                # No clear end, close at end of next line
-                                                if error_line_num + 1 < len(lines):
-                                                    lines[error_line_num + 1] = lines[error_line_num + 1].rstrip() + '"""'
-                                    else:
-                                        # Add closing quote
-                                        lines[error_line_num] = error_line.rstrip() + quote_char
-                                else:
-                                    # Add closing quote at end
-                                    lines[error_line_num] = error_line.rstrip() + quote_char
-        
-        fixed_code = '\n'.join(lines)
-        
-        # Additional fixes for common issues
-        # Fix incomplete triple-quoted strings in f-strings (more aggressive)
-        # Look for patterns like f"""\n without closing
-        fixed_code = re.sub(r'(f"""[^"]*?)(\n)(?![^"]*""")', r'\1\2"""', fixed_code, flags=re.MULTILINE | re.DOTALL)
-        fixed_code = re.sub(r"(f'''[^']*?)(\n)(?![^']*''')", r"\1\2'''", fixed_code, flags=re.MULTILINE | re.DOTALL)
-        
-        return fixed_code
-    
     def _execute_markdown_conversion(self, converter_code_path: Path, json_results_dir: Path, output_dir: Path) -> Optional[Dict[str, Any]]:
         """
         Execute the markdown converter code on JSON results
         """
-        import importlib.util
-        import sys
         
         if not converter_code_path.exists():
             logger.error(f"Markdown converter code not found: {converter_code_path}")
@@ -546,125 +960,59 @@ class HTMLAgentSystem:
             logger.error(f"JSON results directory not found: {json_results_dir}")
             return None
         
-        # Load all JSON files
-        json_files = list(json_results_dir.glob('*.json'))
-        if not json_files:
+        # Check for extraction results (per-file JSON or JSON Lines batches)
+        extraction_results = _iter_extraction_results(json_results_dir)
+        first_results = list(itertools.islice(extraction_results, CONVERSION_MIN_PARALLEL))
+        if not first_results:
             logger.warning("No JSON files found to convert")
             return None
+        extraction_results = itertools.chain(first_results, extraction_results)
         
         # Load and execute the converter code
         try:
-            # Load the converter code module
-            spec = importlib.util.spec_from_file_location("markdown_converter", converter_code_path)
-            if spec is None or spec.loader is None:
-                raise ImportError(f"Failed to load markdown converter code from {converter_code_path}")
-            
-            converter_module = importlib.util.module_from_spec(spec)
-            sys.modules['markdown_converter'] = converter_module
-            spec.loader.exec_module(converter_module)
-            
-            # Strictly follow the required interface
-            # 1. Must have MarkdownConverter class
-            if not hasattr(converter_module, 'MarkdownConverter'):
-                raise ValueError("Generated code MUST define 'MarkdownConverter' class. Found classes: " + 
-                               str([name for name in dir(converter_module) if isinstance(getattr(converter_module, name, None), type)]))
-            
-            # 2. Verify __init__ signature (should have no required parameters)
-            import inspect
-            init_signature = inspect.signature(converter_module.MarkdownConverter.__init__)
-            init_params = [p for p in init_signature.parameters.keys() if p != 'self']
-            if init_params:
-                # Check if all params have defaults
-                for param_name in init_params:
-                    param = init_signature.parameters[param_name]
-                    if param.default == inspect.Parameter.empty:
-                        raise ValueError(f"MarkdownConverter.__init__() MUST have no required parameters. Found: {init_params}")
-            
-            # 3. Instantiate converter
-            converter = converter_module.MarkdownConverter()
-            
-            # 4. Must have convert method (exact name)
-            if not hasattr(converter, 'convert'):
-                available_methods = [name for name in dir(converter) if not name.startswith('_') and callable(getattr(converter, name))]
-                raise ValueError(f"MarkdownConverter MUST have 'convert' method. Found methods: {available_methods}")
-            
-            # 5. Verify convert method signature
-            convert_method = getattr(converter, 'convert')
-            convert_sig = inspect.signature(convert_method)
-            convert_params = list(convert_sig.parameters.keys())
-            
-            # Must have json_data parameter
-            if 'json_data' not in convert_params:
-                raise ValueError(f"convert() method MUST accept 'json_data' parameter. Found parameters: {convert_params}")
-            
-            # Must return str
-            if convert_sig.return_annotation == inspect.Signature.empty:
-                raise ValueError("convert() method MUST have return type annotation: -> str")
-            
-            return_type_str = str(convert_sig.return_annotation)
-            if 'str' not in return_type_str.lower() or 'str' != return_type_str.strip():
-                # Allow Optional[str] or Union[str, ...] but must include str
-                if 'str' not in return_type_str:
-                    raise ValueError(f"convert() method MUST return str. Found return type: {return_type_str}")
+            # Load the converter code and check its interface (cached while
+            # the file is unchanged)
+            code_stat = converter_code_path.stat()
+            converter_class = _validate_converter(str(converter_code_path), code_stat.st_mtime_ns, code_stat.st_size)
+            convert = _new_converter(converter_class).convert
             
             # Create markdown output directory
             markdown_output_dir = output_dir / 'markdown_output'
             markdown_output_dir.mkdir(parents=True, exist_ok=True)
             logger.info(f"Created markdown output directory: {markdown_output_dir}")
             
-            # Process each JSON file
-            processed_count = 0
-            failed_count = 0
-            results_summary = []
+            # Results convert independently, so they are spread over worker
+            # processes, each importing the converter code itself. A few
+            # results (or CONVERSION_JOBS=1) are converted here instead
+            max_workers = Settings.CONVERSION_JOBS or os.cpu_count() or 1
+            if max_workers > 1 and len(first_results) >= CONVERSION_MIN_PARALLEL:
+                convert_in_worker = partial(_convert_in_worker, code_path=str(converter_code_path),
+                                            markdown_output_dir=str(markdown_output_dir))
+                with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                    conversions = list(executor.map(convert_in_worker, extraction_results, chunksize=CONVERSION_CHUNK_SIZE))
+            else:
+                conversions = [
+                    _convert_one(json_name, load_result, convert, markdown_output_dir)
+                    for json_name, load_result in extraction_results
+                ]
             
-            for json_file in json_files:
-                try:
-                    # Load JSON
-                    with open(json_file, 'r', encoding='utf-8') as f:
-                        json_data = json.load(f)
-                    
-                    # Convert to Markdown
-                    # Strictly follow the interface: convert(json_data=...)
-                    markdown_content = converter.convert(json_data=json_data)
-                    
-                    # Result must be str
-                    if not isinstance(markdown_content, str):
-                        raise TypeError(f"convert() method MUST return str, got {type(markdown_content)}")
-                    
-                    # Generate markdown filename
-                    markdown_filename = json_file.stem + '.md'
-                    markdown_path = markdown_output_dir / markdown_filename
-                    
-                    # Save Markdown file
-                    with open(markdown_path, 'w', encoding='utf-8') as f:
-                        f.write(markdown_content)
-                    
-                    logger.info(f"Successfully converted {json_file.name} to {markdown_filename}")
-                    processed_count += 1
-                    results_summary.append({
-                        'json_file': json_file.name,
-                        'markdown_file': markdown_filename,
-                        'status': 'success'
-                    })
-                except Exception as e:
-                    logger.error(f"Failed to convert {json_file.name}: {e}")
-                    failed_count += 1
-                    results_summary.append({
-                        'json_file': json_file.name,
-                        'status': 'failed',
-                        'error': str(e)
-                    })
+            failed_count = sum(1 for _, _, error in conversions if error is not None)
+            processed_count = len(conversions) - failed_count
             
             # Save summary
             summary_path = output_dir / 'markdown_conversion_summary.json'
-            with open(summary_path, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'total_files': len(json_files),
-                    'processed_files': processed_count,
-                    'failed_files': failed_count,
-                    'markdown_output_directory': 'markdown_output',
-                    'results': results_summary
-                }, f, indent=2, ensure_ascii=False)
+            _write_json(summary_path, {
+                'total_files': len(conversions),
+                'processed_files': processed_count,
+                'failed_files': failed_count,
+                'markdown_output_directory': 'markdown_output',
+                'results': [
+                    {'json_file': json_name, 'markdown_file': markdown_filename, 'status': 'success'}
+                    if error is None else
+                    {'json_file': json_name, 'status': 'failed', 'error': error}
+                    for json_name, markdown_filename, error in conversions
+                ]
+            })
             
             logger.info(f"Markdown conversion summary saved to {summary_path}")
             logger.info(f"Generated {processed_count} Markdown files in markdown_output/ directory")
@@ -678,7 +1026,6 @@ class HTMLAgentSystem:
             
         except Exception as e:
             logger.error(f"Failed to execute markdown conversion: {e}")
-            import traceback
             logger.error(traceback.format_exc())
             return None
     
@@ -696,90 +1043,47 @@ class HTMLAgentSystem:
         json_schema = None
         extraction_code = None
         
+        # Checkpoints of all existing flow directories, read once for every step below
+        checkpoint_index = _load_checkpoint_index(Settings.list_flow_dirs())
+        
         # Load checkpoints from existing flow directories if resume is enabled
         # Track which steps have been completed based on checkpoints
         completed_steps = {}
         if resume:
-            # Find all existing flow directories and load checkpoints
-            existing_flows = []
-            if Settings.OUTPUT_DIR.exists():
-                for item in Settings.OUTPUT_DIR.iterdir():
-                    if item.is_dir() and item.name.startswith('flow'):
-                        try:
-                            flow_num = int(item.name[4:])
-                            checkpoint_manager = CheckpointManager(item)
-                            checkpoint = checkpoint_manager.load_checkpoint()
-                            if checkpoint:
-                                step = checkpoint.get('step', 'unknown')
-                                existing_flows.append({
-                                    'flow_id': flow_num,
-                                    'flow_dir': item,
-                                    'checkpoint': checkpoint,
-                                    'step': step
-                                })
-                                # Map step to flow_id for later use
-                                if step == "text_analysis":
-                                    completed_steps['step1'] = flow_num
-                                elif step == "visual_analysis":
-                                    completed_steps['step2'] = flow_num
-                                elif step == "synthesized":
-                                    completed_steps['step3'] = flow_num
-                                elif step == "schema":
-                                    completed_steps['step4'] = flow_num
-                                elif step == "code":
-                                    completed_steps['step5'] = flow_num
-                        except (ValueError, Exception) as e:
-                            logger.debug(f"Could not load checkpoint from {item.name}: {e}")
-                            continue
-            
-            # Sort by flow_id to process in order
-            existing_flows.sort(key=lambda x: x['flow_id'])
-            
-            # Load data from checkpoints in order (later checkpoints contain all previous data)
-            for flow_info in existing_flows:
-                checkpoint = flow_info['checkpoint']
-                step = checkpoint.get('step')
-                data = checkpoint.get('data', {})
+            latest_flow = None
+            for flow_num, checkpoint in checkpoint_index.items():
+                step = checkpoint.get('step', 'unknown')
+                
+                # Map step to flow_id for later use
+                if step in CHECKPOINT_STEP_KEYS:
+                    completed_steps[CHECKPOINT_STEP_KEYS[step]] = flow_num
                 
-                logger.info(f"Found checkpoint in {flow_info['flow_dir'].name}: step={step}")
+                logger.info(f"Found checkpoint in flow{flow_num}: step={step}")
                 
-                # Load data based on step (later steps contain all previous data)
-                if step == "text_analysis":
-                    analysis_results = data.get('analysis_results')
-                    logger.info(f"Loaded text analysis results from {flow_info['flow_dir'].name}")
-                elif step == "visual_analysis":
-                    visual_results = data.get('visual_results')
-                    analysis_results = data.get('analysis_results')  # Also load previous step data
-                    logger.info(f"Loaded visual analysis results from {flow_info['flow_dir'].name}")
-                elif step == "synthesized":
-                    synthesized = data.get('synthesized')
-                    analysis_results = data.get('analysis_results')
-                    visual_results = data.get('visual_results')
-                    logger.info(f"Loaded synthesized results from {flow_info['flow_dir'].name}")
-                elif step == "schema":
-                    json_schema = data.get('schema')
-                    synthesized = data.get('synthesized')
-                    analysis_results = data.get('analysis_results')
-                    visual_results = data.get('visual_results')
-                    logger.info(f"Loaded schema from {flow_info['flow_dir'].name}")
-                elif step == "code_generated":
-                    extraction_code = data.get('code')
-                    json_schema = data.get('schema')
-                    synthesized = data.get('synthesized')
-                    analysis_results = data.get('analysis_results')
-                    visual_results = data.get('visual_results')
-                    logger.info(f"Loaded generated code from {flow_info['flow_dir'].name}")
-                elif step == "code_validated" or step == "code":
-                    extraction_code = data.get('code')
-                    validation_result = data.get('validation')
-                    json_schema = data.get('schema')
-                    synthesized = data.get('synthesized')
-                    analysis_results = data.get('analysis_results')
-                    visual_results = data.get('visual_results')
-                    logger.info(f"Loaded validated code from {flow_info['flow_dir'].name}")
+                # Track the furthest step reached (latest flow on ties)
+                if step in CHECKPOINT_STEP_RANK and (
+                        latest_flow is None
+                        or CHECKPOINT_STEP_RANK[step] >= CHECKPOINT_STEP_RANK[checkpoint_index[latest_flow]['step']]):
+                    latest_flow = flow_num
+            
+            # Later checkpoints contain all previous data, so only the
+            # furthest step's checkpoint needs to be loaded
+            resumed_data = {}
+            if latest_flow is not None:
+                checkpoint = checkpoint_index[latest_flow]
+                fields, description = CHECKPOINT_STEP_FIELDS[checkpoint['step']]
+                data = checkpoint.get('data', {})
+                resumed_data = {field: data.get(field) for field in fields}
+                logger.info(f"Loaded {description} from flow{latest_flow}")
             
-            if existing_flows:
-                logger.info(f"Resuming from checkpoints: found {len(existing_flows)} completed steps")
+            analysis_results = resumed_data.get('analysis_results')
+            visual_results = resumed_data.get('visual_results')
+            synthesized = resumed_data.get('synthesized')
+            json_schema = resumed_data.get('schema')
+            extraction_code = resumed_data.get('code')
+            
+            if checkpoint_index:
+                logger.info(f"Resuming from checkpoints: found {len(checkpoint_index)} completed steps")
                 logger.info(f"Completed steps: {list(completed_steps.keys())}")
         
         # Step 1: Analyze HTML files with analyzer agent
@@ -792,7 +1096,7 @@ class HTMLAgentSystem:
             step1_checkpoint = CheckpointManager(step1_output_dir)
         else:
             # Create new flow directory for this step
-            step1_flow_id = Settings.get_next_flow_id()
+            step1_flow_id = Settings.get_next_flow_id(allocate=True)
             step1_output_dir = Settings.get_flow_output_dir(step1_flow_id)
             step1_checkpoint = CheckpointManager(step1_output_dir)
             
@@ -801,19 +1105,16 @@ class HTMLAgentSystem:
                 logger.info("Step 1: Using cached text analysis results (file exists)")
                 analysis_results = step1_checkpoint.load_step_result("step1_text_analysis")
                 # Also load from checkpoint if available
-                checkpoint = step1_checkpoint.load_checkpoint()
+                checkpoint = checkpoint_index.get(step1_flow_id)
                 if checkpoint and checkpoint.get('step') == 'text_analysis':
                     analysis_results = checkpoint.get('data', {}).get('analysis_results', analysis_results)
             else:
                 logger.info("Step 1: Analyzing HTML structures with Analyzer Agent...")
-                analysis_results = []
-                for html_file in html_files:
-                    file_identifier = html_file.get('url', html_file.get('path', 'unknown'))
-                    result = self.analyzer.analyze_html_structure(
-                        html_file['content'],
-                        file_identifier
-                    )
-                    analysis_results.append(result)
+                # Small files are packed several to a request; packs run concurrently
+                analysis_results = self.analyzer.analyze_batch_packed([
+                    {'content': html_file['content'], 'path': file_identifier}
+                    for html_file, file_identifier in zip(html_files, file_identifiers)
+                ])
                 
                 # Save step result to step1 flow directory
                 step1_checkpoint.save_step_result("step1_text_analysis", analysis_results)
@@ -834,7 +1135,7 @@ class HTMLAgentSystem:
                 step2_checkpoint = CheckpointManager(step2_output_dir)
             else:
                 # Create new flow directory for this step
-                step2_flow_id = Settings.get_next_flow_id()
+                step2_flow_id = Settings.get_next_flow_id(allocate=True)
                 step2_output_dir = Settings.get_flow_output_dir(step2_flow_id)
                 step2_checkpoint = CheckpointManager(step2_output_dir)
                 
@@ -843,20 +1144,18 @@ class HTMLAgentSystem:
                     logger.info("Step 2: Using cached visual analysis results (file exists)")
                     visual_results = step2_checkpoint.load_step_result("step2_visual_analysis")
                     # Also load from checkpoint if available
-                    checkpoint = step2_checkpoint.load_checkpoint()
+                    checkpoint = checkpoint_index.get(step2_flow_id)
                     if checkpoint and checkpoint.get('step') == 'visual_analysis':
                         visual_results = checkpoint.get('data', {}).get('visual_results', visual_results)
                         analysis_results = checkpoint.get('data', {}).get('analysis_results', analysis_results)
                 else:
                     logger.info("Step 2: Performing visual analysis...")
-                    visual_results = []
-                    for html_file in html_files:
-                        file_identifier = html_file.get('url', html_file.get('path', 'unknown'))
-                        visual_result = self.visual_analyzer.analyze_html_visually(
-                            html_file['content'],
-                            file_identifier
-                        )
-                        visual_results.append(visual_result)
+                    # Each visual analysis renders the page in its own headless
+                    # browser, so Step 2 has a much smaller limit than Step 1
+                    visual_results = _analyze_files_concurrently(
+                        self.visual_analyzer.analyze_html_visually, html_files, file_identifiers,
+                        concurrency=Settings.VISUAL_CONCURRENCY
+                    )
                     
                     # Save step result to step2 flow directory
                     step2_checkpoint.save_step_result("step2_visual_analysis", visual_results)
@@ -879,7 +1178,7 @@ class HTMLAgentSystem:
             step3_checkpoint = CheckpointManager(step3_output_dir)
         else:
             # Create new flow directory for this step
-            step3_flow_id = Settings.get_next_flow_id()
+            step3_flow_id = Settings.get_next_flow_id(allocate=True)
             step3_output_dir = Settings.get_flow_output_dir(step3_flow_id)
             step3_checkpoint = CheckpointManager(step3_output_dir)
             
@@ -888,7 +1187,7 @@ class HTMLAgentSystem:
                 logger.info("Step 3: Using cached synthesized results (file exists)")
                 synthesized = step3_checkpoint.load_step_result("step3_synthesized")
                 # Also load from checkpoint if available
-                checkpoint = step3_checkpoint.load_checkpoint()
+                checkpoint = checkpoint_index.get(step3_flow_id)
                 if checkpoint and checkpoint.get('step') == 'synthesized':
                     synthesized = checkpoint.get('data', {}).get('synthesized', synthesized)
                     analysis_results = checkpoint.get('data', {}).get('analysis_results', analysis_results)
@@ -923,7 +1222,7 @@ class HTMLAgentSystem:
             schema_path = step4_output_dir / 'extraction_schema.json'
         else:
             # Create new flow directory for this step
-            step4_flow_id = Settings.get_next_flow_id()
+            step4_flow_id = Settings.get_next_flow_id(allocate=True)
             step4_output_dir = Settings.get_flow_output_dir(step4_flow_id)
             step4_checkpoint = CheckpointManager(step4_output_dir)
             
@@ -931,14 +1230,17 @@ class HTMLAgentSystem:
             schema_path = step4_output_dir / 'extraction_schema.json'
             if step4_checkpoint.step_result_exists("step4_schema") or schema_path.exists():
                 logger.info("Step 4: Using cached schema (file exists)")
-                json_schema = step4_checkpoint.load_step_result("step4_schema")
-                if json_schema is None and schema_path.exists():
-                    with open(schema_path, 'r', encoding='utf-8') as f:
-                        json_schema = json.load(f)
+                # Prefer the schema in the checkpoint (already in memory); read
+                # the step result file, then the schema file, only without it
+                checkpoint = checkpoint_index.get(step4_flow_id)
+                if checkpoint and checkpoint.get('step') == 'schema' and 'schema' in checkpoint.get('data', {}):
+                    json_schema = checkpoint['data']['schema']
+                else:
+                    json_schema = step4_checkpoint.load_step_result("step4_schema")
+                    if json_schema is None and schema_path.exists():
+                        json_schema = _read_json_file(schema_path)
                 # Also load from checkpoint if available
-                checkpoint = step4_checkpoint.load_checkpoint()
                 if checkpoint and checkpoint.get('step') == 'schema':
-                    json_schema = checkpoint.get('data', {}).get('schema', json_schema)
                     synthesized = checkpoint.get('data', {}).get('synthesized', synthesized)
                     analysis_results = checkpoint.get('data', {}).get('analysis_results', analysis_results)
                     visual_results = checkpoint.get('data', {}).get('visual_results', visual_results)
@@ -947,8 +1249,7 @@ class HTMLAgentSystem:
                 json_schema = self.orchestrator.generate_final_schema(synthesized)
                 
                 # Save schema to step4 flow directory
-                with open(schema_path, 'w', encoding='utf-8') as f:
-                    json.dump(json_schema, f, indent=2, ensure_ascii=False)
+                _write_json(schema_path, json_schema)
                 logger.info(f"Schema saved to {schema_path}")
                 
                 # Save step result to step4 flow directory
@@ -971,32 +1272,17 @@ class HTMLAgentSystem:
             step5_output_dir = Settings.get_flow_output_dir(step5_flow_id)
             step5_checkpoint = CheckpointManager(step5_output_dir)
             code_path = step5_output_dir / 'extraction_code.py'
-            # Load code from file if exists
-            if code_path.exists():
-                with open(code_path, 'r', encoding='utf-8') as f:
-                    extraction_code = f.read()
         else:
             # Check for existing incomplete flow5 directory first
             # Look for flow directories with step="schema" (indicating Step 5 failed)
             existing_flow5_id = None
-            if Settings.OUTPUT_DIR.exists():
-                for item in Settings.OUTPUT_DIR.iterdir():
-                    if item.is_dir() and item.name.startswith('flow'):
-                        try:
-                            flow_num = int(item.name[4:])
-                            # Check if this is a flow5 directory (or any flow with schema checkpoint but no code)
-                            checkpoint_manager = CheckpointManager(item)
-                            checkpoint = checkpoint_manager.load_checkpoint()
-                            if checkpoint:
-                                checkpoint_step = checkpoint.get('step')
-                                # If checkpoint is "schema" and has code_generation_failed, reuse this flow
-                                if checkpoint_step == "schema" and checkpoint.get('data', {}).get('code_generation_failed'):
-                                    # This is an incomplete Step 5, reuse it
-                                    existing_flow5_id = flow_num
-                                    logger.info(f"Found incomplete Step 5 in {item.name}, will reuse it")
-                                    break
-                        except (ValueError, Exception):
-                            continue
+            for flow_num, checkpoint in checkpoint_index.items():
+                # If checkpoint is "schema" and has code_generation_failed, reuse this flow
+                if checkpoint.get('step') == "schema" and checkpoint.get('data', {}).get('code_generation_failed'):
+                    # This is an incomplete Step 5, reuse it
+                    existing_flow5_id = flow_num
+                    logger.info(f"Found incomplete Step 5 in flow{flow_num}, will reuse it")
+                    break
             
             if existing_flow5_id is not None:
                 # Reuse existing incomplete flow5 directory
@@ -1006,7 +1292,7 @@ class HTMLAgentSystem:
                 logger.info(f"Reusing flow{step5_flow_id} for Step 5 retry")
             else:
                 # Create new flow directory for this step
-                step5_flow_id = Settings.get_next_flow_id()
+                step5_flow_id = Settings.get_next_flow_id(allocate=True)
                 step5_output_dir = Settings.get_flow_output_dir(step5_flow_id)
                 step5_checkpoint = CheckpointManager(step5_output_dir)
                 logger.info(f"Creating new flow{step5_flow_id} for Step 5")
@@ -1016,7 +1302,7 @@ class HTMLAgentSystem:
             
             # Check if code file exists AND checkpoint shows successful completion
             code_completed = False
-            step5_checkpoint_data = step5_checkpoint.load_checkpoint()
+            step5_checkpoint_data = checkpoint_index.get(step5_flow_id)
             if step5_checkpoint_data:
                 checkpoint_step = step5_checkpoint_data.get('step')
                 # Only skip if checkpoint shows "code_generated" step was completed
@@ -1028,13 +1314,18 @@ class HTMLAgentSystem:
                     analysis_results = step5_checkpoint_data.get('data', {}).get('analysis_results', analysis_results)
                     visual_results = step5_checkpoint_data.get('data', {}).get('visual_results', visual_results)
             
+            fallback_marker = step5_output_dir / FALLBACK_CODE_MARKER
             if code_path.exists() and code_completed:
                 logger.info("Step 5: Using cached extraction code (file exists and was successfully completed)")
-                if extraction_code is None:
-                    with open(code_path, 'r', encoding='utf-8') as f:
-                        extraction_code = f.read()
                 # Check if it's fallback code (indicates previous failure)
-                if "API generation failed" in extraction_code or "fallback template" in extraction_code:
+                is_fallback = fallback_marker.exists()
+                if not is_fallback:
+                    if extraction_code is None:
+                        extraction_code = code_path.read_text(encoding='utf-8')
+                    # Flow directories written before the marker existed
+                    is_fallback = ("API generation failed" in extraction_code
+                                   or "fallback template" in extraction_code)
+                if is_fallback:
                     logger.warning("Step 5: Found fallback code from previous failure, regenerating...")
                     code_completed = False  # Force regeneration
                     extraction_code = None
@@ -1046,10 +1337,15 @@ class HTMLAgentSystem:
                     extraction_code = self.code_generator.generate_extraction_code(json_schema)
                     
                     # Save code to step5 flow directory
-                    with open(code_path, 'w', encoding='utf-8') as f:
-                        f.write(extraction_code)
+                    code_path.write_text(extraction_code, encoding='utf-8')
                     logger.info(f"Extraction code saved to {code_path}")
                     
+                    # Mark fallback template code so the next run regenerates it
+                    if self.code_generator.used_fallback:
+                        fallback_marker.touch()
+                    else:
+                        fallback_marker.unlink(missing_ok=True)
+                    
                     # Save step result to step5 flow directory
                     step5_checkpoint.save_step_result("step5_code", extraction_code, "extraction_code.py")
                     
@@ -1095,25 +1391,15 @@ class HTMLAgentSystem:
         step6_checkpoint = None
         
         # Check for existing flow6 directory with validated code
-        if Settings.OUTPUT_DIR.exists():
-            for item in Settings.OUTPUT_DIR.iterdir():
-                if item.is_dir() and item.name.startswith('flow'):
-                    try:
-                        flow_num = int(item.name[4:])
-                        checkpoint_manager = CheckpointManager(item)
-                        checkpoint = checkpoint_manager.load_checkpoint()
-                        if checkpoint:
-                            checkpoint_step = checkpoint.get('step')
-                            # Look for flow6 with validated code
-                            if checkpoint_step == "code_validated" or checkpoint_step == "code":
-                                # This is Step 6 completed
-                                step6_flow_id = flow_num
-                                validated_code = checkpoint.get('data', {}).get('code')
-                                validation_result = checkpoint.get('data', {}).get('validation')
-                                logger.info(f"Found validated code in {item.name}")
-                                break
-                    except (ValueError, Exception):
-                        continue
+        for flow_num, checkpoint in checkpoint_index.items():
+            # Look for flow6 with validated code
+            if checkpoint.get('step') in ("code_validated", "code"):
+                # This is Step 6 completed
+                step6_flow_id = flow_num
+                validated_code = checkpoint.get('data', {}).get('code')
+                validation_result = checkpoint.get('data', {}).get('validation')
+                logger.info(f"Found validated code in flow{flow_num}")
+                break
         
         if validated_code is not None and validation_result is not None:
             logger.info("Step 6: Using validated code from checkpoint, skipping validation...")
@@ -1136,12 +1422,11 @@ class HTMLAgentSystem:
                     logger.warning("Step 6.5: No files processed from spread directory")
             except Exception as e:
                 logger.error(f"Step 6.5: Failed to execute code: {e}")
-                import traceback
                 logger.error(traceback.format_exc())
                 # Don't fail the whole process, just log the error
         else:
             # Create new flow directory for Step 6
-            step6_flow_id = Settings.get_next_flow_id()
+            step6_flow_id = Settings.get_next_flow_id(allocate=True)
             step6_output_dir = Settings.get_flow_output_dir(step6_flow_id)
             step6_checkpoint = CheckpointManager(step6_output_dir)
             
@@ -1230,14 +1515,12 @@ class HTMLAgentSystem:
                 
                 # Save validation results to step6 flow directory
                 validation_path = step6_output_dir / 'code_validation_result.json'
-                with open(validation_path, 'w', encoding='utf-8') as f:
-                    json.dump(validation_result, f, indent=2, ensure_ascii=False)
+                _write_json(validation_path, validation_result)
                 logger.info(f"Validation results saved to {validation_path}")
                 
                 # Save validated/fixed code to step6 flow directory
                 validated_code_path = step6_output_dir / 'extraction_code.py'
-                with open(validated_code_path, 'w', encoding='utf-8') as f:
-                    f.write(extraction_code)
+                validated_code_path.write_text(extraction_code, encoding='utf-8')
                 logger.info(f"Validated extraction code saved to {validated_code_path}")
                 
                 # Save checkpoint to step6 flow directory
@@ -1270,7 +1553,6 @@ class HTMLAgentSystem:
                     
             except Exception as e:
                 logger.error(f"Step 6 failed: {e}")
-                import traceback
                 logger.error(traceback.format_exc())
                 # Save error checkpoint
                 step6_checkpoint.save_checkpoint("code_generated", {
@@ -1288,92 +1570,86 @@ class HTMLAgentSystem:
         # Save intermediate results to each step's flow directory
         # Step 1 intermediate results
         step1_intermediate_path = step1_output_dir / 'intermediate_results.json'
-        with open(step1_intermediate_path, 'w', encoding='utf-8') as f:
-            json.dump({
-                "html_files": file_identifiers,
-                "analysis_results": analysis_results,
-                "step": "step1_text_analysis",
-                "flow_id": step1_flow_id
-            }, f, indent=2, ensure_ascii=False)
+        _write_json(step1_intermediate_path, {
+            "html_files": file_identifiers,
+            "analysis_results": analysis_results,
+            "step": "step1_text_analysis",
+            "flow_id": step1_flow_id
+        })
         logger.info(f"Step 1 intermediate results saved to {step1_intermediate_path}")
         
         # Step 2 intermediate results (if visual analysis enabled)
         step2_intermediate_path = None
         if use_visual and visual_results:
             step2_intermediate_path = step2_output_dir / 'intermediate_results.json'
-            with open(step2_intermediate_path, 'w', encoding='utf-8') as f:
-                json.dump({
-                    "html_files": file_identifiers,
-                    "analysis_results": analysis_results,
-                    "visual_results": visual_results,
-                    "step": "step2_visual_analysis",
-                    "flow_id": step2_flow_id
-                }, f, indent=2, ensure_ascii=False)
+            _write_json(step2_intermediate_path, {
+                "html_files": file_identifiers,
+                "analysis_results": analysis_results,
+                "visual_results": visual_results,
+                "step": "step2_visual_analysis",
+                "flow_id": step2_flow_id
+            })
             logger.info(f"Step 2 intermediate results saved to {step2_intermediate_path}")
         
         # Step 3 intermediate results
         step3_intermediate_path = step3_output_dir / 'intermediate_results.json'
-        with open(step3_intermediate_path, 'w', encoding='utf-8') as f:
-            json.dump({
-                "html_files": file_identifiers,
-                "analysis_results": analysis_results,
-                "visual_results": visual_results if use_visual else [],
-                "synthesized": synthesized,
-                "step": "step3_synthesized",
-                "flow_id": step3_flow_id
-            }, f, indent=2, ensure_ascii=False)
+        _write_json(step3_intermediate_path, {
+            "html_files": file_identifiers,
+            "analysis_results": analysis_results,
+            "visual_results": visual_results if use_visual else [],
+            "synthesized": synthesized,
+            "step": "step3_synthesized",
+            "flow_id": step3_flow_id
+        })
         logger.info(f"Step 3 intermediate results saved to {step3_intermediate_path}")
         
         # Step 4 intermediate results
         step4_intermediate_path = step4_output_dir / 'intermediate_results.json'
-        with open(step4_intermediate_path, 'w', encoding='utf-8') as f:
-            json.dump({
-                "html_files": file_identifiers,
-                "analysis_results": analysis_results,
-                "visual_results": visual_results if use_visual else [],
-                "synthesized": synthesized,
-                "schema": json_schema,
-                "step": "step4_schema",
-                "flow_id": step4_flow_id
-            }, f, indent=2, ensure_ascii=False)
+        _write_json(step4_intermediate_path, {
+            "html_files": file_identifiers,
+            "analysis_results": analysis_results,
+            "visual_results": visual_results if use_visual else [],
+            "synthesized": synthesized,
+            "schema": json_schema,
+            "step": "step4_schema",
+            "flow_id": step4_flow_id
+        })
         logger.info(f"Step 4 intermediate results saved to {step4_intermediate_path}")
         
         # Step 5 intermediate results
         step5_intermediate_path = step5_output_dir / 'intermediate_results.json'
-        with open(step5_intermediate_path, 'w', encoding='utf-8') as f:
-            json.dump({
-                "html_files": file_identifiers,
-                "analysis_results": analysis_results,
-                "visual_results": visual_results if use_visual else [],
-                "synthesized": synthesized,
-                "schema": json_schema,
-                "code": extraction_code,
-                "step": "step5_code_generated",
-                "flow_id": step5_flow_id
-            }, f, indent=2, ensure_ascii=False)
+        _write_json(step5_intermediate_path, {
+            "html_files": file_identifiers,
+            "analysis_results": analysis_results,
+            "visual_results": visual_results if use_visual else [],
+            "synthesized": synthesized,
+            "schema": json_schema,
+            "code": extraction_code,
+            "step": "step5_code_generated",
+            "flow_id": step5_flow_id
+        })
         logger.info(f"Step 5 intermediate results saved to {step5_intermediate_path}")
         
         # Step 6 intermediate results (final comprehensive results)
         step6_intermediate_path = step6_output_dir / 'intermediate_results.json'
-        with open(step6_intermediate_path, 'w', encoding='utf-8') as f:
-            json.dump({
-                "html_files": file_identifiers,
-                "analysis_results": analysis_results,
-                "visual_results": visual_results if use_visual else [],
-                "synthesized": synthesized,
-                "schema": json_schema,
-                "code": extraction_code,
-                "validation": validation_result,
-                "step": "step6_code_validated",
-                "flow_directories": {
-                    "step1": f"flow{step1_flow_id}",
-                    "step2": f"flow{step2_flow_id}" if use_visual else None,
-                    "step3": f"flow{step3_flow_id}",
-                    "step4": f"flow{step4_flow_id}",
-                    "step5": f"flow{step5_flow_id}",
-                    "step6": f"flow{step6_flow_id}"
-                }
-            }, f, indent=2, ensure_ascii=False)
+        _write_json(step6_intermediate_path, {
+            "html_files": file_identifiers,
+            "analysis_results": analysis_results,
+            "visual_results": visual_results if use_visual else [],
+            "synthesized": synthesized,
+            "schema": json_schema,
+            "code": extraction_code,
+            "validation": validation_result,
+            "step": "step6_code_validated",
+            "flow_directories": {
+                "step1": f"flow{step1_flow_id}",
+                "step2": f"flow{step2_flow_id}" if use_visual else None,
+                "step3": f"flow{step3_flow_id}",
+                "step4": f"flow{step4_flow_id}",
+                "step5": f"flow{step5_flow_id}",
+                "step6": f"flow{step6_flow_id}"
+            }
+        })
         logger.info(f"Step 6 intermediate results saved to {step6_intermediate_path}")
         
         # Step 7: Convert JSON results to Markdown format
@@ -1385,24 +1661,14 @@ class HTMLAgentSystem:
         step7_checkpoint = None
         
         # Check for existing flow7 directory with markdown conversion
-        if Settings.OUTPUT_DIR.exists():
-            for item in Settings.OUTPUT_DIR.iterdir():
-                if item.is_dir() and item.name.startswith('flow'):
-                    try:
-                        flow_num = int(item.name[4:])
-                        checkpoint_manager = CheckpointManager(item)
-                        checkpoint = checkpoint_manager.load_checkpoint()
-                        if checkpoint:
-                            checkpoint_step = checkpoint.get('step')
-                            # Look for flow7 with markdown conversion
-                            if checkpoint_step == "markdown_converted":
-                                step7_flow_id = flow_num
-                                markdown_converter_code = checkpoint.get('data', {}).get('markdown_converter_code')
-                                content_analysis = checkpoint.get('data', {}).get('content_analysis')
-                                logger.info(f"Found markdown conversion in {item.name}")
-                                break
-                    except (ValueError, Exception):
-                        continue
+        for flow_num, checkpoint in checkpoint_index.items():
+            # Look for flow7 with markdown conversion
+            if checkpoint.get('step') == "markdown_converted":
+                step7_flow_id = flow_num
+                markdown_converter_code = checkpoint.get('data', {}).get('markdown_converter_code')
+                content_analysis = checkpoint.get('data', {}).get('content_analysis')
+                logger.info(f"Found markdown conversion in flow{flow_num}")
+                break
         
         if markdown_converter_code is not None and content_analysis is not None:
             logger.info("Step 7: Using markdown converter code from checkpoint, skipping generation...")
@@ -1424,11 +1690,10 @@ class HTMLAgentSystem:
                     logger.warning("Step 7.5: No files converted to Markdown")
             except Exception as e:
                 logger.error(f"Step 7.5: Failed to execute markdown conversion: {e}")
-                import traceback
                 logger.error(traceback.format_exc())
         else:
             # Create new flow directory for Step 7
-            step7_flow_id = Settings.get_next_flow_id()
+            step7_flow_id = Settings.get_next_flow_id(allocate=True)
             step7_output_dir = Settings.get_flow_output_dir(step7_flow_id)
             step7_checkpoint = CheckpointManager(step7_output_dir)
             
@@ -1440,22 +1705,22 @@ class HTMLAgentSystem:
                     logger.warning(f"Extraction results directory not found: {extraction_results_dir}")
                     logger.info("Step 7 skipped: No extraction results to convert")
                 else:
-                    # Load all JSON files
-                    json_files = list(extraction_results_dir.glob('*.json'))
-                    if not json_files:
+                    # Count the JSON results, loading the first few as samples for analysis
+                    json_files_count = 0
+                    json_results = []
+                    for json_name, load_result in _iter_extraction_results(extraction_results_dir):
+                        json_files_count += 1
+                        if json_files_count <= 5:  # Sample first 5 files
+                            try:
+                                json_results.append(load_result())
+                            except Exception as e:
+                                logger.warning(f"Failed to load {json_name}: {e}")
+                    
+                    if not json_files_count:
                         logger.warning("No JSON files found in extraction_results directory")
                         logger.info("Step 7 skipped: No JSON files to convert")
                     else:
-                        logger.info(f"Found {len(json_files)} JSON files to analyze")
-                        
-                        # Load sample JSON files for analysis
-                        json_results = []
-                        for json_file in json_files[:5]:  # Sample first 5 files
-                            try:
-                                with open(json_file, 'r', encoding='utf-8') as f:
-                                    json_results.append(json.load(f))
-                            except Exception as e:
-                                logger.warning(f"Failed to load {json_file}: {e}")
+                        logger.info(f"Found {json_files_count} JSON files to analyze")
                         
                         if not json_results:
                             logger.warning("Failed to load any JSON results for analysis")
@@ -1484,19 +1749,19 @@ class HTMLAgentSystem:
                             retry_count = 0
                             
                             while retry_count <= max_retries:
-                                try:
-                                    compile(markdown_converter_code, '<string>', 'exec')
+                                syntax_error = compile_error(markdown_converter_code)
+                                if syntax_error is None:
                                     logger.info("Generated code syntax is valid")
                                     break  # Success, exit loop
-                                except SyntaxError as e:
+                                else:
                                     if retry_count == 0:
-                                        logger.error(f"Generated code has syntax errors: {e}")
+                                        logger.error(f"Generated code has syntax errors: {syntax_error}")
                                         logger.info("Attempting to fix syntax errors...")
                                         # Try to fix common syntax errors
-                                        markdown_converter_code = self._fix_markdown_converter_syntax(markdown_converter_code, e)
+                                        markdown_converter_code = fix_markdown_converter_syntax(markdown_converter_code, syntax_error)
                                         retry_count += 1
                                     elif retry_count == 1:
-                                        logger.error(f"Failed to fix syntax errors: {e}")
+                                        logger.error(f"Failed to fix syntax errors: {syntax_error}")
                                         logger.warning("Regenerating markdown converter code with stricter requirements...")
                                         # Regenerate with more explicit instructions
                                         markdown_converter_code = self.markdown_converter.generate_markdown_converter_code(
@@ -1506,20 +1771,19 @@ class HTMLAgentSystem:
                                         )
                                         retry_count += 1
                                     else:
-                                        logger.error(f"Failed to generate valid code after {max_retries} attempts: {e}")
-                                        raise ValueError(f"Generated code has unfixable syntax errors after {max_retries} attempts: {e}")
+                                        logger.error(f"Failed to generate valid code after {max_retries} attempts: {syntax_error}")
+                                        raise ValueError(f"Generated code has unfixable syntax errors after {max_retries} attempts: {syntax_error}") from syntax_error
                             
                             # Save converter code to step7 flow directory
                             converter_code_path = step7_output_dir / 'markdown_converter.py'
-                            with open(converter_code_path, 'w', encoding='utf-8') as f:
-                                f.write(markdown_converter_code)
+                            converter_code_path.write_text(markdown_converter_code, encoding='utf-8')
                             logger.info(f"Markdown converter code saved to {converter_code_path}")
                             
                             # Save checkpoint
                             step7_checkpoint.save_checkpoint("markdown_converted", {
                                 "content_analysis": content_analysis,
                                 "markdown_converter_code": markdown_converter_code,
-                                "json_files_count": len(json_files),
+                                "json_files_count": json_files_count,
                                 "file_identifiers": file_identifiers
                             })
                             logger.info(f"Step 7 results saved to flow{step7_flow_id}")
@@ -1538,13 +1802,11 @@ class HTMLAgentSystem:
                                     logger.warning("Step 7.5: No files converted to Markdown")
                             except Exception as e:
                                 logger.error(f"Step 7.5: Failed to execute markdown conversion: {e}")
-                                import traceback
                                 logger.error(traceback.format_exc())
                                 # Don't fail the whole process, just log the error
                 
             except Exception as e:
                 logger.error(f"Step 7 failed: {e}")
-                import traceback
                 logger.error(traceback.format_exc())
                 # Save error checkpoint
                 step7_checkpoint.save_checkpoint("code_validated", {
@@ -1556,13 +1818,12 @@ class HTMLAgentSystem:
         # Step 7 intermediate results
         if step7_output_dir:
             step7_intermediate_path = step7_output_dir / 'intermediate_results.json'
-            with open(step7_intermediate_path, 'w', encoding='utf-8') as f:
-                json.dump({
-                    "content_analysis": content_analysis,
-                    "markdown_converter_code": markdown_converter_code,
-                    "step": "step7_markdown_converted",
-                    "flow_id": step7_flow_id
-                }, f, indent=2, ensure_ascii=False)
+            _write_json(step7_intermediate_path, {
+                "content_analysis": content_analysis,
+                "markdown_converter_code": markdown_converter_code,
+                "step": "step7_markdown_converted",
+                "flow_id": step7_flow_id
+            })
             logger.info(f"Step 7 intermediate results saved to {step7_intermediate_path}")
         
         # Final code path is from step6 (validated code)
@@ -1658,9 +1919,18 @@ def main():
         dest='resume',
         help='Force restart, ignore checkpoints'
     )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=None,
+        help='Worker processes for Markdown conversion (default: CONVERSION_JOBS setting, 0 = one per CPU core, 1 = serial)'
+    )
     
     args = parser.parse_args()
     
+    if args.jobs is not None:
+        Settings.CONVERSION_JOBS = args.jobs
+    
     # Initialize directories
     Settings.initialize_directories()
     
@@ -1,12 +1,13 @@
 """
 Checkpoint system for saving and resuming processing
 """
-import json
 import logging
 from pathlib import Path
 from typing import Dict, Any, Optional
 from datetime import datetime
 
+from . import json_utils
+
 logger = logging.getLogger(__name__)
 
 
@@ -30,8 +31,9 @@ class CheckpointManager:
         }
         
         try:
-            with open(self.checkpoint_path, 'w', encoding='utf-8') as f:
-                json.dump(checkpoint, f, indent=2, ensure_ascii=False)
+            # Checkpoints hold every earlier step's data and are only read
+            # back by the resume logic, so they are written compactly
+            self.checkpoint_path.write_bytes(json_utils.dumps(checkpoint))
             logger.info(f"Checkpoint saved: {step}")
         except Exception as e:
             logger.error(f"Failed to save checkpoint: {e}")
@@ -42,8 +44,7 @@ class CheckpointManager:
             return None
         
         try:
-            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
-                checkpoint = json.load(f)
+            checkpoint = json_utils.loads(self.checkpoint_path.read_bytes())
             logger.info(f"Checkpoint loaded: {checkpoint.get('step', 'unknown')} from {checkpoint.get('timestamp', 'unknown')}")
             return checkpoint
         except Exception as e:
@@ -68,14 +69,12 @@ class CheckpointManager:
         
         try:
             if isinstance(result, (dict, list)):
-                with open(result_path, 'w', encoding='utf-8') as f:
-                    json.dump(result, f, indent=2, ensure_ascii=False)
+                result_path.write_bytes(json_utils.dumps(result, indent=True))
             elif isinstance(result, str):
                 with open(result_path, 'w', encoding='utf-8') as f:
                     f.write(result)
             else:
-                with open(result_path, 'w', encoding='utf-8') as f:
-                    json.dump({"result": str(result)}, f, indent=2, ensure_ascii=False)
+                result_path.write_bytes(json_utils.dumps({"result": str(result)}, indent=True))
             
             logger.info(f"Step result saved: {result_path}")
             return result_path
@@ -95,8 +94,7 @@ class CheckpointManager:
         
         try:
             if filename.endswith('.json'):
-                with open(result_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return json_utils.loads(result_path.read_bytes())
             else:
                 with open(result_path, 'r', encoding='utf-8') as f:
                     return f.read()
@@ -0,0 +1,249 @@
+"""
+Syntax checks and repairs for LLM-generated Python code
+
+Pure Python with no project imports, so the module can be compiled on its
+own (e.g. with mypyc) if the repair path ever needs to be faster.
+"""
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+
+@lru_cache(maxsize=64)
+def compile_error(code: str) -> Optional[SyntaxError]:
+    """
+    Compile generated code and return its SyntaxError, or None if it compiles
+    
+    Cached by content, so code the LLM regenerates verbatim is not recompiled.
+    """
+    try:
+        compile(code, '<string>', 'exec')
+    except SyntaxError as e:
+        # Drop the traceback so the cache does not keep frames alive
+        return e.with_traceback(None)
+    return None
+
+
+def _block_end(lines: List[str], start: int) -> int:
+    """
+    Index of the last line of the indented block that continues lines[start]
+    (the line before the next non-blank line indented no deeper than it)
+    """
+    indent = len(lines[start]) - len(lines[start].lstrip())
+    end = start
+    for i in range(start + 1, len(lines)):
+        stripped = lines[i].strip()
+        if stripped and len(lines[i]) - len(lines[i].lstrip()) <= indent:
+            break
+        if stripped:
+            end = i
+    return end
+
+
+def close_unterminated_string(code: str, syntax_error: SyntaxError) -> Optional[str]:
+    """
+    Fix an unterminated string literal using the position the compiler reported
+    
+    The SyntaxError points at the start of the string, so the quote style is
+    known exactly; the string is closed at the end of its line or, when the
+    following lines are an indented continuation, at the end of that block
+    (a single-quoted string is then turned into a triple-quoted one). The
+    first candidate that compiles is returned, None if none does.
+    """
+    msg = syntax_error.msg or ''
+    if 'unterminated' not in msg or not syntax_error.lineno or not syntax_error.offset:
+        return None
+    lines = code.split('\n')
+    row = syntax_error.lineno - 1
+    if row >= len(lines):
+        return None
+    line = lines[row]
+    
+    # Skip the string prefix (f, rf, b, ...) to the opening quote
+    pos = syntax_error.offset - 1
+    while pos < len(line) and line[pos] not in '"\'':
+        pos += 1
+    if pos >= len(line):
+        return None
+    
+    end = _block_end(lines, row)
+    if 'triple-quoted' in msg:
+        quote = line[pos] * 3
+        # Close at the end of the continuation block first, then on the opening line
+        candidates = [{end: lines[end].rstrip() + quote}]
+        if end > row:
+            candidates.append({row: line.rstrip() + quote})
+    else:
+        quote = line[pos]
+        candidates = [{row: line.rstrip() + quote}]
+        if end > row:
+            # Continuation lines: the string was meant to be triple-quoted
+            candidates.append({
+                row: line[:pos] + quote * 3 + line[pos + 1:],
+                end: lines[end].rstrip() + quote * 3
+            })
+    
+    for candidate in candidates:
+        fixed_code = '\n'.join(candidate.get(i, text) for i, text in enumerate(lines))
+        if compile_error(fixed_code) is None:
+            return fixed_code
+    return None
+
+
+# Last-resort fixes for f-strings opened with triple quotes and never closed
+_UNCLOSED_TRIPLE_DQ = re.compile(r'(f"""[^"]*?)(\n)(?![^"]*""")', re.MULTILINE | re.DOTALL)
+_UNCLOSED_TRIPLE_SQ = re.compile(r"(f'''[^']*?)(\n)(?![^']*''')", re.MULTILINE | re.DOTALL)
+_F_STRING_START = re.compile(r'f["\']')
+
+
+def _has_closer(lines: List[str], start: int, stop: int, token: str) -> bool:
+    """True if token occurs in lines[start:stop] (one substring search over the window)"""
+    return token in '\n'.join(lines[start:stop])
+
+
+def fix_markdown_converter_syntax(code: str, syntax_error: SyntaxError) -> str:
+    """
+    Attempt to fix common syntax errors in generated markdown converter code
+    
+    Unterminated strings are closed at the position the compiler reports;
+    the line-based heuristics below only run if that does not compile.
+    """
+    fixed_code = close_unterminated_string(code, syntax_error)
+    if fixed_code is not None:
+        return fixed_code
+    
+    lines = code.split('\n')
+    error_line_num = syntax_error.lineno - 1 if syntax_error.lineno and syntax_error.lineno <= len(lines) else len(lines) - 1
+    
+    if error_line_num < len(lines):
+        error_line = lines[error_line_num]
+        
+        # Fix unterminated f-strings
+        if 'f"' in error_line or "f'" in error_line or 'f"""' in error_line or "f'''" in error_line:
+            # Check for triple-quoted f-strings first
+            if 'f"""' in error_line:
+                # Find the start of the f-string
+                f_start = error_line.find('f"""')
+                if f_start != -1:
+                    # Check if it's closed on the same line
+                    remaining = error_line[f_start + 4:]
+                    if '"""' not in remaining:
+                        # Not closed, need to find where it should end
+                        # Look ahead for closing triple quotes
+                        if not _has_closer(lines, error_line_num + 1, error_line_num + 20, '"""'):
+                            # Add closing triple quotes at end of current line or next logical place
+                            # If line ends with newline escape, it's probably a multi-line string
+                            if error_line.rstrip().endswith('\\n') or error_line.rstrip().endswith('\\'):
+                                # Convert to proper multi-line f-string or add closing
+                                # Try to find a good place to close it
+                                if error_line_num + 1 < len(lines):
+                                    next_line = lines[error_line_num + 1]
+                                    # If next line is part of the string content, we need to close after it
+                                    if next_line.strip() and not next_line.strip().startswith('"""'):
+                                        # Look for where the string should end
+                                        # Common pattern: f"""\n{content}\n"""
+                                        # Find the next non-indented line or closing pattern
+                                        for i in range(error_line_num + 1, min(error_line_num + 10, len(lines))):
+                                            if lines[i].strip() and not lines[i].startswith((' ', '\t')):
+                                                # Found next statement, close before it
+                                                lines[i-1] = lines[i-1].rstrip() + '"""'
+                                                break
+                                        else:
+                                            # No clear end, close at end of next line
+                                            if error_line_num + 1 < len(lines):
+                                                lines[error_line_num + 1] = lines[error_line_num + 1].rstrip() + '"""'
+                                            else:
+                                                lines[error_line_num] = error_line.rstrip() + '"""'
+                                    else:
+                                        # Already has closing, might be a different issue
+                                        pass
+                                else:
+                                    lines[error_line_num] = error_line.rstrip() + '"""'
+                            else:
+                                # Simple case, just add closing
+                                lines[error_line_num] = error_line.rstrip() + '"""'
+            
+            elif "f'''" in error_line:
+                # Similar logic for triple single quotes
+                f_start = error_line.find("f'''")
+                if f_start != -1:
+                    remaining = error_line[f_start + 4:]
+                    if "'''" not in remaining:
+                        if not _has_closer(lines, error_line_num + 1, error_line_num + 20, "'''"):
+                            if error_line.rstrip().endswith('\\n') or error_line.rstrip().endswith('\\'):
+                                if error_line_num + 1 < len(lines):
+                                    next_line = lines[error_line_num + 1]
+                                    if next_line.strip() and not next_line.strip().startswith("'''"):
+                                        for i in range(error_line_num + 1, min(error_line_num + 10, len(lines))):
+                                            if lines[i].strip() and not lines[i].startswith((' ', '\t')):
+                                                lines[i-1] = lines[i-1].rstrip() + "'''"
+                                                break
+                                        else:
+                                            if error_line_num + 1 < len(lines):
+                                                lines[error_line_num + 1] = lines[error_line_num + 1].rstrip() + "'''"
+                                            else:
+                                                lines[error_line_num] = error_line.rstrip() + "'''"
+                                else:
+                                    lines[error_line_num] = error_line.rstrip() + "'''"
+                            else:
+                                lines[error_line_num] = error_line.rstrip() + "'''"
+            
+            # Fix regular f-strings (f" or f')
+            elif 'f"' in error_line or "f'" in error_line:
+                # Check if f-string is not properly closed
+                matches = list(_F_STRING_START.finditer(error_line))
+                
+                if matches:
+                    last_match = matches[-1]
+                    quote_char = error_line[last_match.end() - 1]
+                    remaining = error_line[last_match.end():]
+                    
+                    # Count quotes in remaining part
+                    quote_count = remaining.count(quote_char)
+                    # Count escaped quotes
+                    escaped_quotes = remaining.count('\\' + quote_char)
+                    # Actual unescaped quotes
+                    unescaped_quotes = quote_count - escaped_quotes
+                    
+                    # If odd number of unescaped quotes, string is not closed
+                    if unescaped_quotes % 2 == 0:  # Even means not closed (opening quote not counted)
+                        # Check if line ends without closing quote
+                        if not error_line.rstrip().endswith(quote_char):
+                            # Check if next line might be continuation
+                            if error_line_num + 1 < len(lines):
+                                next_line = lines[error_line_num + 1]
+                                # If next line is indented and has content, might be part of the string
+                                if next_line.strip() and next_line.startswith((' ', '\t')):
+                                    # This is likely a multi-line string that should use triple quotes
+                                    # Convert to triple-quoted f-string
+                                    # Find the opening f"
+                                    f_pos = error_line.find('f"')
+                                    if f_pos != -1:
+                                        # Replace f" with f""" and find where to close
+                                        lines[error_line_num] = error_line[:f_pos+1] + '"""' + error_line[f_pos+2:]
+                                        # Find where to close (next non-indented line or end of block)
+                                        for i in range(error_line_num + 1, min(error_line_num + 15, len(lines))):
+                                            if lines[i].strip() and not lines[i].startswith((' ', '\t')):
+                                                # Found next statement, close before it
+                                                lines[i-1] = lines[i-1].rstrip() + '"""'
+                                                break
+                                        else:
+                                            # No clear end, close at end of next line
+                                            if error_line_num + 1 < len(lines):
+                                                lines[error_line_num + 1] = lines[error_line_num + 1].rstrip() + '"""'
+                                else:
+                                    # Add closing quote
+                                    lines[error_line_num] = error_line.rstrip() + quote_char
+                            else:
+                                # Add closing quote at end
+                                lines[error_line_num] = error_line.rstrip() + quote_char
+    
+    fixed_code = '\n'.join(lines)
+    
+    # Additional fixes for common issues
+    # Fix incomplete triple-quoted strings in f-strings (more aggressive)
+    # Look for patterns like f"""\n without closing
+    fixed_code = _UNCLOSED_TRIPLE_DQ.sub(r'\1\2"""', fixed_code)
+    fixed_code = _UNCLOSED_TRIPLE_SQ.sub(r"\1\2'''", fixed_code)
+    
+    return fixed_code
@@ -1,12 +1,31 @@
 import os
+import re
+import codecs
 import logging
-from typing import List, Dict, Optional
+from typing import Dict, Iterator, List, Optional
 from pathlib import Path
 from lxml import etree
 from bs4 import BeautifulSoup
 
 logger = logging.getLogger(__name__)
 
+# Try to import charset_normalizer for encoding detection (installed with requests)
+try:
+    from charset_normalizer import from_bytes as detect_charset
+    CHARSET_NORMALIZER_AVAILABLE = True
+except ImportError:
+    CHARSET_NORMALIZER_AVAILABLE = False
+
+# Bytes searched for a <meta charset> declaration / sampled for detection
+CHARSET_SNIFF_BYTES = 4096
+CHARSET_DETECT_BYTES = 65536
+
+_META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+
+# Declared encodings decoded with their superset (pages labelled gb2312
+# routinely contain GBK/GB18030 characters)
+_ENCODING_SUPERSETS = {'gb2312': 'gb18030', 'gbk': 'gb18030'}
+
 
 class HTMLParser:
     """
@@ -53,33 +72,96 @@ class HTMLParser:
             logger.error(f"Error extracting text: {e}")
             return ""
     
+    @staticmethod
+    def detect_encoding(data: bytes) -> str:
+        """
+        Guess the encoding of HTML bytes that are not valid UTF-8
+        
+        A <meta charset> declaration in the first CHARSET_SNIFF_BYTES wins;
+        otherwise charset_normalizer (if installed) looks at a sample.
+        Falls back to utf-8.
+        """
+        match = _META_CHARSET.search(data, 0, CHARSET_SNIFF_BYTES)
+        if match:
+            declared = match.group(1).decode('ascii', 'ignore').lower()
+            declared = _ENCODING_SUPERSETS.get(declared, declared)
+            try:
+                return codecs.lookup(declared).name
+            except LookupError:
+                logger.debug(f"Unknown declared charset: {declared}")
+        
+        if CHARSET_NORMALIZER_AVAILABLE:
+            best = detect_charset(data[:CHARSET_DETECT_BYTES]).best()
+            if best is not None:
+                return best.encoding
+        return 'utf-8'
+    
+    @staticmethod
+    def decode_html(data: bytes) -> str:
+        """
+        Decode HTML file bytes, translating newlines like text-mode open()
+        
+        UTF-8 is tried first; other encodings are detected once per file
+        and decoded with errors replaced instead of failing the file.
+        """
+        try:
+            text = data.decode('utf-8')
+        except UnicodeDecodeError:
+            encoding = HTMLParser.detect_encoding(data)
+            logger.debug(f"HTML is not UTF-8, decoding as {encoding}")
+            text = data.decode(encoding, errors='replace')
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text
+    
+    @staticmethod
+    def read_html_file(file_path: str) -> str:
+        """
+        Read an HTML file as text (see decode_html)
+        """
+        with open(file_path, 'rb') as f:
+            return HTMLParser.decode_html(f.read())
+    
     @staticmethod
     def load_html_files(directory: str) -> List[Dict[str, str]]:
         """
         Load all HTML files from a directory
         """
         html_files = []
-        dir_path = Path(directory)
         
-        if not dir_path.exists():
-            logger.error(f"Directory does not exist: {directory}")
-            return html_files
-        
-        for html_file in dir_path.glob('*.html'):
+        for html_file in HTMLParser.iter_html_files(directory):
             try:
-                with open(html_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                html_files.append({
-                    'path': str(html_file),
-                    'name': html_file.name,
-                    'content': content
-                })
+                html_file['content'] = HTMLParser.read_html_file(html_file['path'])
+                html_files.append(html_file)
             except Exception as e:
-                logger.error(f"Error loading {html_file}: {e}")
+                logger.error(f"Error loading {html_file['path']}: {e}")
         
         logger.info(f"Loaded {len(html_files)} HTML files from {directory}")
         return html_files
     
+    @staticmethod
+    def iter_html_files(directory: str) -> Iterator[Dict[str, str]]:
+        """
+        Lazily yield {'path', 'name'} for each HTML file in a directory,
+        without reading the files
+        """
+        if not os.path.isdir(directory):
+            logger.error(f"Directory does not exist: {directory}")
+            return
+        
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.endswith('.html') and entry.is_file():
+                    yield {'path': entry.path, 'name': entry.name}
+    
+    @staticmethod
+    def list_html_files(directory: str) -> List[Dict[str, str]]:
+        """
+        List HTML files in a directory without reading them
+        (same entries as load_html_files, minus 'content')
+        """
+        return list(HTMLParser.iter_html_files(directory))
+    
     @staticmethod
     def get_body_content(html_content: str) -> str:
         """
@@ -0,0 +1,45 @@
+"""
+Shared JSON serialization helpers
+
+orjson is used when installed; its JSONDecodeError subclasses
+json.JSONDecodeError, so callers can keep catching the stdlib exception.
+"""
+import json
+from typing import Any, Union
+
+# Try to import orjson for faster serialization, fallback to json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def dumps(obj: Any, indent: bool = False, sort_keys: bool = False) -> bytes:
+    """
+    Serialize obj as UTF-8 JSON bytes, keeping non-ASCII characters
+
+    Output is compact on one line unless indent is set (2 spaces).
+    Data orjson cannot encode (e.g. integers wider than 64 bits) falls
+    back to the stdlib encoder.
+    """
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, option=option)
+        except TypeError:
+            pass
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False, sort_keys=sort_keys).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, sort_keys=sort_keys, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data: Union[str, bytes, memoryview]) -> Any:
+    """Parse JSON text (str or bytes; orjson also accepts memoryview)"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
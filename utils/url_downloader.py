@@ -9,6 +9,9 @@ import time
 
 logger = logging.getLogger(__name__)
 
+# Characters not allowed in saved HTML filenames
+_UNSAFE_FILENAME_CHARS = re.compile(r'[^\w\-_\.]')
+
 
 class URLDownloader:
     """
@@ -172,7 +175,7 @@ class URLDownloader:
                     filename = f"{parsed.netloc.replace('.', '_')}_{i:03d}"
                 
                 # Clean filename - remove invalid characters
-                filename = re.sub(r'[^\w\-_\.]', '_', filename)
+                filename = _UNSAFE_FILENAME_CHARS.sub('_', filename)
                 
                 # If filename is still empty or too short, use index with number
                 if not filename or len(filename) < 3:
@@ -184,10 +187,9 @@ class URLDownloader:
                 
                 # Check if file already exists, add index if needed
                 if temp_dir:
-                    base_filename = filename
+                    name_part = filename.removesuffix('.html')
                     counter = 1
                     while (temp_dir / filename).exists():
-                        name_part = base_filename.rsplit('.html', 1)[0]
                         filename = f"{name_part}_{counter}.html"
                         counter += 1
                 
@@ -1,15 +1,21 @@
 import base64
+import json
 import logging
+import re
 from typing import Dict, Any, Optional
 from pathlib import Path
 from openai import OpenAI
 from config import Settings
+from config.http import get_http_client
 from playwright.sync_api import sync_playwright
 from PIL import Image
 import io
 
 logger = logging.getLogger(__name__)
 
+# Outermost {...} span of a vision model response
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+
 
 class VisualAnalyzer:
     """
@@ -19,7 +25,8 @@ class VisualAnalyzer:
     def __init__(self):
         self.client = OpenAI(
             api_key=Settings.VISION_API_KEY,
-            base_url=Settings.VISION_BASE_URL
+            base_url=Settings.VISION_BASE_URL,
+            http_client=get_http_client()
         )
         self.model = Settings.VISION_MODEL
     
@@ -126,9 +133,7 @@ class VisualAnalyzer:
                 return {"error": f"Unexpected response format: {type(response)}"}
             
             # Try to parse as JSON
-            import json
-            import re
-            json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
+            json_match = _JSON_OBJECT_RE.search(result_text)
             if json_match:
                 try:
                     return json.loads(json_match.group(0))